@@ -1,7 +1,12 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ORDER_VAR
+from django.core.exceptions import ValidationError
 from django.urls import path
 from django.shortcuts import redirect
-from .models import CustomUser, Category, DesignRequest
+from django.template.response import TemplateResponse
+from django.db.models import Case, Count, IntegerField, Value, When
+from .models import CustomUser, Category, DesignRequest, validate_image_file
+from . import deletion, export, queue, search
 
 
 
@@ -12,16 +17,45 @@ class CustomUserAdmin(admin.ModelAdmin):
     readonly_fields = ('username',)  # логин нельзя менять через админку
 
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+    list_display = ('name', 'deleting')
     search_fields = ('name',)
+    readonly_fields = ('deleting', 'deletion_total')
 
-    # При удалении категории — удалятся и заявки (благодаря CASCADE)
-    # Ничего дополнительно не нужно — Django сам покажет предупреждение
+    # При удалении категории удаляются и заявки (CASCADE), но не одной
+    # транзакцией: категория помечается и чистится в фоне (catalog.deletion)
+    def get_deleted_objects(self, objs, request):
+        # Стандартная страница подтверждения собирает все связанные заявки
+        # в память — показываем только их количество
+        objs = list(objs)
+        counts = dict(
+            DesignRequest.objects.filter(category__in=objs).order_by()
+            .values_list('category_id').annotate(n=Count('pk'))
+        )
+        deleted_objects = [
+            f'{obj} (заявок: {counts.get(obj.pk, 0)})' for obj in objs
+        ]
+        model_count = {
+            Category._meta.verbose_name_plural: len(objs),
+            DesignRequest._meta.verbose_name_plural: sum(counts.values()),
+        }
+        perms_needed = set()
+        if counts and not request.user.has_perm('catalog.delete_designrequest'):
+            perms_needed.add(DesignRequest._meta.verbose_name)
+        return deleted_objects, model_count, perms_needed, []
+
+    def delete_model(self, request, obj):
+        deletion.mark_for_deletion([obj])
+
+    def delete_queryset(self, request, queryset):
+        deletion.mark_for_deletion(queryset)
 
 class DesignRequestAdmin(admin.ModelAdmin):
-    list_display = ('title', 'client', 'category', 'status', 'created_at')
+    list_display = ('title', 'client', 'category', 'status', 'assignee', 'created_at')
     list_filter = ('status', 'category', 'created_at')
+    list_select_related = ('client', 'category', 'assignee')
+    search_fields = ('title', 'description', 'admin_comment')
     readonly_fields = ('created_at', 'updated_at')
+    actions = ('take_to_work_selected', 'complete_selected', 'export_csv', 'export_xlsx')
     fieldsets = (
         (None, {
             'fields': ('title', 'description', 'client', 'category', 'status')
@@ -30,7 +64,7 @@ class DesignRequestAdmin(admin.ModelAdmin):
             'fields': ('plan_image', 'design_image')
         }),
         ('Админка', {
-            'fields': ('admin_comment',),
+            'fields': ('admin_comment', 'assignee'),
             'classes': ('collapse',)
         }),
         ('Даты', {
@@ -39,6 +73,75 @@ class DesignRequestAdmin(admin.ModelAdmin):
         }),
     )
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Удаляемая категория исчезнет вместе с заявками — новые в неё не переносим
+        if db_field.name == 'category':
+            kwargs['queryset'] = Category.objects.filter(deleting=False)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск через FTS5 вместо LIKE '%...%' по трём текстовым полям
+        ids = search.matching_ids(search_term)
+        if ids is None:
+            return super().get_search_results(request, queryset, search_term)
+        if not ids:
+            return queryset.none(), False
+        queryset = queryset.filter(pk__in=ids)
+        if ORDER_VAR not in request.GET:
+            # Пока не выбрана сортировка по колонке — лучшие по bm25 первыми
+            rank = Case(
+                *(When(pk=pk, then=Value(position)) for position, pk in enumerate(ids)),
+                output_field=IntegerField(),
+            )
+            queryset = queryset.order_by(rank, *queryset.query.order_by)
+        return queryset, False
+
+    def _confirm_transition(self, request, queryset, action, title):
+        return TemplateResponse(request, 'admin/catalog/designrequest/bulk_transition.html', {
+            **self.admin_site.each_context(request),
+            'title': title,
+            'action': action,
+            'queryset': queryset,
+            'opts': self.model._meta,
+            'action_checkbox_name': admin.helpers.ACTION_CHECKBOX_NAME,
+        })
+
+    @admin.action(description='Принять выбранные заявки в работу', permissions=['change'])
+    def take_to_work_selected(self, request, queryset):
+        comment = request.POST.get('comment', '').strip()
+        if 'apply' not in request.POST:
+            return self._confirm_transition(request, queryset, 'take_to_work_selected', 'Принять в работу')
+        if not comment:
+            self.message_user(request, 'Комментарий обязателен.', messages.ERROR)
+            return None
+        # Один UPDATE на всю выборку; заявки не в статусе 'new' и взятые
+        # из очереди другими дизайнерами пропускаются
+        updated = queryset.filter(queue.claimable_by(request.user)).take_to_work(comment, request.user)
+        self.message_user(request, f'Принято в работу заявок: {updated}.', messages.SUCCESS)
+
+    @admin.action(description='Выполнить выбранные заявки', permissions=['change'])
+    def complete_selected(self, request, queryset):
+        if 'apply' not in request.POST:
+            return self._confirm_transition(request, queryset, 'complete_selected', 'Выполнить заявки')
+        design_image = request.FILES.get('design_image')
+        try:
+            if not design_image:
+                raise ValidationError('Изображение дизайна обязательно.')
+            validate_image_file(design_image)
+        except ValidationError as exc:
+            self.message_user(request, exc.messages[0], messages.ERROR)
+            return None
+        updated = queryset.filter(queue.claimable_by(request.user)).complete(design_image)
+        self.message_user(request, f'Выполнено заявок: {updated}.', messages.SUCCESS)
+
+    @admin.action(description='Выгрузить выбранные заявки в CSV', permissions=['view'])
+    def export_csv(self, request, queryset):
+        return export.export_response(request, queryset, 'csv')
+
+    @admin.action(description='Выгрузить выбранные заявки в XLSX', permissions=['view'])
+    def export_xlsx(self, request, queryset):
+        return export.export_response(request, queryset, 'xlsx')
+
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(DesignRequest, DesignRequestAdmin)
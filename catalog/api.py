@@ -0,0 +1,369 @@
+"""
+JSON API для интеграций (CRM, программа дизайнеров): /api/v1/.
+
+- GET  requests/                 — заявки, keyset-пагинация (?cursor=, ?limit=),
+                                   ?status=, ?fields=id,title,client,category
+- GET  requests/<id>/            — одна заявка (в том числе из архива)
+- POST requests/batch/           — {"ids": [...], "fields": [...]} — много заявок одним запросом
+- POST requests/claim/          — {"category": <id>} — взять следующую новую заявку
+                                   из очереди (catalog.queue); {"result": null} — свободных нет
+- POST requests/transitions/     — {"operations": [{"action": "take_to_work", "ids": [...],
+                                   "comment": "..."}, {"action": "complete", "ids": [...],
+                                   "design_image": "<имя файла>"}]}; с файлами —
+                                   multipart, JSON в поле payload
+- GET  categories/, POST categories/ — {"name": "..."}
+
+Клиент и категория встраиваются в заявку тем же SELECT (JOIN через
+values()), выбираются только запрошенные в fields столбцы. Кодировщик —
+orjson, если установлен. Большие страницы отдаются потоком по
+API_STREAM_CHUNK заявок, без сборки всего JSON в памяти.
+
+Аутентификация: сессия (для изменений — с CSRF-токеном) или заголовок
+Authorization: Bearer <токен> из API_TOKENS ({токен: имя пользователя}).
+Клиенты видят только свои заявки, изменения доступны администраторам.
+"""
+import functools
+import hmac
+import json
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+
+from .db import read_only_database
+from .forms import CategoryForm
+from .models import ArchivedRequest, Category, DesignRequest, validate_image_file
+from .pagination import decode_cursor, paginate_keyset
+from . import queue
+
+try:
+    import orjson
+except ImportError:  # orjson не обязателен: без него стандартный json
+    orjson = None
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+MAX_BATCH = 500
+
+# Поле ответа → столбцы values(); клиент и категория приходят JOIN-ом
+REQUEST_FIELDS = {
+    'id': ('id',),
+    'title': ('title',),
+    'description': ('description',),
+    'status': ('status',),
+    'admin_comment': ('admin_comment',),
+    'created_at': ('created_at',),
+    'updated_at': ('updated_at',),
+    'taken_at': ('taken_at',),
+    'completed_at': ('completed_at',),
+    'claimed_until': ('claimed_until',),
+    'plan_image': ('plan_image',),
+    'design_image': ('design_image',),
+    'client': ('client__id', 'client__username', 'client__full_name'),
+    'category': ('category__id', 'category__name'),
+    'assignee': ('assignee__id', 'assignee__username', 'assignee__full_name'),
+}
+TRANSITIONS = ('take_to_work', 'complete')
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+def _token_user(request):
+    authorization = request.headers.get('Authorization', '')
+    if not authorization.startswith('Bearer '):
+        return None
+    presented = authorization[len('Bearer '):]
+    username = None
+    # Сравниваем со всеми токенами, чтобы время ответа не выдавало совпадение
+    for token, name in getattr(settings, 'API_TOKENS', {}).items():
+        if hmac.compare_digest(presented, token):
+            username = name
+    if username is None:
+        raise ApiError('Неверный токен.', 401)
+    user = get_user_model().objects.filter(username=username, is_active=True).first()
+    if user is None:
+        raise ApiError('Неверный токен.', 401)
+    return user
+
+
+def api_view(methods, staff_only=False):
+    """
+    Обёртка представления API: методы, аутентификация, ошибки в JSON.
+    Представление получает пользователя вторым аргументом.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise ApiError('Метод не поддерживается.', 405)
+                user = _token_user(request)
+                if user is None:
+                    user = request.user
+                    if not user.is_authenticated:
+                        raise ApiError('Требуется аутентификация.', 401)
+                    if request.method not in ('GET', 'HEAD'):
+                        # Сессия браузера: изменения только с CSRF-токеном
+                        if CsrfViewMiddleware(lambda r: None).process_view(request, None, (), {}) is not None:
+                            raise ApiError('Нет CSRF-токена.', 403)
+                if staff_only and not user.is_staff:
+                    raise ApiError('Доступ только для администраторов.', 403)
+                return view(request, user, *args, **kwargs)
+            except ApiError as exc:
+                return json_response({'error': str(exc)}, exc.status)
+        return wrapper
+    return decorator
+
+
+def _body(request):
+    if request.content_type == 'multipart/form-data':
+        raw = request.POST.get('payload', '{}')
+    else:
+        raw = request.body or b'{}'
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        raise ApiError('Тело запроса — не JSON.')
+    if not isinstance(data, dict):
+        raise ApiError('Ожидается JSON-объект.')
+    return data
+
+
+def _fields(requested):
+    if not requested:
+        return list(REQUEST_FIELDS)
+    if isinstance(requested, str):
+        requested = [name.strip() for name in requested.split(',') if name.strip()]
+    if not isinstance(requested, list):
+        raise ApiError('fields — список полей.')
+    unknown = [str(name) for name in requested if name not in REQUEST_FIELDS]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}.')
+    return requested
+
+
+def _columns(fields):
+    # id и created_at нужны для курсора, даже если их не запросили
+    columns = {'id', 'created_at'}
+    for name in fields:
+        columns.update(REQUEST_FIELDS[name])
+    return sorted(columns)
+
+
+def _image_url(pk, field, name):
+    return reverse('request-image', args=[pk, field]) if name else None
+
+
+def serialize_request(row, fields):
+    """Строка values() → JSON-объект с запрошенными полями"""
+    data = {}
+    for name in fields:
+        if name == 'client':
+            data['client'] = {
+                'id': row['client__id'],
+                'username': row['client__username'],
+                'full_name': row['client__full_name'],
+            }
+        elif name == 'category':
+            data['category'] = (
+                {'id': row['category__id'], 'name': row['category__name']}
+                if row['category__id'] is not None else None
+            )
+        elif name == 'assignee':
+            data['assignee'] = (
+                {
+                    'id': row['assignee__id'],
+                    'username': row['assignee__username'],
+                    'full_name': row['assignee__full_name'],
+                }
+                if row['assignee__id'] is not None else None
+            )
+        elif name in ('plan_image', 'design_image'):
+            data[name] = _image_url(row['id'], name, row[name])
+        else:
+            data[name] = row[name]
+    return data
+
+
+def _visible(queryset, user):
+    return queryset if user.is_staff else queryset.filter(client=user)
+
+
+def _stream(rows, fields, tail):
+    """{"results": [...], ...tail} по частям: память — на одну пачку заявок"""
+    chunk = getattr(settings, 'API_STREAM_CHUNK', 100)
+    yield b'{"results":['
+    for start in range(0, len(rows), chunk):
+        part = b','.join(dumps(serialize_request(row, fields)) for row in rows[start:start + chunk])
+        yield (b',' if start else b'') + part
+    yield b']' + (b',' + dumps(tail)[1:] if tail else b'}')
+
+
+def _results_response(rows, fields, **tail):
+    if len(rows) > getattr(settings, 'API_STREAM_CHUNK', 100):
+        return StreamingHttpResponse(_stream(rows, fields, tail), content_type='application/json')
+    return json_response({'results': [serialize_request(row, fields) for row in rows], **tail})
+
+
+@api_view(['GET'])
+@read_only_database
+def request_list(request, user):
+    fields = _fields(request.GET.get('fields'))
+    try:
+        limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        raise ApiError('limit должен быть числом.')
+    cursor = request.GET.get('cursor')
+    if cursor and decode_cursor(cursor) is None:
+        raise ApiError('Неверный курсор.')
+    requests = _visible(DesignRequest.objects.all(), user)
+    status = request.GET.get('status')
+    if status:
+        requests = requests.filter(status=status)
+    # Страница целиком читается в представлении — в реплике чтения
+    page = paginate_keyset(requests.values(*_columns(fields)), cursor, max(limit, 1))
+    return _results_response(page.object_list, fields, next=page.next_cursor, previous=page.previous_cursor)
+
+
+@api_view(['GET'])
+@read_only_database
+def request_detail(request, user, pk):
+    fields = _fields(request.GET.get('fields'))
+    for model in (DesignRequest, ArchivedRequest):
+        row = _visible(model.objects.filter(pk=pk), user).values(*_columns(fields)).first()
+        if row is not None:
+            return json_response(serialize_request(row, fields))
+    raise ApiError('Заявка не найдена.', 404)
+
+
+def _ids(data):
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids:
+        raise ApiError('Нужен непустой список ids.')
+    if len(ids) > MAX_BATCH:
+        raise ApiError(f'Не больше {MAX_BATCH} заявок за раз.')
+    try:
+        return [uuid.UUID(str(pk)) for pk in ids]
+    except ValueError:
+        raise ApiError('Неверный id заявки.')
+
+
+@api_view(['POST'])
+@read_only_database
+def request_batch(request, user):
+    data = _body(request)
+    ids = _ids(data)
+    fields = _fields(data.get('fields'))
+    columns = _columns(fields)
+    found = {}
+    # Один запрос к живым заявкам, второй — к архиву за недостающими
+    for model in (DesignRequest, ArchivedRequest):
+        missing = [pk for pk in ids if pk not in found]
+        if not missing:
+            break
+        for row in _visible(model.objects.filter(pk__in=missing), user).values(*columns):
+            found[row['id']] = row
+    rows = [found[pk] for pk in dict.fromkeys(ids) if pk in found]
+    return _results_response(rows, fields, missing=[pk for pk in dict.fromkeys(ids) if pk not in found])
+
+
+@api_view(['POST'], staff_only=True)
+def request_claim(request, user):
+    data = _body(request)
+    category = data.get('category')
+    if category is not None and (isinstance(category, bool) or not isinstance(category, int)):
+        raise ApiError('category — id категории.')
+    fields = _fields(data.get('fields'))
+    claimed = queue.claim_next(user, category)
+    if claimed is None:
+        return json_response({'result': None})
+    row = DesignRequest.objects.filter(pk=claimed.pk).values(*_columns(fields)).first()
+    return json_response({'result': serialize_request(row, fields)})
+
+
+def _operations(request, data):
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        raise ApiError('Нужен непустой список operations.')
+    parsed = []
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('action') not in TRANSITIONS:
+            raise ApiError(f'action — одно из: {", ".join(TRANSITIONS)}.')
+        ids = _ids(operation)
+        if operation['action'] == 'take_to_work':
+            comment = str(operation.get('comment', '')).strip()
+            if not comment:
+                raise ApiError('Комментарий обязателен.')
+            parsed.append(('take_to_work', ids, comment))
+        else:
+            design_image = request.FILES.get(str(operation.get('design_image', '')))
+            if design_image is None:
+                raise ApiError('Изображение дизайна обязательно (файл multipart).')
+            try:
+                validate_image_file(design_image)
+            except ValidationError as exc:
+                raise ApiError(exc.messages[0])
+            parsed.append(('complete', ids, design_image))
+    return parsed
+
+
+@api_view(['POST'], staff_only=True)
+def request_transitions(request, user):
+    """Все операции — в одной транзакции; ответ — какие заявки перешли"""
+    operations = _operations(request, _body(request))
+    results = []
+    with transaction.atomic():
+        for action, ids, argument in operations:
+            eligible = ('new',) if action == 'take_to_work' else ('new', 'in_progress')
+            # Заявки, взятые из очереди другими дизайнерами, пропускаются
+            selected = DesignRequest.objects.filter(queue.claimable_by(user), pk__in=ids)
+            # Строки блокируются до конца транзакции: между чтением статусов и
+            # UPDATE их не изменит другой администратор, и отчёт совпадёт с UPDATE
+            before = dict(selected.select_for_update().values_list('pk', 'status'))
+            if action == 'take_to_work':
+                updated = selected.take_to_work(argument, user)
+            else:
+                updated = selected.complete(argument)
+            results.append({
+                'action': action,
+                'updated': updated,
+                'applied': [pk for pk in ids if before.get(pk) in eligible],
+                'skipped': [pk for pk in ids if before.get(pk) not in eligible],
+            })
+    return json_response({'results': results})
+
+
+@api_view(['GET', 'POST'])
+def category_list(request, user):
+    if request.method == 'POST':
+        if not user.is_staff:
+            raise ApiError('Доступ только для администраторов.', 403)
+        form = CategoryForm(_body(request))
+        if not form.is_valid():
+            return json_response({'error': 'Неверные данные.', 'fields': form.errors.get_json_data()}, 400)
+        category = form.save()
+        return json_response({'id': category.pk, 'name': category.name}, 201)
+    categories = Category.objects.filter(deleting=False).order_by('name').values('id', 'name')
+    return json_response({'results': list(categories)})
@@ -0,0 +1,158 @@
+"""
+Архив выполненных заявок.
+
+DesignRequest только растёт, а старые выполненные заявки нужны редко.
+archive_requests переносит выполненные раньше cutoff заявки в
+ArchivedRequest пачками по одной транзакции: строка архива создаётся и
+живая удаляется вместе. Фильтры по статусу, счётчики, поиск и списки
+администратора видят только живые заявки; request_detail, request_image
+и архив в «Моих заявках» ищут по тому же id в архиве (find_request).
+
+С cold=True файлы заявок копируются в холодное хранилище
+(STORAGES['request_images_cold']) — со сжатием gzip, если оно уменьшает
+файл хотя бы на 10% (BMP; JPEG и PNG уже сжаты), — а ссылки на файлы в
+горячем хранилище снимаются: файл без других ссылок удаляется вместе с
+превью. Файлы холодного хранилища могут быть общими для нескольких
+архивных заявок и ссылок не считают; лишние собирает gc_media. Файлы
+копируются до транзакции пачки; заявка, файла которой нет в горячем
+хранилище, остаётся живой и попадает в лог.
+"""
+import gzip
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import transaction
+from django.db.models import Q
+
+from . import storage as blobs
+from .models import ArchivedRequest, DesignRequest
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FIELDS = ('plan_image', 'design_image')
+COMPRESSED_SUFFIX = '.gz'
+
+
+def cold_storage():
+    return storages['request_images_cold']
+
+
+def find_request(pk, queryset=None):
+    """Живая заявка или, если её уже перенесли, архивная; None — нет нигде"""
+    queryset = DesignRequest.objects.select_related('category') if queryset is None else queryset
+    design_request = queryset.filter(pk=pk).first()
+    if design_request is None:
+        design_request = ArchivedRequest.objects.select_related('category').filter(pk=pk).first()
+    return design_request
+
+
+async def afind_request(pk):
+    """Асинхронный вариант find_request"""
+    design_request = await DesignRequest.objects.select_related('category').filter(pk=pk).afirst()
+    if design_request is None:
+        design_request = await ArchivedRequest.objects.select_related('category').filter(pk=pk).afirst()
+    return design_request
+
+
+def freeze(name):
+    """Копия файла горячего хранилища в холодном; возвращает имя копии"""
+    cold = cold_storage()
+    for candidate in (name + COMPRESSED_SUFFIX, name):
+        if cold.exists(candidate):
+            return candidate  # адресация по содержимому: копия уже есть
+    with DesignRequest._meta.get_field('plan_image').storage.open(name) as f:
+        data = f.read()
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data) * 0.9:
+        return cold.save(name + COMPRESSED_SUFFIX, ContentFile(compressed))
+    return cold.save(name, ContentFile(data))
+
+
+def open_cold(name):
+    """Файл холодного хранилища для чтения, сжатый — уже распакованный"""
+    f = cold_storage().open(name)
+    if name.endswith(COMPRESSED_SUFFIX):
+        return gzip.GzipFile(fileobj=f)
+    return f
+
+
+def archivable(cutoff):
+    # У заявок, выполненных до появления completed_at, — время последнего изменения
+    return DesignRequest.objects.filter(status='completed').filter(
+        Q(completed_at__lt=cutoff) | Q(completed_at__isnull=True, updated_at__lt=cutoff)
+    )
+
+
+def _archived_copy(design_request, names, cold):
+    return ArchivedRequest(
+        id=design_request.pk,
+        title=design_request.title,
+        description=design_request.description,
+        client_id=design_request.client_id,
+        category_id=design_request.category_id,
+        category_name=design_request.category.name,
+        status=design_request.status,
+        plan_image=names['plan_image'],
+        design_image=names['design_image'] or None,
+        admin_comment=design_request.admin_comment,
+        created_at=design_request.created_at,
+        updated_at=design_request.updated_at,
+        taken_at=design_request.taken_at,
+        completed_at=design_request.completed_at,
+        cold=cold,
+    )
+
+
+def _freeze_files(rows, frozen, missing):
+    for row in rows:
+        for name in row:
+            if not name or name in frozen or name in missing:
+                continue
+            try:
+                frozen[name] = freeze(name)
+            except FileNotFoundError:
+                logger.warning('Файла %s нет в горячем хранилище — заявки с ним остаются живыми', name)
+                missing.add(name)
+
+
+def archive_requests(cutoff, batch_size=500, cold=False, progress=None):
+    """Перенести в архив выполненные до cutoff заявки; возвращает их число"""
+    archived = 0
+    skipped = set()
+    frozen, missing = {}, set()
+    while True:
+        ids = list(
+            archivable(cutoff).exclude(pk__in=skipped).order_by().values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        if cold:
+            # Копирование файлов — до транзакции, чтобы не держать блокировку записи
+            _freeze_files(DesignRequest.objects.filter(pk__in=ids).values_list(*IMAGE_FIELDS), frozen, missing)
+        with transaction.atomic():
+            # Заново и с условием: заявку могли изменить, пока копировались файлы
+            rows = list(archivable(cutoff).filter(pk__in=ids).select_related('category'))
+            copies = []
+            for design_request in rows:
+                names = design_request.image_names()
+                if cold:
+                    if any(name in missing for name in names.values()):
+                        skipped.add(design_request.pk)
+                        continue
+                    if any(name and name not in frozen for name in names.values()):
+                        # Файл заменили после копирования — скопируем со следующей пачкой
+                        continue
+                    names = {field: frozen[name] if name else '' for field, name in names.items()}
+                else:
+                    # Архивная строка перенимает ссылки удаляемой живой
+                    for name in names.values():
+                        blobs.retain(name)
+                copies.append(_archived_copy(design_request, names, cold))
+            ArchivedRequest.objects.bulk_create(copies)
+            # Сигналы удаления обновят счётчики, сводки и ссылки на файлы
+            DesignRequest.objects.filter(pk__in=[copy.pk for copy in copies]).delete()
+        archived += len(copies)
+        if progress is not None:
+            progress(archived)
+    return archived
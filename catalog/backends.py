@@ -0,0 +1,51 @@
+"""
+Бэкенд аутентификации с кэшированием пользователя.
+
+AuthenticationMiddleware на каждом запросе загружает пользователя по id
+из сессии. CachedModelBackend берёт его из кэша; запись сбрасывается при
+сохранении и удалении CustomUser (смена пароля, is_staff, last_login) —
+см. catalog.signals. Изменения через QuerySet.update() сигналов не
+вызывают, поэтому у записи есть срок жизни USER_CACHE_TIMEOUT.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+USER_CACHE_KEY = 'catalog:user:{}'
+
+
+def user_cache_key(user_id):
+    return USER_CACHE_KEY.format(user_id)
+
+
+def user_cache_timeout():
+    return getattr(settings, 'USER_CACHE_TIMEOUT', 300)
+
+
+def invalidate_user(user_id):
+    """Сбросить кэш пользователя после коммита транзакции"""
+    key = user_cache_key(user_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, user_cache_timeout())
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is None:
+                return None
+            await cache.aset(key, user, user_cache_timeout())
+        return user if self.user_can_authenticate(user) else None
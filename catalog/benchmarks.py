@@ -0,0 +1,193 @@
+"""
+Синтетические данные и замеры страниц для команды run_benchmarks.
+"""
+import io
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import counters, rollups, search
+from .importing import create_with_timestamps
+from .models import Category, CustomUser, DesignRequest
+
+# Бюджеты по умолчанию: p95 в миллисекундах и число запросов к БД на страницу
+DEFAULT_BUDGETS = {
+    'home': {'p95_ms': 100, 'queries': 4},
+    'my_requests': {'p95_ms': 150, 'queries': 6},
+    'admin-all-requests': {'p95_ms': 150, 'queries': 6},
+    'request-detail': {'p95_ms': 100, 'queries': 6},
+}
+DEFAULT_BUDGET = {'p95_ms': 250, 'queries': 15}
+
+WORDS = (
+    'кухня', 'спальня', 'гостиная', 'детская', 'ванная', 'прихожая', 'лофт', 'минимализм',
+    'скандинавский', 'классика', 'светлый', 'тёмный', 'остров', 'гардероб', 'балкон', 'студия',
+)
+STATUSES = ('new', 'in_progress', 'completed')
+FAKE_IMAGES = 8
+
+
+def _fake_images(storage, rng):
+    """Несколько маленьких PNG: заявки ссылаются на них, как на одинаковые планы"""
+    names = []
+    for i in range(FAKE_IMAGES):
+        buffer = io.BytesIO()
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new('RGB', (64, 48), color).save(buffer, 'PNG')
+        names.append(storage.save(f'plans/bench/{i}.png', ContentFile(buffer.getvalue())))
+    return names
+
+
+def generate(users=50, categories=10, requests=1000, seed=0, batch_size=5000, progress=None):
+    """
+    Заполнить БД воспроизводимым набором данных. Картинки пишутся в
+    MEDIA_ROOT — вызывать с временным каталогом (см. run_benchmarks).
+    """
+    rng = random.Random(seed)
+    password = make_password('benchmark')
+    CustomUser.objects.bulk_create(
+        [
+            CustomUser(username=f'client{i}', full_name=f'Клиент Номер {i}', password=password)
+            for i in range(users)
+        ] + [CustomUser(username='bench-admin', full_name='Администратор', password=password, is_staff=True)],
+        batch_size=batch_size,
+    )
+    Category.objects.bulk_create([Category(name=f'Категория {i}') for i in range(categories)])
+    client_ids = list(CustomUser.objects.filter(is_staff=False).values_list('id', flat=True))
+    category_ids = list(Category.objects.values_list('id', flat=True))
+    images = _fake_images(DesignRequest._meta.get_field('plan_image').storage, rng)
+
+    now = timezone.now()
+    created = 0
+    while created < requests:
+        batch = []
+        for i in range(created, min(created + batch_size, requests)):
+            status = rng.choice(STATUSES)
+            timestamp = now - timedelta(minutes=requests - i)
+            batch.append(DesignRequest(
+                title=' '.join(rng.sample(WORDS, 2)).capitalize(),
+                description=' '.join(rng.choices(WORDS, k=20)),
+                client_id=rng.choice(client_ids),
+                category_id=rng.choice(category_ids),
+                status=status,
+                plan_image=rng.choice(images),
+                design_image=rng.choice(images) if status == 'completed' else None,
+                admin_comment=' '.join(rng.choices(WORDS, k=5)) if status != 'new' else '',
+                created_at=timestamp,
+                updated_at=timestamp,
+            ))
+        with transaction.atomic():
+            create_with_timestamps(batch)
+        created += len(batch)
+        if progress is not None:
+            progress(created)
+
+    # Ссылки на картинки учла create_with_timestamps; счётчики и сводки — целиком
+    counters.rebuild()
+    rollups.rebuild(batch_size)
+    search.ensure_schema()
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _targets():
+    """Все URL из catalog/urls.py с подставленными параметрами и пользователем"""
+    from . import urls
+
+    staff = CustomUser.objects.get(username='bench-admin')
+    # Новая заявка: для неё открываются и страницы действий администратора
+    sample = DesignRequest.objects.filter(status='new').select_related('client').order_by('-created_at').first()
+    client = sample.client
+    category = Category.objects.order_by('id').first()
+
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern):
+            continue
+        name = pattern.name
+        kwargs = {}
+        converters = pattern.pattern.converters
+        if 'pk' in converters:
+            kwargs['pk'] = category.pk if name.startswith('admin-category') else sample.pk
+        if 'field' in converters:
+            kwargs['field'] = 'plan_image'
+        if 'token' in converters:
+            kwargs['token'] = sample.pk  # несуществующая загрузка — замеряем путь до 404
+        if any(key not in kwargs for key in converters):
+            continue
+        # /metrics отдаётся только персоналу, иначе замерялся бы ответ 403
+        user = staff if name.startswith('admin-') or name == 'metrics' else client
+        if name in ('login', 'register', 'logout'):
+            user = None
+        yield name, reverse(name, kwargs=kwargs), user
+
+
+def _get(client, path):
+    """GET с дочитыванием потокового ответа: иначе время выгрузки не учтётся"""
+    response = client.get(path)
+    if response.streaming:
+        for _chunk in response.streaming_content:
+            pass
+    return response
+
+
+def measure(iterations=20, warmup=2):
+    """Замерить каждую страницу: p50/p95, число запросов к БД, пик памяти"""
+    results = {}
+    for name, path, user in _targets():
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        for _ in range(warmup):
+            _get(client, path)
+        latencies = []
+        query_counts = []
+        for _ in range(iterations):
+            # Каждый запрос сбрасывает connection.queries (request_started),
+            # поэтому считаем запросы к БД отдельно для каждого
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = _get(client, path)
+                latencies.append(time.perf_counter() - started)
+            query_counts.append(len(queries.captured_queries))
+        if response.status_code == 405:
+            continue  # только POST — GET-замер ничего не говорит
+        # Память отдельным проходом: tracemalloc заметно замедляет запросы
+        tracemalloc.start()
+        _get(client, path)
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {
+            'path': path,
+            'status': response.status_code,
+            'p50_ms': round(statistics.median(latencies) * 1000, 2),
+            'p95_ms': round(_percentile(latencies, 0.95) * 1000, 2),
+            'queries': max(query_counts),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+    return results
+
+
+def check_budgets(results, budgets=None):
+    """Список превышений бюджета: (страница, метрика, значение, бюджет)"""
+    budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+    violations = []
+    for name, result in results.items():
+        budget = budgets.get(name, DEFAULT_BUDGET)
+        for metric, limit in budget.items():
+            if result[metric] > limit:
+                violations.append((name, metric, result[metric], limit))
+    return violations
@@ -0,0 +1,96 @@
+"""
+Условные GET-запросы (ETag) для страниц, которые часто обновляют вручную.
+
+Валидатор страницы — дешёвый запрос (updated_at заявки, или самая свежая
+дата изменения и число заявок списка). ETag строится из его результата и
+из всего, что ещё влияет на HTML: пользователя, его прав, CSRF-cookie и
+версии справочных данных (имена категорий и пользователей). Если ETag
+совпал с If-None-Match, возвращается 304 без запросов за данными и без
+рендеринга шаблона.
+
+Last-Modified отдаётся для информации, но 304 выдаётся только по ETag:
+дата не учитывает пользователя, и по If-Modified-Since браузер мог бы
+показать страницу, сохранённую под другим аккаунтом.
+"""
+import functools
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+PAGES_VERSION_KEY = 'catalog:pages:version'
+
+
+def bump_pages_version():
+    """Категории или пользователи изменились — сбросить ETag всех страниц"""
+    transaction.on_commit(lambda: cache.set(PAGES_VERSION_KEY, time.time_ns(), None))
+
+
+async def _pages_version():
+    version = await cache.aget(PAGES_VERSION_KEY)
+    if version is None:
+        # add, а не set: параллельные запросы договариваются об одной версии
+        await cache.aadd(PAGES_VERSION_KEY, time.time_ns(), None)
+        version = await cache.aget(PAGES_VERSION_KEY)
+    return version
+
+
+def make_etag(request, user, version, data):
+    # Формы страниц содержат CSRF-токен: get_token() заводит секрет сразу,
+    # чтобы ETag первого ответа совпал со следующими
+    get_token(request)
+    key = repr((user.pk, user.is_staff, request.META.get('CSRF_COOKIE'), version, data))
+    return '"%s"' % hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def _has_messages(request):
+    # Хранилище сообщений читает сессию (cached_db) синхронно
+    return bool(len(get_messages(request)))
+
+
+def _set_headers(response, etag, last_modified):
+    response.headers.setdefault('ETag', etag)
+    if last_modified is not None:
+        response.headers.setdefault('Last-Modified', http_date(last_modified.timestamp()))
+    # Только в браузере пользователя и с проверкой при каждом обращении
+    patch_cache_control(response, private=True, no_cache=True)
+
+
+def conditional_page(validator):
+    """
+    Декоратор async-представления. validator(request, user, *args, **kwargs)
+    возвращает (данные для ETag, дата изменения) или None, если страницу
+    нужно отрендерить в любом случае (нет доступа, нет объекта).
+    request.user к вызову представления уже загружен асинхронно.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            # Ленивый request.user заменяется загруженным: шаблоны и
+            # контекст-процессоры не пойдут в БД синхронно
+            user = request.user = await request.auser()
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+            # Непоказанные сообщения делают страницу уникальной
+            if await sync_to_async(_has_messages)(request):
+                return await view(request, *args, **kwargs)
+            validated = await validator(request, user, *args, **kwargs)
+            if validated is None:
+                return await view(request, *args, **kwargs)
+            data, last_modified = validated
+            etag = make_etag(request, user, await _pages_version(), data)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            _set_headers(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,134 @@
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models import Count, F
+
+LATEST_COMPLETED_KEY = 'catalog:home:latest_completed'
+LATEST_COMPLETED_LIMIT = 4
+
+
+def _counter_model():
+    return apps.get_model('catalog', 'StatusCounter')
+
+
+def _request_model():
+    return apps.get_model('catalog', 'DesignRequest')
+
+
+def rebuild():
+    """Пересчитать счётчики статусов одним GROUP BY"""
+    StatusCounter = _counter_model()
+    DesignRequest = _request_model()
+    db = router.db_for_write(StatusCounter)
+    with transaction.atomic(using=db):
+        # Сначала запись: транзакция сразу берёт блокировку записи, поэтому
+        # заявка из параллельной транзакции не проскочит между подсчётом и
+        # сохранением (её adjust() не нашёл бы строк счётчиков и потерялся)
+        StatusCounter.objects.using(db).bulk_create(
+            [StatusCounter(status=status, count=0) for status, _label in DesignRequest.STATUS_CHOICES],
+            ignore_conflicts=True,
+        )
+        counts = dict(
+            DesignRequest.objects.using(db).order_by()
+            .values_list('status')
+            .annotate(n=Count('id'))
+            .values_list('status', 'n')
+        )
+        StatusCounter.objects.using(db).bulk_create(
+            [
+                StatusCounter(status=status, count=counts.get(status, 0))
+                for status, _label in DesignRequest.STATUS_CHOICES
+            ],
+            update_conflicts=True,
+            unique_fields=['status'],
+            update_fields=['count'],
+        )
+    return counts
+
+
+def status_count(status):
+    """Количество заявок в статусе — один SELECT по первичному ключу"""
+    StatusCounter = _counter_model()
+    try:
+        return StatusCounter.objects.values_list('count', flat=True).get(status=status)
+    except StatusCounter.DoesNotExist:
+        return rebuild().get(status, 0)
+
+
+async def astatus_count(status):
+    """Асинхронный вариант status_count"""
+    StatusCounter = _counter_model()
+    try:
+        return await StatusCounter.objects.values_list('count', flat=True).aget(status=status)
+    except StatusCounter.DoesNotExist:
+        return (await sync_to_async(rebuild)()).get(status, 0)
+
+
+def adjust(status, delta):
+    """Сдвинуть счётчик статуса; вызывать внутри транзакции изменения заявки"""
+    if delta:
+        _counter_model().objects.filter(status=status).update(count=F('count') + delta)
+
+
+def invalidate_latest_completed():
+    """Сбросить кэш блока «последние выполненные» после коммита"""
+    transaction.on_commit(lambda: cache.delete(LATEST_COMPLETED_KEY))
+
+
+def latest_completed():
+    """Последние выполненные заявки для главной, из кэша"""
+    requests = cache.get(LATEST_COMPLETED_KEY)
+    if requests is None:
+        requests = list(
+            _request_model().objects.filter(status='completed')
+            .select_related('category')
+            .order_by('-created_at')[:LATEST_COMPLETED_LIMIT]
+        )
+        cache.set(LATEST_COMPLETED_KEY, requests, None)
+    return requests
+
+
+async def alatest_completed():
+    """Асинхронный вариант latest_completed"""
+    requests = await cache.aget(LATEST_COMPLETED_KEY)
+    if requests is None:
+        requests = [
+            request async for request in
+            _request_model().objects.filter(status='completed')
+            .select_related('category')
+            .order_by('-created_at')[:LATEST_COMPLETED_LIMIT]
+        ]
+        await cache.aset(LATEST_COMPLETED_KEY, requests, None)
+    return requests
+
+
+def record_created(instance):
+    adjust(instance.status, 1)
+    if instance.status == 'completed':
+        invalidate_latest_completed()
+
+
+def record_status_change(instance, previous):
+    if previous is None:
+        # Исходный статус неизвестен — счётчики пересчитаются при чтении
+        _counter_model().objects.all().delete()
+        invalidate_latest_completed()
+        return
+    if previous != instance.status:
+        adjust(previous, -1)
+        adjust(instance.status, 1)
+    if 'completed' in (previous, instance.status):
+        invalidate_latest_completed()
+
+
+def record_changed(instance):
+    if instance.status == 'completed':
+        invalidate_latest_completed()
+
+
+def record_deleted(instance):
+    status = getattr(instance, '_loaded_status', instance.status)
+    adjust(status, -1)
+    if status == 'completed':
+        invalidate_latest_completed()
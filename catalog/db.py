@@ -0,0 +1,75 @@
+"""
+Настройка SQLite и маршрутизация чтения.
+
+configure_sqlite() подключается к сигналу connection_created и выполняет
+SQLITE_PRAGMAS для каждого нового соединения (WAL, busy_timeout и т.д.).
+Соединение DATABASE_READ_ALIAS дополнительно переводится в query_only.
+
+ReadOnlyRouter направляет чтение в DATABASE_READ_ALIAS только внутри
+представлений, помеченных @read_only_database: в режиме WAL читатели не
+ждут писателя, а запись из таких представлений всё равно идёт в default.
+"""
+import contextvars
+import functools
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+_read_only = contextvars.ContextVar('catalog_read_only_database', default=False)
+
+
+def read_alias():
+    alias = getattr(settings, 'DATABASE_READ_ALIAS', None)
+    return alias if alias in connections else None
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if connection.alias == read_alias():
+        pragmas['query_only'] = 'ON'
+        # Режим журнала меняет только писатель
+        pragmas.pop('journal_mode', None)
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def read_only_database(view):
+    """Представление только читает: запросы чтения идут в DATABASE_READ_ALIAS"""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            token = _read_only.set(True)
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                _read_only.reset(token)
+    else:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            token = _read_only.set(True)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                _read_only.reset(token)
+    return wrapper
+
+
+class ReadOnlyRouter:
+    def db_for_read(self, model, **hints):
+        if _read_only.get():
+            return read_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Обе базы — один и тот же файл
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,75 @@
+"""
+Фоновое удаление категорий.
+
+category.delete() с CASCADE загружает все заявки категории и удаляет их
+в одной транзакции — на большой категории это блокирует запись в SQLite
+для всех остальных. Вместо этого категория сразу помечается deleting,
+а заявки удаляются пачками по CATEGORY_DELETE_BATCH_SIZE, каждая пачка —
+отдельная короткая транзакция. Сигналы post_delete (счётчики статусов,
+ссылки на файлы) срабатывают как обычно, файлы без ссылок удаляются
+после коммита своей пачки.
+
+Веб-процесс только помечает категорию. Удаляет пачки отдельный процесс —
+команда purge_categories (постоянно, как send_notifications, или по
+расписанию с --once), поэтому удаление не занимает воркеры и не
+обрывается при их перезапуске.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Category, DesignRequest
+
+
+def batch_size():
+    return getattr(settings, 'CATEGORY_DELETE_BATCH_SIZE', 500)
+
+
+def mark_for_deletion(categories):
+    """
+    Пометить категории на удаление; заявки удалит purge_categories.
+    Возвращает число помеченных категорий (уже помеченные не считаются).
+    """
+    marked = 0
+    with transaction.atomic():
+        for category in categories:
+            total = DesignRequest.objects.filter(category_id=category.pk).count()
+            marked += Category.objects.filter(pk=category.pk, deleting=False).update(
+                deleting=True, deletion_total=total
+            )
+    return marked
+
+
+def purge_category(pk, progress=None):
+    """Удалить заявки категории пачками, затем саму категорию; возвращает число заявок"""
+    deleted = 0
+    size = batch_size()
+    while True:
+        with transaction.atomic():
+            ids = list(
+                DesignRequest.objects.filter(category_id=pk).order_by().values_list('pk', flat=True)[:size]
+            )
+            if not ids:
+                break
+            # Коллектор загружает только эту пачку; сигналы обновят счётчики и файлы
+            DesignRequest.objects.filter(pk__in=ids).delete()
+        deleted += len(ids)
+        if progress is not None:
+            progress(deleted)
+    Category.objects.filter(pk=pk, deleting=True).delete()
+    return deleted
+
+
+def deletion_progress():
+    """{pk категории: (удалено заявок, всего)} для помеченных категорий"""
+    pending = dict(Category.objects.filter(deleting=True).values_list('pk', 'deletion_total'))
+    if not pending:
+        return {}
+    remaining = dict(
+        DesignRequest.objects.filter(category_id__in=pending).order_by()
+        .values_list('category_id').annotate(n=Count('pk'))
+    )
+    return {
+        pk: (max(0, total - remaining.get(pk, 0)), total)
+        for pk, total in pending.items()
+    }
@@ -0,0 +1,203 @@
+"""
+Потоковая выгрузка заявок в CSV и XLSX.
+
+Строки читаются values_list(...).iterator() с JOIN на клиента и категорию —
+без моделей и без загрузки всей выборки; ответ отдаётся частями по
+EXPORT_CHUNK_ROWS строк, заголовок таблицы уходит до первого запроса к БД.
+Память не зависит от числа заявок.
+
+XLSX — минимальная книга из одного листа: zip пишется потоково (без
+перемотки, с дескрипторами данных), ячейки — inline-строки, так что не
+нужна ни таблица общих строк, ни сторонние библиотеки.
+"""
+import csv
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import DesignRequest
+
+EXPORT_CHUNK_ROWS = 500
+
+# (поле values_list, заголовок столбца)
+COLUMNS = (
+    ('id', 'ID'),
+    ('title', 'Название'),
+    ('client__full_name', 'Клиент'),
+    ('client__username', 'Логин клиента'),
+    ('category__name', 'Категория'),
+    ('status', 'Статус'),
+    ('admin_comment', 'Комментарий администратора'),
+    ('created_at', 'Дата создания'),
+    ('updated_at', 'Дата обновления'),
+    ('completed_at', 'Дата выполнения'),
+)
+STATUS_LABELS = {status: str(label) for status, label in DesignRequest.STATUS_CHOICES}
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Управляющие символы запрещены в XML 1.0
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Ячейку CSV с таким началом Excel и LibreOffice вычисляют как формулу;
+# в XLSX ячейки — строки, там это не нужно
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _rows(queryset):
+    fields = [field for field, _title in COLUMNS]
+    rows = queryset.order_by('-created_at', '-id').values_list(*fields).iterator(chunk_size=2000)
+    for row in rows:
+        yield [_display(field, value) for (field, _title), value in zip(COLUMNS, row)]
+
+
+def _display(field, value):
+    if value is None:
+        return ''
+    if field == 'status':
+        return STATUS_LABELS.get(value, value)
+    if hasattr(value, 'tzinfo'):
+        return timezone.localtime(value).strftime('%d.%m.%Y %H:%M')
+    return str(value)
+
+
+class _Echo:
+    """«Файл» для csv.writer: writerow() возвращает готовую строку"""
+
+    def write(self, value):
+        return value
+
+
+class _Buffer:
+    """Приёмник zipfile: записанное забирается drain()"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def csv_chunks(queryset):
+    writer = csv.writer(_Echo())
+    # BOM — чтобы Excel открыл UTF-8 с кириллицей
+    yield ('\ufeff' + writer.writerow([title for _field, title in COLUMNS])).encode('utf-8')
+    lines = []
+    for row in _rows(queryset):
+        lines.append(writer.writerow([_csv_cell(value) for value in row]))
+        if len(lines) == EXPORT_CHUNK_ROWS:
+            yield ''.join(lines).encode('utf-8')
+            lines = []
+    yield ''.join(lines).encode('utf-8')
+
+
+def _csv_cell(value):
+    # Апостроф в начале — ячейка показывается текстом, а не вычисляется
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+def _xlsx_row(values):
+    cells = ''.join(
+        f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_XML_ILLEGAL.sub("", value))}</t></is></c>'
+        for value in values
+    )
+    return f'<row>{cells}</row>'
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Заявки" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def xlsx_chunks(queryset):
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        # force_zip64: размер листа заранее неизвестен
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_row([title for _field, title in COLUMNS])
+            ).encode('utf-8'))
+            yield buffer.drain()
+            lines = []
+            for row in _rows(queryset):
+                lines.append(_xlsx_row(row))
+                if len(lines) == EXPORT_CHUNK_ROWS:
+                    sheet.write(''.join(lines).encode('utf-8'))
+                    lines = []
+                    yield buffer.drain()
+            sheet.write((''.join(lines) + '</sheetData></worksheet>').encode('utf-8'))
+    yield buffer.drain()
+
+
+async def _async_chunks(chunks):
+    # Под ASGI синхронный итератор Django собрал бы в список целиком —
+    # отдаём по одной части, забирая их в потоке с соединением к БД
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    while True:
+        chunk = await next_chunk(chunks, done)
+        if chunk is done:
+            break
+        yield chunk
+
+
+def export_response(request, queryset, fmt):
+    """StreamingHttpResponse с выгрузкой queryset в формате fmt ('csv' или 'xlsx')"""
+    chunks = xlsx_chunks(queryset) if fmt == 'xlsx' else csv_chunks(queryset)
+    if isinstance(request, ASGIRequest):
+        chunks = _async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[fmt])
+    filename = f'requests-{timezone.localdate():%Y-%m-%d}.{fmt}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -1,7 +1,9 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from django.core.exceptions import ValidationError
 from .models import CustomUser, DesignRequest, Category
 from .models import validate_image_file
+from .uploads import ChunkedUpload
 
 class CustomUserCreationForm(UserCreationForm):
     full_name = forms.CharField(
@@ -31,8 +33,39 @@ class CustomUserCreationForm(UserCreationForm):
 class DesignRequestForm(forms.ModelForm):
     plan_image = forms.ImageField(
         validators=[validate_image_file],
-        label='План помещения'
+        label='План помещения',
+        required=False
     )
+    # Токен файла, уже загруженного по частям через upload_chunk
+    upload_token = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        self.chunked_upload = None
+        # В удаляемую категорию новые заявки не принимаются
+        self.fields['category'].queryset = Category.objects.filter(deleting=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        token = cleaned_data.get('upload_token')
+        if token and self.user is not None and not cleaned_data.get('plan_image'):
+            upload = ChunkedUpload.get(token, self.user)
+            if upload is None or not upload.complete:
+                self.add_error('plan_image', 'Загрузка плана не завершена.')
+            else:
+                try:
+                    upload.verify()
+                except ValidationError as exc:
+                    upload.discard()
+                    self.add_error('plan_image', exc)
+                else:
+                    self.chunked_upload = upload
+                    cleaned_data['plan_image'] = upload.as_file()
+        if not cleaned_data.get('plan_image') and 'plan_image' not in self.errors:
+            self.add_error('plan_image', forms.Field.default_error_messages['required'])
+        return cleaned_data
+
     class Meta:
         model = DesignRequest
         fields = ['title', 'description', 'category', 'plan_image']
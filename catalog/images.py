@@ -0,0 +1,143 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, features
+
+logger = logging.getLogger(__name__)
+
+# Ширины превью (px), которые кладутся рядом с оригиналом
+DERIVATIVE_WIDTHS = (320, 640)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Не даём пулу и ленивой генерации строить одни и те же превью одновременно
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def derivative_formats():
+    """Форматы превью: JPEG всегда, WebP — если Pillow собран с ним"""
+    formats = ['jpg']
+    if features.check('webp'):
+        formats.append('webp')
+    return formats
+
+
+def derivative_name(name, width, fmt):
+    """plans/2025/01/01/plan.png -> plans/2025/01/01/plan_320w.webp"""
+    root, _ext = os.path.splitext(name)
+    return f'{root}_{width}w.{fmt}'
+
+
+def _render(image, width, fmt):
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    if fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=80, method=4)
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _lock_for(name):
+    with _build_locks_guard:
+        return _build_locks.setdefault(name, threading.Lock())
+
+
+def build_derivatives(storage, name, widths=DERIVATIVE_WIDTHS, overwrite=False):
+    """Сгенерировать недостающие превью для файла; возвращает число созданных"""
+    lock = _lock_for(name)
+    try:
+        with lock:
+            return _build(storage, name, widths, overwrite)
+    finally:
+        with _build_locks_guard:
+            if _build_locks.get(name) is lock and not lock.locked():
+                del _build_locks[name]
+
+
+def _build(storage, name, widths, overwrite):
+    targets = [
+        (width, fmt, derivative_name(name, width, fmt))
+        for width in widths
+        for fmt in derivative_formats()
+    ]
+    if not overwrite:
+        targets = [t for t in targets if not storage.exists(t[2])]
+    if not targets:
+        return 0
+
+    with storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    target_storage = getattr(storage, 'derivative_storage', storage)
+    for width, fmt, target in targets:
+        if overwrite and storage.exists(target):
+            storage.delete(target)
+        target_storage.save(target, ContentFile(_render(image, width, fmt)))
+    return len(targets)
+
+
+def delete_derivatives(storage, name):
+    """Удалить все превью файла"""
+    for width in DERIVATIVE_WIDTHS:
+        for fmt in derivative_formats():
+            target = derivative_name(name, width, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+                thread_name_prefix='derivatives',
+            )
+        return _executor
+
+
+def _build_safely(storage, name):
+    try:
+        build_derivatives(storage, name)
+    except Exception:
+        logger.exception('Не удалось построить превью для %s', name)
+
+
+def schedule_derivatives(field_file):
+    """Поставить генерацию превью в пул после коммита транзакции"""
+    if not field_file:
+        return
+    storage, name = field_file.storage, field_file.name
+    transaction.on_commit(lambda: _get_executor().submit(_build_safely, storage, name))
+
+
+def ensure_derivative(storage, name, width, fmt='jpg'):
+    """Имя превью; отсутствующее строится лениво, при ошибке — имя оригинала"""
+    target = derivative_name(name, width, fmt)
+    if not storage.exists(target):
+        try:
+            build_derivatives(storage, name)
+        except Exception:
+            logger.exception('Не удалось построить превью для %s', name)
+            return name
+    return target
+
+
+def derivative_url(field_file, width, fmt='jpg'):
+    """URL превью; отсутствующее превью строится лениво при первом обращении"""
+    if not field_file:
+        return ''
+    return field_file.storage.url(ensure_derivative(field_file.storage, field_file.name, width, fmt))
@@ -0,0 +1,35 @@
+"""
+Массовая вставка заявок с сохранением дат — для import_requests и
+синтетических данных run_benchmarks.
+"""
+from collections import Counter
+
+from . import storage as blobs
+from .models import DesignRequest
+
+
+def create_with_timestamps(requests):
+    """
+    Вставить заявки, сохранив их created_at и updated_at; вызывать в
+    транзакции. bulk_create ставит в auto_now-поля текущее время, поэтому
+    даты записываются следом через bulk_update — он их не трогает.
+    Заявки с уже существующим id пропускаются; ссылки на файлы изображений
+    учитываются в той же транзакции. Возвращает вставленные.
+    """
+    by_id = {}
+    for request in requests:
+        by_id.setdefault(request.pk, request)
+    existing = set(DesignRequest.objects.filter(pk__in=list(by_id)).values_list('pk', flat=True))
+    created = [request for pk, request in by_id.items() if pk not in existing]
+    timestamps = [(request.created_at, request.updated_at) for request in created]
+    DesignRequest.objects.bulk_create(created)
+    for request, (created_at, updated_at) in zip(created, timestamps):
+        request.created_at, request.updated_at = created_at, updated_at
+    DesignRequest.objects.bulk_update(created, ['created_at', 'updated_at'])
+    # bulk_create не вызывает save(): ссылки на общие блобы считаем здесь
+    names = Counter()
+    for request in created:
+        names.update(image.name for image in (request.plan_image, request.design_image) if image)
+    for name, count in names.items():
+        blobs.retain(name, count)
+    return created
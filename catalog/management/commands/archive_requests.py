@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from catalog import archive
+
+
+class Command(BaseCommand):
+    help = 'Перенести в архив выполненные заявки старше заданного срока пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='Выполнены не позже чем столько дней назад')
+        parser.add_argument('--batch-size', type=int, default=500, help='Заявок в одной транзакции')
+        parser.add_argument('--cold', action='store_true', help='Перенести файлы в холодное хранилище со сжатием')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        def progress(count):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Перенесено: {count}')
+
+        archived = archive.archive_requests(cutoff, options['batch_size'], options['cold'], progress)
+        self.stdout.write(self.style.SUCCESS(f'Перенесено в архив заявок: {archived}'))
@@ -0,0 +1,83 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+
+
+def _summary(name, latencies, elapsed):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return (
+        f'{name}: {len(latencies) / elapsed:.0f} запросов/с, '
+        f'p50 {statistics.median(latencies) * 1000:.1f} мс, p95 {p95 * 1000:.1f} мс'
+    )
+
+
+class Command(BaseCommand):
+    help = 'Сравнить пропускную способность страниц через WSGI- и ASGI-обработчики Django'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', dest='urls', help='Адрес страницы (можно несколько)')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на каждый обработчик')
+        parser.add_argument('--concurrency', type=int, default=10, help='Одновременных клиентов')
+        parser.add_argument('--username', help='Выполнять запросы от имени пользователя')
+
+    def handle(self, *args, **options):
+        urls = options['urls'] or ['/']
+        user = None
+        if options['username']:
+            try:
+                user = get_user_model().objects.get(username=options['username'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f'Пользователь {options["username"]} не найден.')
+        self.total = options['requests']
+        self.concurrency = options['concurrency']
+
+        self.stdout.write(self._run_wsgi(urls, user))
+        self.stdout.write(asyncio.run(self._run_asgi(urls, user)))
+
+    def _run_wsgi(self, urls, user):
+        per_client = self.total // self.concurrency
+
+        def worker(_):
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            latencies = []
+            for i in range(per_client):
+                started = time.perf_counter()
+                response = client.get(urls[i % len(urls)])
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    raise CommandError(f'{urls[i % len(urls)]}: {response.status_code}')
+            return latencies
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            latencies = [t for chunk in executor.map(worker, range(self.concurrency)) for t in chunk]
+        return _summary('WSGI', latencies, time.perf_counter() - started)
+
+    async def _run_asgi(self, urls, user):
+        per_client = self.total // self.concurrency
+
+        async def worker():
+            client = AsyncClient()
+            if user is not None:
+                await client.aforce_login(user)
+            latencies = []
+            for i in range(per_client):
+                started = time.perf_counter()
+                response = await client.get(urls[i % len(urls)])
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    raise CommandError(f'{urls[i % len(urls)]}: {response.status_code}')
+            return latencies
+
+        started = time.perf_counter()
+        chunks = await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        latencies = [t for chunk in chunks for t in chunk]
+        return _summary('ASGI', latencies, time.perf_counter() - started)
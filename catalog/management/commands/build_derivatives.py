@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from catalog.images import build_derivatives
+from catalog.models import DesignRequest
+
+
+class Command(BaseCommand):
+    help = 'Построить превью (JPEG/WebP) для уже загруженных планов и дизайнов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Число параллельных потоков')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Размер выборки из БД')
+        parser.add_argument('--overwrite', action='store_true', help='Перестроить существующие превью')
+
+    def handle(self, *args, **options):
+        storage = DesignRequest._meta.get_field('plan_image').storage
+        names = (
+            name
+            for pair in DesignRequest.objects.values_list('plan_image', 'design_image')
+            .iterator(chunk_size=options['chunk_size'])
+            for name in pair
+            if name
+        )
+
+        started = time.monotonic()
+        files = built = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            pending = set()
+            for name in names:
+                pending.add(executor.submit(build_derivatives, storage, name, overwrite=options['overwrite']))
+                # Ограничиваем очередь, чтобы не держать в памяти все задачи
+                if len(pending) >= options['workers'] * 4:
+                    done = next(as_completed(pending))
+                    pending.remove(done)
+                    files, built, failed = self._collect(done, files, built, failed)
+            for done in as_completed(pending):
+                files, built, failed = self._collect(done, files, built, failed)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов: {files}, создано превью: {built}, ошибок: {failed}, {elapsed:.1f} с'
+        ))
+
+    def _collect(self, future, files, built, failed):
+        try:
+            built += future.result()
+        except Exception as exc:
+            failed += 1
+            self.stderr.write(f'Ошибка: {exc}')
+        return files + 1, built, failed
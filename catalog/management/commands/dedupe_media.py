@@ -0,0 +1,93 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from catalog.images import delete_derivatives
+from catalog.storage import (
+    BLOB_PREFIX, _referencing_querysets, file_digest, rebuild_refcounts, request_image_storage,
+)
+
+IMAGE_COLUMNS = ('plan_image', 'design_image')
+
+
+class Command(BaseCommand):
+    help = 'Перенести существующие изображения заявок в хранилище по хэшу, удалив дубликаты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Имён файлов за одну выборку из БД')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, сколько места освободится')
+
+    def handle(self, *args, **options):
+        storage = request_image_storage()
+        started = time.monotonic()
+        seen = {}
+        blobs_seen = set()
+        moved = duplicates = missing = reclaimed = 0
+
+        # Заявки и архив вне холодного хранилища ссылаются на одни и те же файлы
+        sources = [(queryset, field) for queryset in _referencing_querysets() for field in IMAGE_COLUMNS]
+        for queryset, field in sources:
+            names = (
+                queryset.exclude(**{field: ''})
+                .exclude(**{f'{field}__isnull': True})
+                .exclude(**{f'{field}__startswith': f'{BLOB_PREFIX}/'})
+                .order_by().values_list(field, flat=True).distinct()
+                .iterator(chunk_size=options['chunk_size'])
+            )
+            for name in names:
+                if name in seen:
+                    continue
+                path = storage.path(name)
+                if not os.path.exists(path):
+                    missing += 1
+                    self.stderr.write(f'Нет файла: {name}')
+                    continue
+                size = os.path.getsize(path)
+                blob = storage.blob_name(file_digest(path), name)
+                blob_path = storage.path(blob)
+                exists = blob in blobs_seen or os.path.exists(blob_path)
+                seen[name] = blob
+                blobs_seen.add(blob)
+                if exists:
+                    duplicates += 1
+                    reclaimed += size
+                else:
+                    moved += 1
+                if options['dry_run']:
+                    continue
+
+                # Жёсткая ссылка -> обновление строк -> удаление старого имени:
+                # при обрыве на любом шаге файл остаётся доступен
+                if not os.path.exists(blob_path):
+                    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                    os.link(path, blob_path)
+                with transaction.atomic():
+                    for referencing in _referencing_querysets():
+                        for column in IMAGE_COLUMNS:
+                            referencing.filter(**{column: name}).update(**{column: blob})
+                if self.still_referenced(name):
+                    # Строку со старым именем записали после обновления — файл нужен
+                    self.stderr.write(f'Старое имя ещё используется, файл оставлен: {name}')
+                    continue
+                delete_derivatives(storage, name)
+                os.remove(path)
+
+        if not options['dry_run']:
+            blobs = rebuild_refcounts()
+            self.stdout.write(f'Файлов в хранилище: {blobs}')
+        elapsed = max(time.monotonic() - started, 1e-9)
+        processed = moved + duplicates
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено: {moved}, дубликатов: {duplicates}, нет на диске: {missing}, '
+            f'освобождено: {reclaimed / 1024 / 1024:.1f} МБ, '
+            f'{elapsed:.1f} с, {processed / elapsed:.0f} файлов/с'
+        ))
+
+    def still_referenced(self, name):
+        return any(
+            queryset.filter(Q(plan_image=name) | Q(design_image=name)).exists()
+            for queryset in _referencing_querysets()
+        )
@@ -0,0 +1,60 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.models import DesignRequest
+
+FIELDS = (
+    'id', 'title', 'description', 'client__username', 'category__name', 'status',
+    'plan_image', 'design_image', 'admin_comment', 'created_at', 'updated_at',
+)
+KEYS = tuple(field.split('__')[0] for field in FIELDS)
+
+
+class Command(BaseCommand):
+    help = 'Потоковый экспорт заявок в JSONL (формат import_requests)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Файл для записи или «-» для stdout')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Строк за одну выборку из БД')
+        parser.add_argument('--offset', type=int, default=0, help='Пропустить первые N заявок (продолжение экспорта)')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать заявки, не писать файл')
+
+    def handle(self, *args, **options):
+        # values_list без моделей и с JOIN на клиента и категорию: память не растёт
+        rows = (
+            DesignRequest.objects.order_by('created_at', 'id')
+            .values_list(*FIELDS)[options['offset']:]
+            .iterator(chunk_size=options['chunk_size'])
+        )
+        if options['dry_run']:
+            out = None
+        elif options['path'] == '-':
+            out = sys.stdout
+        else:
+            out = open(options['path'], 'a' if options['offset'] else 'w', encoding='utf-8')
+
+        started = time.monotonic()
+        count = 0
+        try:
+            for row in rows:
+                count += 1
+                if out is None:
+                    continue
+                record = dict(zip(KEYS, row))
+                record['id'] = str(record['id'])
+                record['created_at'] = record['created_at'].isoformat()
+                record['updated_at'] = record['updated_at'].isoformat()
+                out.write(json.dumps(record, ensure_ascii=False))
+                out.write('\n')
+        finally:
+            if out is not None and out is not sys.stdout:
+                out.close()
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stderr.write(self.style.SUCCESS(
+            f'Экспортировано: {count} с позиции {options["offset"]}, '
+            f'{elapsed:.1f} с, {count / elapsed:.0f} заявок/с'
+        ))
@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from catalog import media_gc
+from catalog.archive import cold_storage
+from catalog.storage import request_image_storage
+
+
+class Command(BaseCommand):
+    help = 'Удалить или перенести в карантин файлы изображений, на которые не ссылается ни одна заявка'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24, help='Не трогать файлы моложе (часов)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Имён файлов за одну выборку из БД')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать сирот и освобождаемое место')
+        parser.add_argument(
+            '--quarantine', action='store_true',
+            help='Переносить сирот в MEDIA_QUARANTINE_ROOT вместо удаления',
+        )
+        parser.add_argument('--skip-cold', action='store_true', help='Не проверять холодное хранилище архива')
+
+    def handle(self, *args, **options):
+        targets = [('горячее', request_image_storage(), False)]
+        if not options['skip_cold']:
+            targets.append(('холодное', cold_storage(), True))
+        quarantine_root = str(getattr(settings, 'MEDIA_QUARANTINE_ROOT', settings.BASE_DIR / 'media_quarantine'))
+
+        def progress(stats):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Просмотрено: {stats["scanned"]}, сирот: {stats["orphans"]}')
+
+        for label, storage, cold in targets:
+            started = time.monotonic()
+            references = media_gc.load_references(cold, options['chunk_size'])
+            quarantine = None
+            if options['quarantine']:
+                quarantine = f'{quarantine_root}/cold' if cold else quarantine_root
+            stats = media_gc.collect(
+                storage.location, references, options['grace_hours'] * 3600,
+                cold=cold, dry_run=options['dry_run'], quarantine=quarantine, progress=progress,
+            )
+            elapsed = max(time.monotonic() - started, 1e-9)
+            verb = 'найдено' if options['dry_run'] else ('перенесено в карантин' if quarantine else 'удалено')
+            self.stdout.write(self.style.SUCCESS(
+                f'Хранилище {label}: просмотрено файлов {stats["scanned"]}, {verb} сирот '
+                f'{stats["orphans"]} ({stats["bytes"] / 1024 / 1024:.1f} МБ), '
+                f'{elapsed:.1f} с, {stats["scanned"] / elapsed:.0f} файлов/с'
+            ))
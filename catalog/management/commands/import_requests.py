@@ -0,0 +1,131 @@
+import json
+import sys
+import time
+import uuid
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from catalog import counters, rollups
+from catalog.importing import create_with_timestamps
+from catalog.models import Category, CustomUser, DesignRequest
+
+STATUSES = {status for status, _label in DesignRequest.STATUS_CHOICES}
+
+
+class Command(BaseCommand):
+    help = 'Потоковый импорт заявок из JSONL (по строке на заявку) пачками через bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к JSONL-файлу или «-» для stdin')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Заявок в одной транзакции')
+        parser.add_argument('--offset', type=int, default=0, help='Пропустить первые N строк (продолжение импорта)')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить файл, ничего не записывать')
+        parser.add_argument('--create-categories', action='store_true', help='Создавать отсутствующие категории')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть положительным.')
+        self.dry_run = options['dry_run']
+        self.create_categories = options['create_categories']
+
+        # Справочники целиком в памяти: категорий и клиентов на порядки меньше, чем заявок
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.clients = dict(CustomUser.objects.values_list('username', 'id'))
+
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8')
+        started = time.monotonic()
+        line_no = options['offset']
+        imported = skipped = 0
+        try:
+            lines = islice(stream, options['offset'], None)
+            while True:
+                chunk = list(islice(lines, batch_size))
+                if not chunk:
+                    break
+                batch = []
+                for line in chunk:
+                    line_no += 1
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                        if not isinstance(record, dict):
+                            raise ValueError('ожидается JSON-объект')
+                        batch.append(self.build(record))
+                    except (ValueError, KeyError, TypeError) as exc:
+                        skipped += 1
+                        self.stderr.write(f'Строка {line_no}: {exc}')
+                if batch and not self.dry_run:
+                    with transaction.atomic():
+                        created = create_with_timestamps(batch)
+                    # Заявки, которые уже есть в базе (повторный импорт), не считаем
+                    skipped += len(batch) - len(created)
+                    imported += len(created)
+                else:
+                    imported += len(batch)
+                if options['verbosity'] > 1:
+                    self.report(imported, started, line_no)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if imported and not self.dry_run:
+            # bulk_create минует save(): счётчики и сводки аналитики пересчитываются целиком
+            counters.rebuild()
+            counters.invalidate_latest_completed()
+            rollups.rebuild()
+        self.report(imported, started, line_no)
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Проверено" if self.dry_run else "Импортировано"}: {imported}, пропущено: {skipped}'
+        ))
+
+    def report(self, count, started, line_no):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(f'строка {line_no}: {count} заявок, {elapsed:.1f} с, {count / elapsed:.0f} заявок/с')
+
+    def category_id(self, name):
+        if name in self.categories:
+            return self.categories[name]
+        if not self.create_categories:
+            raise KeyError(f'неизвестная категория «{name}»')
+        if self.dry_run:
+            self.categories[name] = None
+        else:
+            self.categories[name] = Category.objects.create(name=name).id
+        return self.categories[name]
+
+    def build(self, record):
+        try:
+            client_id = self.clients[record['client']]
+        except KeyError:
+            raise KeyError(f'неизвестный клиент «{record.get("client")}»') from None
+        status = record.get('status', 'new')
+        if status not in STATUSES:
+            raise ValueError(f'неизвестный статус «{status}»')
+        request = DesignRequest(
+            title=record['title'],
+            description=record.get('description', ''),
+            client_id=client_id,
+            category_id=self.category_id(record['category']),
+            status=status,
+            plan_image=record.get('plan_image', ''),
+            design_image=record.get('design_image') or None,
+            admin_comment=record.get('admin_comment', ''),
+        )
+        if record.get('id'):
+            request.id = uuid.UUID(record['id'])
+        timestamps = {}
+        for field in ('created_at', 'updated_at'):
+            if record.get(field):
+                timestamps[field] = parse_datetime(record[field])
+                if timestamps[field] is None:
+                    raise ValueError(f'неверная дата {field}: {record[field]}')
+        now = timezone.now()
+        request.created_at = timestamps.get('created_at', now)
+        request.updated_at = timestamps.get('updated_at', request.created_at)
+        return request
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.deletion import purge_category
+from catalog.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Удалять пачками категории, помеченные на удаление, вместе с их заявками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5.0, help='Пауза в секундах, когда удалять нечего')
+        parser.add_argument('--once', action='store_true', help='Удалить помеченные категории и завершиться')
+
+    def handle(self, *args, **options):
+        purged = 0
+        try:
+            while True:
+                categories = list(Category.objects.filter(deleting=True))
+                for category in categories:
+                    self.stdout.write(f'Категория «{category}»: заявок к удалению {category.deletion_total}')
+                    deleted = purge_category(
+                        category.pk,
+                        progress=lambda n: self.stdout.write(f'  удалено {n}') if options['verbosity'] > 1 else None,
+                    )
+                    self.stdout.write(f'  удалено заявок: {deleted}')
+                purged += len(categories)
+                if categories:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Удалено категорий: {purged}'))
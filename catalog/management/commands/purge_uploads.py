@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from catalog.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Удалить брошенные загрузки планов по частям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=24 * 3600, help='Возраст в секундах (по умолчанию сутки)')
+
+    def handle(self, *args, **options):
+        removed = purge_stale_uploads(options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено незавершённых загрузок: {removed}'))
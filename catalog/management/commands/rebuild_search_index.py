@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import search
+
+
+class Command(BaseCommand):
+    help = 'Переиндексировать полнотекстовый поиск по заявкам (SQLite FTS5) пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Заявок в одной транзакции')
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Полнотекстовый поиск поддерживается только на SQLite.')
+        started = time.monotonic()
+
+        def progress(count):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Проиндексировано: {count}')
+
+        indexed = search.rebuild(options['batch_size'], progress)
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано заявок: {indexed}, {elapsed:.1f} с, {indexed / elapsed:.0f} заявок/с'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from catalog import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать счётчики заявок по статусам и сбросить кэш главной'
+
+    def handle(self, *args, **options):
+        result = counters.rebuild()
+        counters.invalidate_latest_completed()
+        for status, count in sorted(result.items()):
+            self.stdout.write(f'{status}: {count}')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны.'))
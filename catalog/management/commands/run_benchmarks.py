@@ -0,0 +1,92 @@
+import json
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from catalog import benchmarks
+
+SCALES = {
+    '1k': {'requests': 1_000, 'users': 50, 'categories': 10},
+    '100k': {'requests': 100_000, 'users': 2_000, 'categories': 30},
+    '1m': {'requests': 1_000_000, 'users': 20_000, 'categories': 50},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Замерить все страницы catalog на синтетических данных во временной SQLite-базе: '
+        'p50/p95, число запросов к БД, пик памяти. Завершается с ошибкой при превышении бюджета.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='1k', help='Размер набора данных')
+        parser.add_argument('--requests', type=int, help='Число заявок (вместо --scale)')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора данных')
+        parser.add_argument('--iterations', type=int, default=20, help='Запросов на каждую страницу')
+        parser.add_argument('--output', default='bench_results.json', help='Файл для результатов в JSON')
+        parser.add_argument('--budgets', help='JSON-файл с бюджетами {"home": {"p95_ms": 50, "queries": 3}}')
+        parser.add_argument('--keepdb', action='store_true', help='Не удалять тестовую базу после прогона')
+
+    def handle(self, *args, **options):
+        scale = dict(SCALES[options['scale']])
+        if options['requests'] is not None:
+            scale['requests'] = options['requests']
+        budgets = None
+        if options['budgets']:
+            with open(options['budgets'], encoding='utf-8') as f:
+                budgets = json.load(f)
+
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        # Отдельная файловая база: рабочие данные не затрагиваются
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if not test_settings.get('NAME'):
+            test_settings['NAME'] = f'bench_{options["scale"]}.sqlite3'
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        # Картинки и превью синтетических заявок — во временный каталог, не в рабочий MEDIA_ROOT
+        media_root = tempfile.mkdtemp(prefix='bench-media-')
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        try:
+            started = time.monotonic()
+            benchmarks.generate(
+                seed=options['seed'],
+                progress=lambda n: self.stdout.write(f'Создано заявок: {n}') if options['verbosity'] > 1 else None,
+                **scale,
+            )
+            self.stdout.write(f'Данные: {scale["requests"]} заявок за {time.monotonic() - started:.1f} с')
+            results = benchmarks.measure(iterations=options['iterations'])
+        finally:
+            media_override.disable()
+            shutil.rmtree(media_root, ignore_errors=True)
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:24} {result["status"]}  p50 {result["p50_ms"]:8.2f} мс  p95 {result["p95_ms"]:8.2f} мс  '
+                f'запросов {result["queries"]:3}  память {result["peak_memory_kb"]:9.1f} КБ'
+            )
+        violations = benchmarks.check_budgets(results, budgets)
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump({
+                'scale': scale,
+                'seed': options['seed'],
+                'iterations': options['iterations'],
+                'results': results,
+                'violations': [
+                    {'page': page, 'metric': metric, 'value': value, 'budget': limit}
+                    for page, metric, value, limit in violations
+                ],
+            }, f, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Результаты записаны в {options["output"]}')
+
+        if violations:
+            for page, metric, value, limit in violations:
+                self.stderr.write(f'{page}: {metric} = {value} > {limit}')
+            raise CommandError(f'Превышен бюджет производительности: {len(violations)}')
+        self.stdout.write(self.style.SUCCESS('Все страницы уложились в бюджет.'))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from catalog import outbox
+
+
+class Command(BaseCommand):
+    help = 'Отправлять клиентам уведомления о смене статуса заявок из очереди (outbox)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Событий в одной пачке (OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--interval', type=float, default=5.0, help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument('--once', action='store_true', help='Разобрать очередь и завершиться')
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        total_sent = total_failed = 0
+        try:
+            while True:
+                processed, sent, failed = outbox.drain(connection, options['batch_size'])
+                total_sent += sent
+                total_failed += failed
+                if processed and options['verbosity'] > 1:
+                    self.stdout.write(f'Событий: {processed}, отправлено: {sent}, ошибок: {failed}')
+                if processed and not failed:
+                    continue
+                if options['once']:
+                    break
+                # Очередь пуста (или SMTP недоступен): не держим соединение открытым
+                connection.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+        self.stdout.write(self.style.SUCCESS(f'Отправлено писем: {total_sent}, ошибок: {total_failed}'))
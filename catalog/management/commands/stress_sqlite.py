@@ -0,0 +1,127 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from catalog import counters
+from catalog.db import read_alias, read_only_database
+from catalog.models import Category, CustomUser, DesignRequest
+from catalog.pagination import paginate_keyset
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочная проверка SQLite: параллельные писатели и читатели во временной базе. '
+        'Завершается с ошибкой, если хоть одна операция получила «database is locked».'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Потоков записи')
+        parser.add_argument('--readers', type=int, default=8, help='Потоков чтения')
+        parser.add_argument('--duration', type=float, default=10.0, help='Длительность в секундах')
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if not test_settings.get('NAME'):
+            test_settings['NAME'] = 'stress.sqlite3'
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # Соединение только для чтения смотрит в ту же временную базу
+        if read_alias():
+            connections[read_alias()].creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            self.client = CustomUser.objects.create_user('stress', password='stress', full_name='Нагрузка')
+            self.category = Category.objects.create(name='Нагрузка')
+            connections.close_all()
+            stats = self.run_threads(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        journal = stats['journal_mode']
+        self.stdout.write(f'Режим журнала: {journal}')
+        for kind in ('write', 'read'):
+            ops, locked, other = stats[kind]
+            self.stdout.write(
+                f'{kind:5}: операций {ops:6} ({ops / options["duration"]:8.1f}/с), '
+                f'блокировок {locked}, других ошибок {other}'
+            )
+        maintained, actual = stats['counters']
+        mismatched = {
+            status: (count, actual.get(status, 0))
+            for status, count in maintained.items() if count != actual.get(status, 0)
+        }
+        for status, (count, expected) in mismatched.items():
+            self.stderr.write(f'Счётчик {status}: {count}, заявок {expected}')
+        locked = stats['write'][1] + stats['read'][1]
+        if locked:
+            raise CommandError(f'Ошибок «database is locked»: {locked}')
+        if mismatched:
+            raise CommandError('Счётчики статусов разошлись с данными')
+        self.stdout.write(self.style.SUCCESS('Ошибок блокировки нет.'))
+
+    def run_threads(self, options):
+        deadline = time.monotonic() + options['duration']
+        lock = threading.Lock()
+        stats = {'write': [0, 0, 0], 'read': [0, 0, 0]}
+
+        def worker(kind, operation):
+            counted = [0, 0, 0]
+            step = 0
+            try:
+                while time.monotonic() < deadline:
+                    try:
+                        operation(step)
+                        counted[0] += 1
+                    except OperationalError as exc:
+                        counted[1 if 'locked' in str(exc) else 2] += 1
+                    step += 1
+            finally:
+                connections.close_all()
+                with lock:
+                    for i in range(3):
+                        stats[kind][i] += counted[i]
+
+        threads = [
+            threading.Thread(target=worker, args=('write', self.write_step)) for _ in range(options['writers'])
+        ] + [
+            threading.Thread(target=worker, args=('read', self.read_step)) for _ in range(options['readers'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            stats['journal_mode'] = cursor.fetchone()[0]
+        # Счётчики статусов должны сойтись с фактическим числом заявок
+        stats['counters'] = (
+            {status: counters.status_count(status) for status, _label in DesignRequest.STATUS_CHOICES},
+            dict(counters.rebuild()),
+        )
+        return stats
+
+    def write_step(self, step):
+        # Создание заявки, взятие в работу и правка — как при обычной работе сайта
+        request = DesignRequest.objects.create(
+            title=f'Заявка {step}',
+            description='Нагрузочная проверка',
+            client=self.client,
+            category=self.category,
+            plan_image='plans/stress.png',
+        )
+        DesignRequest.objects.filter(pk=request.pk).take_to_work('В работе')
+        request.refresh_from_db()
+        request.description = 'Обновлено'
+        request.save()
+
+    @read_only_database
+    def read_step(self, step):
+        page = paginate_keyset(DesignRequest.objects.filter(client=self.client).select_related('category'))
+        list(page.object_list)
+        counters.status_count('in_progress')
@@ -0,0 +1,158 @@
+"""
+Выдача изображений заявок с проверкой доступа.
+
+Ссылки на планы и дизайны ведут на представление request_image, которое
+проверяет права так же, как request_detail, а сам файл отдаёт одним из
+способов (MEDIA_SERVE_MODE):
+
+- 'nginx' — заголовок X-Accel-Redirect, файл отдаёт nginx::
+
+      location /protected-media/ {
+          internal;
+          alias /srv/design-pro/media/;
+      }
+
+- 'sendfile' — заголовок X-Sendfile (Apache mod_xsendfile, lighttpd);
+- 'python' — сам Django: FileResponse (sendfile через wsgi.file_wrapper),
+  Range-запросы и If-Modified-Since. Для разработки и тестов.
+
+Каталог MEDIA_ROOT при этом не должен быть открыт фронтенд-сервером напрямую.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.static import was_modified_since
+
+IMAGE_FIELDS = ('plan_image', 'design_image')
+STREAM_BLOCK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def image_url(field_file, width=None, fmt=None):
+    """URL изображения заявки (или его превью) через проверку доступа"""
+    if not field_file:
+        return ''
+    url = reverse('request-image', args=[field_file.instance.pk, field_file.field.name])
+    params = {}
+    if width is not None:
+        params['w'] = width
+        params['fmt'] = fmt or 'jpg'
+    return f'{url}?{urlencode(params)}' if params else url
+
+
+def can_view_image(user, design_request, field):
+    """Владелец и администраторы видят всё; готовый дизайн показывается на главной всем"""
+    if user.is_authenticated and (user.is_staff or design_request.client_id == user.pk):
+        return True
+    return field == 'design_image' and design_request.status == 'completed'
+
+
+def serve_mode():
+    return getattr(settings, 'MEDIA_SERVE_MODE', 'python')
+
+
+def serve(request, storage, name):
+    """Отдать файл хранилища способом из MEDIA_SERVE_MODE"""
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    mode = serve_mode()
+    if mode == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + quote(name)
+        return response
+    if mode == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = storage.path(name)
+        return response
+    return _serve_python(request, storage.path(name), content_type)
+
+
+def serve_cold(request, name):
+    """
+    Файл архивной заявки из холодного хранилища. Отдаёт всегда Django:
+    сжатые копии распаковываются на лету, поэтому без Range.
+    """
+    from .archive import COMPRESSED_SUFFIX, cold_storage, open_cold
+
+    original = name[:-len(COMPRESSED_SUFFIX)] if name.endswith(COMPRESSED_SUFFIX) else name
+    content_type = mimetypes.guess_type(original)[0] or 'application/octet-stream'
+    mtime = cold_storage().get_modified_time(name).timestamp()
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), mtime):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open_cold(name), content_type=content_type)
+    response['Last-Modified'] = http_date(mtime)
+    return response
+
+
+def _serve_python(request, path, content_type):
+    stat = os.stat(path)
+    last_modified = http_date(stat.st_mtime)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        response = HttpResponseNotModified()
+        response['Last-Modified'] = last_modified
+        return response
+
+    byte_range = _parse_range(request, stat.st_size, stat.st_mtime)
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+    elif byte_range is not None:
+        start, end = byte_range
+        f = open(path, 'rb')
+        f.seek(start)
+        response = StreamingHttpResponse(_read_range(f, end - start + 1), status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    else:
+        # Целиком — FileResponse: сервер может отдать файл через sendfile
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['Last-Modified'] = last_modified
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _parse_range(request, size, mtime):
+    """(start, end) для одного диапазона, 'unsatisfiable' или None — отдать файл целиком"""
+    header = request.META.get('HTTP_RANGE')
+    if not header or request.method != 'GET':
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and parse_http_date_safe(if_range) != int(mtime):
+        return None  # файл изменился — клиенту нужен новый целиком
+    match = _RANGE_RE.match(header.strip())
+    if match is None:
+        return None  # несколько диапазонов не поддерживаем — это допустимо
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500 — последние 500 байт
+        length = int(last)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def _read_range(f, remaining):
+    try:
+        while remaining > 0:
+            chunk = f.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
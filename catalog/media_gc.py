@@ -0,0 +1,196 @@
+"""
+Сборка осиротевших файлов изображений (команда gc_media).
+
+Обычно файл удаляется сразу после коммита, когда на него не остаётся
+ссылок (storage.release). Сиротами становятся файлы, записанные до
+подсчёта ссылок, превью удалённых оригиналов, недописанные загрузки,
+копии холодного хранилища, на которые больше не ссылается архив, и все
+файлы при MEDIA_DELETE_ON_COMMIT = False.
+
+Имена, на которые ссылаются заявки, читаются из БД пачками в компактное
+множество: 8-байтовые хэши имён, а не строки. MEDIA_ROOT общий с
+хранилищем по умолчанию, поэтому обходятся только каталоги изображений
+заявок (cas/ и каталоги upload_to; превью лежат рядом с оригиналами) и
+временные файлы записи в корне — os.scandir, без списка всех файлов.
+Сиротой считается файл без ссылки, который не менялся дольше grace:
+свежий файл может принадлежать ещё не закоммиченной заявке. Перед
+удалением ссылки перепроверяются в БД.
+"""
+import hashlib
+import os
+import re
+import shutil
+import time
+
+from django.apps import apps
+from django.db.models import Q
+
+from .images import DERIVATIVE_WIDTHS
+from .storage import BLOB_PREFIX, TEMP_PREFIX
+
+CHECK_BATCH = 500
+
+_DERIVATIVE_RE = re.compile(r'^(?P<root>.+)_(?P<width>\d+)w\.(?:jpg|webp)$')
+
+
+def _key(name):
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'big')
+
+
+def _root(name):
+    return os.path.splitext(name)[0]
+
+
+class References:
+    """Имена файлов и корни имён (для превью) в виде хэшей"""
+
+    def __init__(self):
+        self.names = set()
+        self.roots = set()
+
+    def add(self, name):
+        self.names.add(_key(name))
+        self.roots.add(_key(_root(name)))
+
+    def __contains__(self, name):
+        if _key(name) in self.names:
+            return True
+        match = _DERIVATIVE_RE.match(name)
+        return (
+            match is not None and int(match['width']) in DERIVATIVE_WIDTHS
+            and _key(match['root']) in self.roots
+        )
+
+
+def _sources(cold):
+    """(queryset, поля) со ссылками на файлы горячего или холодного хранилища"""
+    DesignRequest = apps.get_model('catalog', 'DesignRequest')
+    ArchivedRequest = apps.get_model('catalog', 'ArchivedRequest')
+    fields = ('plan_image', 'design_image')
+    if cold:
+        return [(ArchivedRequest.objects.filter(cold=True), fields)]
+    return [
+        (DesignRequest.objects.all(), fields),
+        (ArchivedRequest.objects.filter(cold=False), fields),
+        (apps.get_model('catalog', 'MediaBlob').objects.filter(refcount__gt=0), ('name',)),
+    ]
+
+
+def load_references(cold=False, chunk_size=5000):
+    references = References()
+    for queryset, fields in _sources(cold):
+        for row in queryset.order_by().values_list(*fields).iterator(chunk_size=chunk_size):
+            for name in row:
+                if name:
+                    references.add(name)
+    return references
+
+
+def still_referenced(names, cold=False):
+    """
+    Какие из имён-кандидатов получили ссылку, пока шёл обход. Превью занято,
+    если ссылку получил его оригинал, — как в References.__contains__.
+    """
+    names = list(names)
+    # Корень имени оригинала → его превью среди кандидатов
+    derivatives = {}
+    for name in names:
+        match = _DERIVATIVE_RE.match(name)
+        if match is not None and int(match['width']) in DERIVATIVE_WIDTHS:
+            derivatives.setdefault(match['root'], []).append(name)
+    found = set()
+    for queryset, fields in _sources(cold):
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f'{field}__in': names})
+            for root in derivatives:
+                condition |= Q(**{f'{field}__startswith': root + '.'})
+        for row in queryset.filter(condition).values_list(*fields):
+            for name in row:
+                if name:
+                    found.add(name)
+                    found.update(derivatives.get(_root(name), ()))
+    return found
+
+
+def image_dirs():
+    """Каталоги верхнего уровня, куда пишутся изображения заявок и их превью"""
+    dirs = {BLOB_PREFIX}
+    for field in ('plan_image', 'design_image'):
+        upload_to = apps.get_model('catalog', 'DesignRequest')._meta.get_field(field).upload_to
+        dirs.add(upload_to.split('/', 1)[0])
+    return sorted(dirs)
+
+
+def walk(location, dirs=None):
+    """
+    (относительный путь, DirEntry) для файлов в каталогах dirs (по умолчанию
+    image_dirs()) и временных файлов записи в корне хранилища
+    """
+    try:
+        with os.scandir(location) as entries:
+            for entry in entries:
+                if entry.name.startswith(TEMP_PREFIX) and entry.is_file(follow_symlinks=False):
+                    yield entry.name, entry
+    except FileNotFoundError:
+        return
+    stack = list(image_dirs() if dirs is None else dirs)
+    while stack:
+        relative = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(location, relative))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                path = f'{relative}/{entry.name}' if relative else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield path, entry
+
+
+def collect(location, references, grace, cold=False, dry_run=False, quarantine=None, progress=None):
+    """
+    Удалить (или перенести в quarantine) сирот старше grace секунд.
+    Возвращает словарь: scanned, orphans, bytes.
+    """
+    stats = {'scanned': 0, 'orphans': 0, 'bytes': 0}
+    deadline = time.time() - grace
+    candidates = {}
+
+    def flush():
+        referenced = still_referenced(candidates, cold)
+        for name, (path, size) in candidates.items():
+            if name in referenced:
+                continue
+            stats['orphans'] += 1
+            stats['bytes'] += size
+            if dry_run:
+                continue
+            if quarantine:
+                target = os.path.join(quarantine, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        candidates.clear()
+
+    for name, entry in walk(location):
+        stats['scanned'] += 1
+        if progress is not None and stats['scanned'] % 10000 == 0:
+            progress(stats)
+        if name in references:
+            continue
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime > deadline:
+            continue
+        candidates[name] = (entry.path, stat.st_size)
+        if len(candidates) >= CHECK_BATCH:
+            flush()
+    if candidates:
+        flush()
+    return stats
@@ -0,0 +1,380 @@
+"""
+Метрики обработки запросов в формате Prometheus.
+
+MetricsMiddleware на каждый запрос замеряет полное время, число и время
+запросов к БД, время рендеринга шаблонов и размер ответа и кладёт их в
+гистограммы с меткой view (имя URL: home, admin-all-requests, ...).
+Время шаблонов замеряет бэкенд TimedDjangoTemplates (TEMPLATES в
+настройках).
+
+Гистограммы — это счётчики по фиксированным корзинам, поэтому значения
+разных процессов просто складываются. Если задан METRICS_DIR (каталог
+одного хоста), каждый процесс раз в METRICS_FLUSH_INTERVAL секунд
+сохраняет свой снимок в metrics-<pid>-<token>.json; token уникален для
+запуска, и процесс с повторно выданным pid не затрёт чужие счётчики.
+/metrics/ суммирует все снимки каталога, а снимки завершившихся
+процессов переносит в base.json и удаляет: файлы не копятся, счётчики
+только растут.
+"""
+import contextvars
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files import locks
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+slow_logger = logging.getLogger('catalog.slow_requests')
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HISTOGRAMS = {
+    'catalog_request_duration_seconds': ('Полное время обработки запроса', SECONDS_BUCKETS),
+    'catalog_request_db_queries': ('Число запросов к БД на один запрос', QUERY_BUCKETS),
+    'catalog_request_db_duration_seconds': ('Суммарное время запросов к БД', SECONDS_BUCKETS),
+    'catalog_request_template_duration_seconds': ('Время рендеринга шаблонов', SECONDS_BUCKETS),
+    'catalog_response_size_bytes': ('Размер тела ответа', BYTES_BUCKETS),
+}
+REQUESTS_TOTAL = 'catalog_requests_total'
+
+# SQL медленного запроса хранится не полностью — только первые выражения
+MAX_RECORDED_SQL = 100
+
+SNAPSHOT_PREFIX = 'metrics-'
+BASE_SNAPSHOT = 'base.json'
+COLLECT_LOCK = 'collect.lock'
+
+# Замеры текущего запроса; contextvars передаются и в потоки sync_to_async
+_current = contextvars.ContextVar('catalog_request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.sql = []
+        self._template_depth = 0
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        if len(self.sql) < MAX_RECORDED_SQL:
+            self.sql.append((sql, duration))
+
+
+def start_request():
+    """Начать сбор замеров; возвращает объект статистики и токен для finish_request"""
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+class Registry:
+    """Гистограммы и счётчики одного процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.token = uuid.uuid4().hex
+        self.histograms = {}
+        self.counters = {}
+        self.last_flush = 0.0
+
+    def _check_fork(self):
+        # После fork воркер не должен повторно отдавать данные родителя
+        if self.pid != os.getpid():
+            self._reset()
+
+    def observe(self, name, view, value):
+        buckets = HISTOGRAMS[name][1]
+        with self._lock:
+            self._check_fork()
+            data = self.histograms.setdefault((name, view), [[0] * len(buckets), 0.0, 0])
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    data[0][i] += 1
+                    break
+            data[1] += value
+            data[2] += 1
+
+    def increment(self, name, labels):
+        with self._lock:
+            self._check_fork()
+            key = (name, tuple(sorted(labels.items())))
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            return _as_snapshot(self.histograms, self.counters)
+
+    def flush_due(self):
+        return metrics_dir() is not None and (
+            time.monotonic() - self.last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+        )
+
+    def flush(self, force=False):
+        """Сохранить снимок процесса в METRICS_DIR (не чаще METRICS_FLUSH_INTERVAL)"""
+        directory = metrics_dir()
+        if directory is None or not (force or self.flush_due()):
+            return
+        self.last_flush = time.monotonic()
+        snapshot = self.snapshot()
+        _write_snapshot(directory, f'{SNAPSHOT_PREFIX}{self.pid}-{self.token}.json', snapshot)
+
+
+registry = Registry()
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def _as_snapshot(histograms, counters):
+    return {
+        'histograms': [
+            [name, view, list(data[0]), data[1], data[2]]
+            for (name, view), data in histograms.items()
+        ],
+        'counters': [[name, [list(label) for label in labels], value] for (name, labels), value in counters.items()],
+    }
+
+
+def _write_snapshot(directory, name, snapshot):
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, os.path.join(directory, name))
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # файл пишется прямо сейчас — возьмём в следующий раз
+
+
+def _snapshot_pid(filename):
+    # metrics-<pid>-<token>.json; None — чужой файл
+    if not (filename.startswith(SNAPSHOT_PREFIX) and filename.endswith('.json')):
+        return None
+    try:
+        return int(filename[len(SNAPSHOT_PREFIX):-len('.json')].split('-')[0])
+    except ValueError:
+        return None
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # процесс есть, но чужой
+    return True
+
+
+def _collect_snapshots():
+    directory = metrics_dir()
+    if directory is None:
+        return [registry.snapshot()]
+    registry.flush(force=True)
+    with open(os.path.join(directory, COLLECT_LOCK), 'a') as lock:
+        # Один сборщик за раз: снимок завершившегося процесса переносится
+        # в base.json ровно один раз и не считается одновременно в двух файлах
+        locks.lock(lock, locks.LOCK_EX)
+        base_path = os.path.join(directory, BASE_SNAPSHOT)
+        base = _read_snapshot(base_path)
+        snapshots, finished = [], []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                pid = _snapshot_pid(entry.name)
+                if pid is None:
+                    continue
+                snapshot = _read_snapshot(entry.path)
+                if snapshot is None:
+                    continue
+                if pid == os.getpid() or _process_alive(pid):
+                    snapshots.append(snapshot)
+                else:
+                    finished.append((entry.path, snapshot))
+        if finished:
+            base = _as_snapshot(*_merge(([base] if base else []) + [s for _path, s in finished]))
+            _write_snapshot(directory, BASE_SNAPSHOT, base)
+            for path, _snapshot in finished:
+                os.remove(path)
+    return ([base] if base else []) + snapshots
+
+
+def _merge(snapshots):
+    histograms, counters = {}, {}
+    for snapshot in snapshots:
+        for name, view, buckets, total, count in snapshot['histograms']:
+            if name not in HISTOGRAMS:
+                continue
+            data = histograms.setdefault((name, view), [[0] * len(buckets), 0.0, 0])
+            data[0] = [a + b for a, b in zip(data[0], buckets)]
+            data[1] += total
+            data[2] += count
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+    return histograms, counters
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    return '+Inf' if math.isinf(bound) else repr(float(bound))
+
+
+def render_prometheus():
+    """Текстовый формат Prometheus по данным всех процессов"""
+    histograms, counters = _merge(_collect_snapshots())
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for (metric, view), (counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            label = f'view="{_escape(view)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{label},le="{_format_bound(bound)}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{{label}}} {total}')
+            lines.append(f'{name}_count{{{label}}} {count}')
+    lines.append(f'# HELP {REQUESTS_TOTAL} Число обработанных запросов')
+    lines.append(f'# TYPE {REQUESTS_TOTAL} counter')
+    for (name, labels), value in sorted(counters.items()):
+        label = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+        lines.append(f'{name}{{{label}}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def record(request, response, stats, duration):
+    """
+    Положить замеры запроса в гистограммы и при необходимости записать в
+    лог медленных. Снимок на диск сохраняет вызывающий: registry.flush()
+    """
+    match = getattr(request, 'resolver_match', None)
+    view = (match.url_name or match.view_name) if match is not None else 'unmatched'
+    registry.observe('catalog_request_duration_seconds', view, duration)
+    registry.observe('catalog_request_db_queries', view, stats.queries)
+    registry.observe('catalog_request_db_duration_seconds', view, stats.db_time)
+    registry.observe('catalog_request_template_duration_seconds', view, stats.template_time)
+    size = _response_size(response)
+    if size is not None:
+        registry.observe('catalog_response_size_bytes', view, size)
+    registry.increment(REQUESTS_TOTAL, {'view': view, 'status': str(response.status_code)})
+
+    threshold = getattr(settings, 'METRICS_SLOW_REQUEST_MS', 500)
+    if threshold is not None and duration * 1000 >= threshold:
+        statements = '\n'.join(f'  {elapsed * 1000:.1f} мс  {sql}' for sql, elapsed in stats.sql)
+        omitted = stats.queries - len(stats.sql)
+        if omitted > 0:
+            statements += f'\n  ... и ещё {omitted}'
+        slow_logger.warning(
+            'Медленный запрос %s %s (%s): %.0f мс, %d запросов к БД за %.0f мс, шаблоны %.0f мс\n%s',
+            request.method, request.path, view, duration * 1000,
+            stats.queries, stats.db_time * 1000, stats.template_time * 1000, statements,
+        )
+
+
+def _response_size(response):
+    if getattr(response, 'streaming', False):
+        length = response.get('Content-Length')
+        return int(length) if length else None
+    return len(response.content)
+
+
+def _execute_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+def _instrument_connection(connection, **kwargs):
+    if _execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_wrapper)
+
+
+class TimedTemplate:
+    """Шаблон DjangoTemplates, время рендеринга которого попадает в замеры запроса"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return self.template.render(context, request)
+        # Вложенный рендер (render_to_string внутри тега) уже учтён внешним
+        stats._template_depth += 1
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats._template_depth -= 1
+            if not stats._template_depth:
+                stats.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    Бэкенд шаблонов Django с замером времени рендеринга:
+    'BACKEND': 'catalog.metrics.TimedDjangoTemplates'
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def install():
+    """Подключить замеры к соединениям с БД (один раз на процесс)"""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        connection_created.connect(_instrument_connection, dispatch_uid='catalog.metrics')
+        for connection in connections.all(initialized_only=True):
+            _instrument_connection(connection)
+        _installed = True
@@ -0,0 +1,91 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from . import metrics, ratelimit
+
+
+class MetricsMiddleware:
+    """
+    Замеры каждого запроса для /metrics/ (catalog.metrics).
+    Ставится первым в MIDDLEWARE, чтобы учитывать время всей цепочки.
+    Работает и с синхронными, и с асинхронными представлениями.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        metrics.install()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        metrics.record(request, response, stats, time.perf_counter() - started)
+        metrics.registry.flush()
+        return response
+
+    async def __acall__(self, request):
+        stats, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        metrics.record(request, response, stats, time.perf_counter() - started)
+        # Запись снимка — файловый ввод-вывод: не в цикле событий
+        if metrics.registry.flush_due():
+            await sync_to_async(metrics.registry.flush, thread_sensitive=False)()
+        return response
+
+
+class RateLimitMiddleware:
+    """
+    Лимиты частоты и допуск загрузок (catalog.ratelimit).
+    Ставится после AuthenticationMiddleware: __call__ выполняется до
+    process_view всей цепочки, то есть до того, как CsrfViewMiddleware
+    или представление прочитают тело запроса.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        refused, slot = ratelimit.admit(request)
+        if refused is not None:
+            return refused
+        try:
+            return self.get_response(request)
+        finally:
+            if slot is not None:
+                ratelimit.release_upload_slot(slot)
+
+    async def __acall__(self, request):
+        if request.method in ratelimit.SAFE_METHODS:
+            return await self.get_response(request)
+        refused, slot = await sync_to_async(ratelimit.admit)(request)
+        if refused is not None:
+            return refused
+        try:
+            return await self.get_response(request)
+        finally:
+            if slot is not None:
+                await sync_to_async(ratelimit.release_upload_slot)(slot)
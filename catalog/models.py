@@ -1,9 +1,18 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator, FileExtensionValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 import uuid
+from collections import Counter
+
+from .images import schedule_derivatives
+from .storage import request_image_storage
+from . import counters
+from . import outbox
+from . import rollups
+from . import storage as blobs
 
 
 def complete(self, design_image):
@@ -62,7 +71,9 @@ class Category(models.Model):
         verbose_name=_('Название категории'),
         help_text=_("Например: 3D-дизайн, Эскиз и т.д.")
     )
-
+    # Категория удаляется в фоне пачками заявок (catalog.deletion)
+    deleting = models.BooleanField(default=False, verbose_name=_('Удаляется'))
+    deletion_total = models.PositiveIntegerField(default=0, verbose_name=_('Заявок к удалению'))
 
     class Meta:
         verbose_name = _('Категория')
@@ -72,6 +83,81 @@ class Category(models.Model):
         return self.name
 
 
+class DesignRequestQuerySet(models.QuerySet):
+    """
+    Переходы статусов одним условным UPDATE (WHERE status IN (...)):
+    из двух администраторов, принимающих одну заявку, применится только
+    один переход. Методы возвращают число изменённых заявок.
+    """
+
+    def take_to_work(self, comment, assignee=None):
+        """
+        Принять в работу все новые заявки выборки; assignee становится
+        исполнителем, аренда из очереди больше не нужна.
+        """
+        changes = {'assignee': assignee} if assignee is not None else {}
+        with transaction.atomic():
+            now = timezone.now()
+            updated = self.filter(status='new').update(
+                status='in_progress', admin_comment=comment, taken_at=now, updated_at=now,
+                claimed_until=None, **changes
+            )
+            counters.adjust('new', -updated)
+            counters.adjust('in_progress', updated)
+            if updated:
+                rollups.record_transition('in_progress', now)
+                outbox.record_transition('in_progress', now)
+        return updated
+
+    def complete(self, design_image):
+        """
+        Завершить заявки выборки в статусах 'new' и 'in_progress'.
+        Файл дизайна сохраняется один раз и становится общим для всех
+        завершённых заявок.
+        """
+        if not design_image:
+            return 0  # изображение обязательно при завершении
+        field = self.model._meta.get_field('design_image')
+
+        updated = 0
+        with transaction.atomic():
+            if isinstance(design_image, str):
+                name = design_image
+            else:
+                # В той же транзакции, что и retain(): блоб заблокирован до
+                # коммита, и удаление старых ссылок не заберёт его файл
+                name = field.generate_filename(None, design_image.name)
+                name = field.storage.save(name, design_image, max_length=field.max_length)
+            # Прежние файлы дизайна (заданные вручную или оставшиеся после
+            # возврата заявки) теряют ссылки; строки блокируются до UPDATE
+            replaced = Counter(
+                self.select_for_update().filter(status__in=('new', 'in_progress'))
+                .exclude(design_image='').exclude(design_image__isnull=True)
+                .values_list('design_image', flat=True)
+            )
+            now = timezone.now()
+            for status in ('new', 'in_progress'):
+                moved = self.filter(status=status).update(
+                    status='completed', design_image=name, completed_at=now, updated_at=now,
+                    claimed_until=None
+                )
+                counters.adjust(status, -moved)
+                updated += moved
+            counters.adjust('completed', updated)
+            if updated:
+                blobs.retain(name, updated)
+                for old_name, count in replaced.items():
+                    blobs.release(old_name, field.storage, count)
+                counters.invalidate_latest_completed()
+                rollups.record_transition('completed', now)
+                outbox.record_transition('completed', now)
+        if updated:
+            schedule_derivatives(field.attr_class(None, field, name))
+        else:
+            blobs.discard_if_unused(name, field.storage)
+        return updated
+
+
 class DesignRequest(models.Model):
     STATUS_CHOICES = (
         ('new', _('Новая')),
@@ -104,11 +190,13 @@ class DesignRequest(models.Model):
     )
     plan_image = models.ImageField(
         upload_to='plans/%Y/%m/%d/',
+        storage=request_image_storage,
         verbose_name=_('План помещения'),
         validators=[validate_image_file]
     )
     design_image = models.ImageField(
         upload_to='designs/%Y/%m/%d/',
+        storage=request_image_storage,
         verbose_name=_('Готовый дизайн'),
         blank=True,
         null=True,
@@ -120,6 +208,20 @@ class DesignRequest(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Дата создания'))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_('Дата обновления'))
+    # Моменты переходов — для аналитики (catalog.rollups)
+    taken_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name=_('Принята в работу'))
+    completed_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name=_('Выполнена'))
+    # Очередь дизайнеров (catalog.queue): кто взял заявку и до какого
+    # момента; новая заявка с истёкшим сроком снова свободна
+    assignee = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='assigned_requests',
+        verbose_name=_('Исполнитель')
+    )
+    claimed_until = models.DateTimeField(null=True, blank=True, editable=False, verbose_name=_('Взята до'))
 
     id = models.UUIDField(
         primary_key=True,
@@ -128,8 +230,25 @@ class DesignRequest(models.Model):
         verbose_name=_('Уникальный ID заявки')
     )
 
+    objects = DesignRequestQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Ключи keyset-пагинации списков заявок
+            models.Index(fields=['status', '-created_at'], name='request_status_created_idx'),
+            models.Index(fields=['client', 'status', '-created_at'], name='request_client_status_idx'),
+            # Валидаторы условных GET: самая свежая правка в списке
+            models.Index(fields=['updated_at'], name='request_updated_idx'),
+            # Очередь: самая старая новая заявка категории (catalog.queue)
+            models.Index(
+                fields=['category', 'created_at'],
+                condition=models.Q(status='new'),
+                name='request_queue_category_idx'
+            ),
+            # «Моя очередь» дизайнера
+            models.Index(fields=['assignee', 'status'], name='request_assignee_status_idx'),
+        ]
         verbose_name = _('Заявка')
         verbose_name_plural = _('Заявки')
         permissions = (
@@ -140,31 +259,245 @@ class DesignRequest(models.Model):
     def __str__(self):
         return f"{self.title} ({self.get_status_display()})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем статус и файлы из БД, чтобы save() мог обновить
+        # счётчики и ссылки на блобы
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_images = instance.image_names()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # Значения из БД снова совпадают с загруженными — иначе save() после
+        # условного UPDATE (take_to_work, complete) учёл бы переход дважды
+        if fields is None or 'status' in fields:
+            self._loaded_status = self.__dict__.get('status')
+        loaded_images = dict(getattr(self, '_loaded_images', {}))
+        for field, name in self.image_names().items():
+            if fields is None or field in fields:
+                loaded_images[field] = name
+        self._loaded_images = loaded_images
+
+    def image_names(self):
+        return {
+            field: getattr(self.__dict__.get(field), 'name', self.__dict__.get(field)) or ''
+            for field in ('plan_image', 'design_image')
+        }
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        previous = None if self._state.adding else getattr(self, '_loaded_status', None)
+        loaded_images = {} if self._state.adding else getattr(self, '_loaded_images', {})
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'status' in update_fields:
+            stamped = self._stamp_transition(previous)
+            if stamped and update_fields is not None:
+                kwargs['update_fields'] = update_fields = list(update_fields) + stamped
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous is None and update_fields is None:
+                counters.record_created(self)
+                if adding:
+                    rollups.record_created(self)
+            elif update_fields is None or 'status' in update_fields:
+                counters.record_status_change(self, previous)
+                rollups.record_status_change(self, previous)
+                outbox.record_status_change(self, previous)
+            else:
+                counters.record_changed(self)
+            current_images = self.image_names()
+            for field, name in current_images.items():
+                old_name = loaded_images.get(field, '')
+                if name != old_name and (update_fields is None or field in update_fields):
+                    blobs.retain(name)
+                    blobs.release(old_name, self._meta.get_field(field).storage)
+        self._loaded_status = self.status
+        self._loaded_images = current_images
+
+    def _stamp_transition(self, previous):
+        """Отметить время перехода в новый статус; возвращает изменённые поля"""
+        if self.status == previous:
+            return []
+        now = timezone.now()
+        if self.status == 'in_progress' and self.taken_at is None:
+            self.taken_at = now
+            return ['taken_at']
+        if self.status == 'completed' and self.completed_at is None:
+            self.completed_at = now
+            return ['completed_at']
+        return []
+
     @property
     def can_be_deleted(self):
         """Можно удалить, только если статус — 'Новая'"""
         return self.status == 'new'
 
-    def take_to_work(self, comment):
+    @property
+    def is_claimed(self):
+        """Новая заявка взята из очереди, и аренда ещё не истекла"""
+        return self.status == 'new' and self.claimed_until is not None and self.claimed_until > timezone.now()
+
+    def take_to_work(self, comment, assignee=None):
         """Принять заявку в работу"""
-        if self.status != 'new':
+        if not DesignRequest.objects.filter(pk=self.pk).take_to_work(comment, assignee):
             return False
-        self.status = 'in_progress'
+        self.status = self._loaded_status = 'in_progress'
         self.admin_comment = comment
-        self.save(update_fields=['status', 'admin_comment', 'updated_at'])
+        # Время перехода поставил UPDATE — иначе save() затёр бы его
+        self.refresh_from_db(fields=['taken_at', 'assignee', 'claimed_until'])
         return True
 
     def complete(self, design_image):
         """Завершить заявку: можно из 'new' или 'in_progress'"""
-        if self.status not in ('new', 'in_progress'):
-            return False
         if not design_image:
             return False  # изображение обязательно при завершении
-        self.status = 'completed'
-        self.design_image = design_image
-        self.save(update_fields=['status', 'design_image', 'updated_at'])
+        if not DesignRequest.objects.filter(pk=self.pk).complete(design_image):
+            return False
+        self.status = self._loaded_status = 'completed'
+        self.refresh_from_db(fields=['design_image', 'completed_at', 'claimed_until'])
         return True
 
     def get_absolute_url(self):
         from django.urls import reverse
-        return reverse('request-detail', args=[str(self.id)])
\ No newline at end of file
+        return reverse('request-detail', args=[str(self.id)])
+
+
+class ArchivedRequest(models.Model):
+    """
+    Выполненная заявка, перенесённая из DesignRequest командой
+    archive_requests. Живая таблица остаётся маленькой, а клиент и
+    request_detail находят заявку здесь по тому же id.
+    """
+    STATUS_CHOICES = DesignRequest.STATUS_CHOICES
+
+    id = models.UUIDField(primary_key=True, editable=False, verbose_name=_('Уникальный ID заявки'))
+    title = models.CharField(max_length=200, verbose_name=_('Название'))
+    description = models.TextField(verbose_name=_('Описание'))
+    client = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        verbose_name=_('Клиент'),
+        related_name='archived_requests'
+    )
+    # Категорию могут удалить — название сохраняется отдельно
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='+', verbose_name=_('Категория'))
+    category_name = models.CharField(max_length=200, verbose_name=_('Название категории'))
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='completed', verbose_name=_('Статус'))
+    plan_image = models.ImageField(storage=request_image_storage, verbose_name=_('План помещения'))
+    design_image = models.ImageField(storage=request_image_storage, blank=True, null=True, verbose_name=_('Готовый дизайн'))
+    admin_comment = models.TextField(blank=True, verbose_name=_('Комментарий администратора'))
+    created_at = models.DateTimeField(verbose_name=_('Дата создания'))
+    updated_at = models.DateTimeField(verbose_name=_('Дата обновления'))
+    taken_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Принята в работу'))
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Выполнена'))
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Дата архивации'))
+    # Файлы перенесены в холодное хранилище (catalog.archive), имена — его
+    cold = models.BooleanField(default=False, verbose_name=_('В холодном хранилище'))
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['client', '-created_at'], name='archived_client_created_idx'),
+        ]
+        verbose_name = _('Архивная заявка')
+        verbose_name_plural = _('Архивные заявки')
+
+    def __str__(self):
+        return f"{self.title} ({self.get_status_display()})"
+
+    @property
+    def can_be_deleted(self):
+        return False
+
+    def image_names(self):
+        return {
+            field: getattr(self.__dict__.get(field), 'name', self.__dict__.get(field)) or ''
+            for field in ('plan_image', 'design_image')
+        }
+
+    def get_absolute_url(self):
+        from django.urls import reverse
+        return reverse('request-detail', args=[str(self.id)])
+
+
+class StatusCounter(models.Model):
+    """Количество заявок в каждом статусе, поддерживается при изменениях"""
+    status = models.CharField(
+        max_length=20,
+        primary_key=True,
+        choices=DesignRequest.STATUS_CHOICES,
+        verbose_name=_('Статус')
+    )
+    count = models.PositiveIntegerField(default=0, verbose_name=_('Количество'))
+
+    class Meta:
+        verbose_name = _('Счётчик статуса')
+        verbose_name_plural = _('Счётчики статусов')
+
+    def __str__(self):
+        return f"{self.status}: {self.count}"
+
+
+class DailyRollup(models.Model):
+    """
+    Сводка за день по категории: сколько заявок перешло в статус и сумма
+    времени переходов. Строка 'new' дня создания хранит ещё и число заявок
+    этого дня, которые пока не выполнены, — из них строится возраст очереди.
+    """
+    day = models.DateField(verbose_name=_('День'))
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+', verbose_name=_('Категория'))
+    status = models.CharField(max_length=20, choices=DesignRequest.STATUS_CHOICES, verbose_name=_('Статус'))
+    count = models.PositiveIntegerField(default=0, verbose_name=_('Переходов'))
+    # Секунд от предыдущего этапа (создание или принятие в работу) и от создания
+    wait_seconds = models.FloatField(default=0, verbose_name=_('Время этапа, с'))
+    lead_seconds = models.FloatField(default=0, verbose_name=_('Время от создания, с'))
+    open_count = models.IntegerField(default=0, verbose_name=_('Не выполнено'))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category', 'status'], name='rollup_day_category_status_uniq'),
+        ]
+        verbose_name = _('Сводка за день')
+        verbose_name_plural = _('Сводки за день')
+
+    def __str__(self):
+        return f"{self.day} {self.category_id} {self.status}: {self.count}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Уведомление клиента о смене статуса заявки. Пишется в одной транзакции
+    с переходом, отправляется командой send_notifications.
+    """
+    request_id = models.UUIDField(verbose_name=_('Заявка'))
+    status = models.CharField(max_length=20, choices=DesignRequest.STATUS_CHOICES, verbose_name=_('Новый статус'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Создано'))
+    available_at = models.DateTimeField(default=timezone.now, verbose_name=_('Отправить не раньше'))
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name=_('Попыток'))
+    last_error = models.TextField(blank=True, verbose_name=_('Последняя ошибка'))
+
+    class Meta:
+        indexes = [
+            # Очередь отправки: готовые к попытке события по порядку
+            models.Index(fields=['available_at', 'id'], name='outbox_available_idx'),
+        ]
+        verbose_name = _('Уведомление')
+        verbose_name_plural = _('Уведомления')
+
+    def __str__(self):
+        return f"{self.request_id} → {self.status}"
+
+
+class MediaBlob(models.Model):
+    """Файл в хранилище и число заявок, которые на него ссылаются"""
+    name = models.CharField(max_length=255, primary_key=True, verbose_name=_('Путь к файлу'))
+    refcount = models.PositiveIntegerField(default=0, verbose_name=_('Число ссылок'))
+
+    class Meta:
+        verbose_name = _('Файл')
+        verbose_name_plural = _('Файлы')
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
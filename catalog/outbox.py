@@ -0,0 +1,145 @@
+"""
+Уведомления клиентов о смене статуса заявки через транзакционный outbox.
+
+Переход статуса (take_to_work, complete, save) пишет OutboxEvent в той же
+транзакции: откат перехода откатывает и уведомление, а представление
+администратора не ждёт SMTP. Команда send_notifications разбирает
+очередь пачками:
+
+- несколько событий одной заявки схлопываются в одно письмо о последнем
+  статусе (приняли и сразу выполнили — клиент получит одно письмо);
+- письма пачки уходят через одно SMTP-соединение, оно остаётся открытым,
+  пока в очереди есть события;
+- неудачная отправка повторяется с экспоненциальной задержкой, после
+  OUTBOX_MAX_ATTEMPTS попыток событие остаётся в таблице с текстом ошибки.
+
+Команда рассчитана на один экземпляр воркера.
+"""
+import logging
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .rollups import TRANSITION_STAMPS
+
+logger = logging.getLogger(__name__)
+
+SUBJECTS = {
+    'in_progress': 'Заявка «{title}» принята в работу',
+    'completed': 'Заявка «{title}» выполнена',
+}
+
+
+def _event_model():
+    return apps.get_model('catalog', 'OutboxEvent')
+
+
+def _request_model():
+    return apps.get_model('catalog', 'DesignRequest')
+
+
+def batch_size():
+    return getattr(settings, 'OUTBOX_BATCH_SIZE', 100)
+
+
+def max_attempts():
+    return getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: 30 с, 1 мин, 2 мин... не больше часа"""
+    base = getattr(settings, 'OUTBOX_RETRY_DELAY', 30)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 3600))
+
+
+def record_transition(status, at):
+    """События для заявок, которые условный UPDATE перевёл в status в момент at"""
+    OutboxEvent = _event_model()
+    ids = (
+        _request_model()._base_manager
+        .filter(**{TRANSITION_STAMPS[status]: at, 'status': status})
+        .values_list('pk', flat=True)
+    )
+    OutboxEvent.objects.bulk_create([OutboxEvent(request_id=pk, status=status) for pk in ids])
+
+
+def record_status_change(instance, previous):
+    if previous is not None and previous != instance.status and instance.status in SUBJECTS:
+        _event_model().objects.create(request_id=instance.pk, status=instance.status)
+
+
+def build_message(design_request, status):
+    context = {
+        'request': design_request,
+        'status': status,
+        'url': getattr(settings, 'SITE_URL', '').rstrip('/') + reverse('request-detail', args=[design_request.pk]),
+    }
+    return EmailMessage(
+        subject=SUBJECTS[status].format(title=design_request.title),
+        body=render_to_string('catalog/email/status_changed.txt', context),
+        to=[design_request.client.email],
+    )
+
+
+def drain(connection, size=None):
+    """
+    Отправить одну пачку готовых событий через открытое соединение.
+    Возвращает (обработано событий, отправлено писем, ошибок).
+    """
+    OutboxEvent = _event_model()
+    now = timezone.now()
+    events = list(
+        OutboxEvent.objects.filter(available_at__lte=now, attempts__lt=max_attempts())
+        .order_by('available_at', 'id')[:size or batch_size()]
+    )
+    if not events:
+        return 0, 0, 0
+
+    # Последнее событие каждой заявки; остальные письма уже неактуальны
+    latest = {}
+    for event in events:
+        if event.request_id not in latest or event.pk > latest[event.request_id].pk:
+            latest[event.request_id] = event
+    requests = _request_model().objects.select_related('client').in_bulk(list(latest))
+
+    done, failed, sent = [], [], 0
+    for request_id, event in latest.items():
+        design_request = requests.get(request_id)
+        if design_request is None or design_request.status != event.status or not design_request.client.email:
+            done.append(event)  # заявку удалили, статус уже другой или писать некуда
+            continue
+        try:
+            # Явно открытое соединение send_messages() не закрывает после письма
+            connection.open()
+            connection.send_messages([build_message(design_request, event.status)])
+        except Exception as exc:
+            logger.warning('Не удалось отправить уведомление %s: %s', event.pk, exc)
+            # Следующая отправка откроет соединение заново
+            connection.close()
+            failed.append((event, exc))
+        else:
+            done.append(event)
+            sent += 1
+
+    with transaction.atomic():
+        # Вместе с отправленным удаляются и более ранние события заявки,
+        # в том числе отложенные повторы — иначе старый статус пришёл бы позже
+        for event in done:
+            OutboxEvent.objects.filter(request_id=event.request_id, pk__lte=event.pk).delete()
+        for event, exc in failed:
+            attempts = event.attempts + 1
+            OutboxEvent.objects.filter(request_id=event.request_id, pk__lte=event.pk).update(
+                attempts=F('attempts') + 1,
+                available_at=now + retry_delay(attempts),
+                last_error=str(exc)[:1000],
+            )
+            if attempts >= max_attempts():
+                logger.error('Уведомление %s не отправлено после %s попыток', event.pk, attempts)
+    return len(events), sent, len(failed)
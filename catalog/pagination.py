@@ -0,0 +1,110 @@
+import base64
+import binascii
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+PAGE_SIZE = 25
+
+
+def encode_cursor(direction, created_at, pk):
+    """Курсор страницы: направление + ключ (created_at, id) в base64"""
+    raw = f'{direction}|{created_at.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Разобрать курсор; для битого токена возвращает None"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, created_at, pk = base64.urlsafe_b64decode(padded).decode().split('|')
+        created_at = parse_datetime(created_at)
+        pk = uuid.UUID(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    if direction not in ('n', 'p') or created_at is None:
+        return None
+    return direction, created_at, pk
+
+
+def _row_key(row):
+    """Ключ (created_at, id) модели или строки values()"""
+    if isinstance(row, dict):
+        return row['created_at'], row['id']
+    return row.created_at, row.pk
+
+
+class KeysetPage:
+    """Страница keyset-пагинации с токенами соседних страниц"""
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    @property
+    def next_cursor(self):
+        if not self.has_next or not self.object_list:
+            return None
+        return encode_cursor('n', *_row_key(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous or not self.object_list:
+            return None
+        return encode_cursor('p', *_row_key(self.object_list[0]))
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def _page_query(queryset, decoded, per_page):
+    """Запрос страницы: один SELECT с LIMIT по индексу вместо OFFSET"""
+    if decoded is None:
+        return queryset.order_by('-created_at', '-id')[:per_page + 1]
+    direction, created_at, pk = decoded
+    if direction == 'n':
+        return queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        ).order_by('-created_at', '-id')[:per_page + 1]
+    return queryset.filter(
+        Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+    ).order_by('created_at', 'id')[:per_page + 1]
+
+
+def _make_page(rows, decoded, per_page):
+    if decoded is None:
+        return KeysetPage(rows[:per_page], len(rows) > per_page, False)
+    if decoded[0] == 'n':
+        return KeysetPage(rows[:per_page], len(rows) > per_page, True)
+    has_previous = len(rows) > per_page
+    rows = rows[:per_page]
+    rows.reverse()
+    return KeysetPage(rows, True, has_previous)
+
+
+def paginate_keyset(queryset, cursor=None, per_page=PAGE_SIZE):
+    """
+    Keyset-пагинация по (created_at, id) в порядке убывания.
+    Стоимость страницы не зависит от её глубины.
+    """
+    decoded = decode_cursor(cursor)
+    rows = list(_page_query(queryset, decoded, per_page))
+    return _make_page(rows, decoded, per_page)
+
+
+async def apaginate_keyset(queryset, cursor=None, per_page=PAGE_SIZE):
+    """Асинхронный вариант paginate_keyset"""
+    decoded = decode_cursor(cursor)
+    rows = [row async for row in _page_query(queryset, decoded, per_page)]
+    return _make_page(rows, decoded, per_page)
@@ -0,0 +1,104 @@
+"""
+Очередь дизайнеров: «взять следующую заявку».
+
+claim_next назначает вызвавшему самую старую свободную новую заявку (при
+необходимости — в категории). Где БД умеет SELECT ... FOR UPDATE SKIP
+LOCKED, строка выбирается с блокировкой, а строки, которые сейчас берут
+другие, пропускаются. Иначе (SQLite) выбор и захват — один UPDATE:
+
+    UPDATE ... SET assignee, claimed_until
+    WHERE <свободна> AND id = (SELECT id ... WHERE <свободна>
+                               ORDER BY created_at LIMIT 1)
+
+Запись в SQLite идёт по очереди, поэтому подзапрос второго дизайнера уже
+не видит заявку, взятую первым, и выбирает следующую. Взятая строка
+находится затем по исполнителю и сроку аренды этого вызова.
+Заявка взята на QUEUE_CLAIM_LEASE секунд; истёкшая аренда освобождает её
+без отдельной уборки — такую заявку снова выдаст claim_next. Принятие в
+работу и выполнение снимают аренду, исполнитель остаётся.
+
+Подзапрос идёт по индексу новых заявок в порядке created_at и
+пропускает лишь заявки, взятые сейчас, — их не больше, чем дизайнеров за
+работой, поэтому время выдачи не растёт вместе с очередью.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q, Subquery
+from django.utils import timezone
+
+from .models import DesignRequest
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, 'QUEUE_CLAIM_LEASE', 30 * 60))
+
+
+def _free(now):
+    return Q(claimed_until__isnull=True) | Q(claimed_until__lte=now)
+
+
+def available(now=None, category=None):
+    """Новые заявки, которые никто не взял или аренда которых истекла"""
+    requests = DesignRequest.objects.filter(_free(now or timezone.now()), status='new')
+    if category is not None:
+        requests = requests.filter(category=category)
+    return requests
+
+
+def claimable_by(user, now=None):
+    """Условие для переходов из списка: не трогать заявки, взятые другими"""
+    return _free(now or timezone.now()) | Q(assignee=user)
+
+
+def _claim(user, pk, now):
+    return available(now).filter(pk=pk).update(assignee=user, claimed_until=now + lease(), updated_at=now)
+
+
+def claim_next(user, category=None):
+    """Взять самую старую свободную новую заявку; None — свободных нет"""
+    db = router.db_for_write(DesignRequest)
+    if connections[db].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=db):
+            now = timezone.now()
+            pk = (
+                available(now, category).using(db).select_for_update(skip_locked=True)
+                .order_by('created_at').values_list('pk', flat=True).first()
+            )
+            if pk is None or not _claim(user, pk, now):
+                return None
+    else:
+        now = timezone.now()
+        until = now + lease()
+        oldest = available(now, category).order_by('created_at').values('pk')[:1]
+        claimed = available(now, category).filter(pk=Subquery(oldest)).update(
+            assignee=user, claimed_until=until, updated_at=now
+        )
+        if not claimed:
+            return None
+        pk = (
+            DesignRequest.objects.using(db).filter(assignee=user, claimed_until=until, status='new')
+            .values_list('pk', flat=True).first()
+        )
+        if pk is None:
+            return None  # заявку уже приняли в работу или вернули
+    return DesignRequest.objects.select_related('client', 'category').get(pk=pk)
+
+
+def release(user, pk):
+    """Вернуть взятую новую заявку в очередь"""
+    return DesignRequest.objects.filter(pk=pk, assignee=user, status='new').update(
+        assignee=None, claimed_until=None, updated_at=timezone.now()
+    )
+
+
+def my_queue(user, now=None):
+    """Взятые (с действующей арендой) и принятые в работу заявки дизайнера"""
+    now = now or timezone.now()
+    return (
+        DesignRequest.objects.filter(assignee=user)
+        .filter(Q(status='in_progress') | Q(status='new', claimed_until__gt=now))
+        .select_related('client', 'category')
+        .order_by('created_at')
+    )
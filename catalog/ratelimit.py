@@ -0,0 +1,144 @@
+"""
+Ограничение частоты запросов и допуск загрузок (RateLimitMiddleware).
+
+RATE_LIMITS задаёт для имени URL корзины жетонов: {'user': (5, 60)} —
+пять запросов подряд, затем по одному каждые 60 / 5 секунд. Корзины
+ведутся отдельно по пользователю ('user'), по IP ('ip') и, для входа, по
+введённому логину ('username', см. user_login). Ограничиваются только
+изменяющие запросы: открыть форму можно всегда.
+
+Одновременных загрузок (create_request, фрагменты upload_chunk) не больше
+UPLOAD_CONCURRENCY на все процессы: каждая занимает в кэше один из
+ключей-слотов через cache.add и освобождает его по окончании. Слот
+процесса, упавшего посреди загрузки, освободится сам через
+UPLOAD_SLOT_TIMEOUT. В слоте лежит случайный токен владельца: загрузка,
+чей слот истёк и достался другой, при освобождении чужой слот не удалит.
+Нет свободного слота — сразу 429 с Retry-After, тело запроса не читается.
+
+Состояние хранится в кэше по умолчанию: общий кэш (settings_production,
+DJANGO_CACHE_BACKEND=file) даёт общие для всех процессов лимиты, кэш в
+памяти — лимиты одного процесса. Атомарный cache.add есть у memcached и
+redis; у файлового кэша два процесса изредка могут занять один слот.
+Корзина обновляется чтением и записью без блокировки, поэтому при
+одновременных запросах одного клиента лимит может пропустить лишний
+запрос.
+"""
+import hashlib
+import math
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+
+BUCKET_KEY = 'catalog:ratelimit:{}:{}:{}'
+SLOT_KEY = 'catalog:upload-slot:{}'
+
+# Представления, которые принимают файлы и занимают слот загрузки
+UPLOAD_VIEWS = ('create_request', 'upload-chunk')
+# Представления, которые отвечают JSON (загрузка по частям из JS)
+JSON_VIEWS = ('upload-start', 'upload-chunk')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def limits(scope):
+    return getattr(settings, 'RATE_LIMITS', {}).get(scope, {})
+
+
+def client_ip(request):
+    header = getattr(settings, 'RATE_LIMIT_IP_HEADER', None)
+    if header:
+        # Заголовок от своего прокси: последний адрес добавил он
+        forwarded = request.headers.get(header, '').split(',')[-1].strip()
+        if forwarded:
+            return forwarded
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def consume(key, capacity, period):
+    """Взять жетон из корзины; возвращает 0 или сколько секунд ждать"""
+    rate = capacity / period
+    now = time.time()
+    state = cache.get(key)
+    tokens, updated = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    # За period корзина наполнится заново — дольше хранить незачем
+    cache.set(key, (tokens - 1, now), math.ceil(period))
+    return 0
+
+
+def hit(scope, kind, ident):
+    """Учесть запрос ident в корзине kind для scope; 0 — можно выполнять"""
+    limit = limits(scope).get(kind)
+    if limit is None or not ident:
+        return 0
+    digest = hashlib.blake2b(str(ident).encode(), digest_size=12).hexdigest()
+    return consume(BUCKET_KEY.format(scope, kind, digest), *limit)
+
+
+def check(request, scope):
+    """Корзины IP и пользователя для запроса; 0 или время ожидания"""
+    wait = hit(scope, 'ip', client_ip(request))
+    if not wait and request.user.is_authenticated:
+        wait = hit(scope, 'user', request.user.pk)
+    return wait
+
+
+def acquire_upload_slot():
+    """Занятый слот загрузки (ключ, токен) или None, если все слоты заняты"""
+    limit = getattr(settings, 'UPLOAD_CONCURRENCY', 8)
+    timeout = getattr(settings, 'UPLOAD_SLOT_TIMEOUT', 120)
+    token = uuid.uuid4().hex
+    # Обход со случайного слота — чтобы процессы не толкались на первых ключах
+    start = random.randrange(limit)
+    for offset in range(limit):
+        key = SLOT_KEY.format((start + offset) % limit)
+        if cache.add(key, token, timeout):
+            return key, token
+    return None
+
+
+def release_upload_slot(slot):
+    """Освободить слот, если он всё ещё наш"""
+    key, token = slot
+    if cache.get(key) == token:
+        cache.delete(key)
+
+
+def too_many_requests(url_name, retry_after, message):
+    retry_after = max(1, math.ceil(retry_after))
+    if url_name in JSON_VIEWS:
+        response = JsonResponse({'error': message, 'retry_after': retry_after}, status=429)
+    else:
+        response = HttpResponse(message, status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def admit(request):
+    """
+    Решение по запросу до чтения тела: (ответ 429 или None, слот загрузки
+    или None). Занятый слот освобождается после ответа.
+    """
+    if request.method in SAFE_METHODS:
+        return None, None
+    try:
+        url_name = resolve(request.path_info).view_name
+    except Resolver404:
+        return None, None
+    wait = check(request, url_name) if url_name in getattr(settings, 'RATE_LIMITS', {}) else 0
+    if wait:
+        return too_many_requests(url_name, wait, 'Слишком много запросов. Повторите позже.'), None
+    if url_name in UPLOAD_VIEWS and getattr(settings, 'UPLOAD_CONCURRENCY', 8):
+        slot = acquire_upload_slot()
+        if slot is None:
+            retry_after = getattr(settings, 'UPLOAD_RETRY_AFTER', 5)
+            return too_many_requests(url_name, retry_after, 'Сервер загружен, повторите загрузку позже.'), None
+        return None, slot
+    return None, None
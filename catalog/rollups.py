@@ -0,0 +1,277 @@
+"""
+Дневные сводки для аналитики администратора.
+
+DailyRollup хранит по (день, категория, статус) число переходов в статус
+и суммы их длительностей: 'new' — создано заявок, 'in_progress' — принято
+в работу (время ожидания от создания), 'completed' — выполнено (время в
+работе, от принятия или от создания, если заявку выполнили сразу).
+Строка 'new' дня создания хранит ещё open_count — сколько заявок этого
+дня пока не выполнено; по ней считается возраст очереди.
+
+Сводки обновляются в той же транзакции, что и переход: save() заявки,
+DesignRequestQuerySet.take_to_work() и complete(), удаление заявки.
+Дашборд читает только их — десятки строк вместо всей таблицы заявок.
+Историю, накопленную до появления сводок, пересчитывает rebuild_rollups —
+по живой таблице и по архиву (ArchivedRequest), куда archive_requests
+переносит старые выполненные заявки вместе с их датами.
+"""
+from collections import defaultdict
+
+from django.apps import apps
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, DateTimeField, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+# Поле с моментом перехода в статус
+TRANSITION_STAMPS = {'in_progress': 'taken_at', 'completed': 'completed_at'}
+
+BACKLOG_BUCKETS = (
+    # (возраст в днях меньше, подпись)
+    (1, 'сегодня'),
+    (8, '1–7 дней'),
+    (31, '8–30 дней'),
+    (None, 'больше 30 дней'),
+)
+
+
+def _rollup_model():
+    return apps.get_model('catalog', 'DailyRollup')
+
+
+def _request_model():
+    return apps.get_model('catalog', 'DesignRequest')
+
+
+def _source_querysets():
+    # Архивные заявки удалённой категории в сводки не попадают: её строки удалены каскадом
+    return (
+        _request_model().objects.all(),
+        apps.get_model('catalog', 'ArchivedRequest').objects.filter(category__isnull=False),
+    )
+
+
+def _day(value):
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def _seconds(delta):
+    return max(delta.total_seconds(), 0.0) if delta is not None else 0.0
+
+
+def bump(day, category_id, status, count=0, wait=0.0, lead=0.0, open_count=0):
+    """Прибавить к строке сводки; вызывать внутри транзакции изменения заявки"""
+    DailyRollup = _rollup_model()
+    rows = DailyRollup.objects.filter(day=day, category_id=category_id, status=status)
+    changes = dict(
+        count=F('count') + count,
+        wait_seconds=F('wait_seconds') + wait,
+        lead_seconds=F('lead_seconds') + lead,
+        open_count=F('open_count') + open_count,
+    )
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyRollup.objects.create(
+                day=day, category_id=category_id, status=status, count=count,
+                wait_seconds=wait, lead_seconds=lead, open_count=open_count,
+            )
+    except IntegrityError:
+        # Строку дня только что создала параллельная транзакция
+        rows.update(**changes)
+
+
+def record_created(instance):
+    bump(_day(instance.created_at), instance.category_id, 'new', count=1, open_count=1)
+    if instance.status != 'new':
+        record_status_change(instance, 'new')
+
+
+def record_status_change(instance, previous):
+    """Переход одной заявки через save(); обратные переходы меняют только очередь"""
+    if previous is None or previous == instance.status:
+        return
+    if (previous == 'completed') != (instance.status == 'completed'):
+        delta = 1 if previous == 'completed' else -1
+        bump(_day(instance.created_at), instance.category_id, 'new', open_count=delta)
+    if instance.status == 'in_progress' and previous == 'new' and instance.taken_at:
+        wait = _seconds(instance.taken_at - instance.created_at)
+        bump(_day(instance.taken_at), instance.category_id, 'in_progress', count=1, wait=wait, lead=wait)
+    elif instance.status == 'completed' and instance.completed_at:
+        started = instance.taken_at if previous == 'in_progress' and instance.taken_at else instance.created_at
+        bump(
+            _day(instance.completed_at), instance.category_id, 'completed', count=1,
+            wait=_seconds(instance.completed_at - started),
+            lead=_seconds(instance.completed_at - instance.created_at),
+        )
+
+
+def record_transition(status, at):
+    """
+    Учесть заявки, которые условный UPDATE перевёл в status в момент at.
+    Метка времени (taken_at / completed_at) выделяет ровно эти строки;
+    агрегирование — один GROUP BY по категории и дню создания.
+    """
+    stamp = TRANSITION_STAMPS[status]
+    started = F('created_at') if status == 'in_progress' else Coalesce('taken_at', 'created_at', output_field=DateTimeField())
+    moved = (
+        _request_model()._base_manager.filter(**{stamp: at, 'status': status}).order_by()
+        .values('category_id', created_day=TruncDate('created_at'))
+        .annotate(
+            n=Count('pk'),
+            wait=Sum(ExpressionWrapper(F(stamp) - started, output_field=DurationField())),
+            lead=Sum(ExpressionWrapper(F(stamp) - F('created_at'), output_field=DurationField())),
+        )
+    )
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    for row in moved:
+        total = totals[row['category_id']]
+        total[0] += row['n']
+        total[1] += _seconds(row['wait'])
+        total[2] += _seconds(row['lead'])
+        if status == 'completed':
+            bump(row['created_day'], row['category_id'], 'new', open_count=-row['n'])
+    for category_id, (count, wait, lead) in totals.items():
+        bump(_day(at), category_id, status, count=count, wait=wait, lead=lead)
+
+
+def record_deleted(instance):
+    status = getattr(instance, '_loaded_status', instance.status)
+    if status != 'completed':
+        bump(_day(instance.created_at), instance.category_id, 'new', open_count=-1)
+
+
+def _legacy_stamps(batch_size):
+    """Заявкам до появления taken_at/completed_at — время последнего изменения"""
+    for queryset in _source_querysets():
+        for status, stamp in (('in_progress', 'taken_at'), ('completed', 'completed_at')):
+            while True:
+                with transaction.atomic():
+                    ids = list(
+                        queryset.filter(status=status, **{f'{stamp}__isnull': True})
+                        .order_by().values_list('pk', flat=True)[:batch_size]
+                    )
+                    if not ids:
+                        break
+                    queryset.filter(pk__in=ids, **{f'{stamp}__isnull': True}).update(**{stamp: F('updated_at')})
+
+
+def _batches(queryset, cutoff, batch_size):
+    """Заявки, созданные до cutoff, пачками по первичному ключу"""
+    fields = ('pk', 'category_id', 'status', 'created_at', 'taken_at', 'completed_at')
+    last_id = None
+    while True:
+        batch = queryset.filter(created_at__lt=cutoff).order_by('pk')
+        if last_id is not None:
+            batch = batch.filter(pk__gt=last_id)
+        batch = list(batch.values_list(*fields)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1][0]
+
+
+def rebuild(batch_size=5000, progress=None):
+    """
+    Пересчитать сводки по всем заявкам, включая архив. Сводки очищаются и
+    фиксируется момент cutoff; заявки читаются пачками, учитываются только
+    события до cutoff — более поздние уже добавили обычные обновления.
+    Заявка, перенесённая в архив во время пересчёта, может быть учтена
+    дважды — не запускайте одновременно с archive_requests. Возвращает
+    число просмотренных заявок.
+    """
+    DailyRollup = _rollup_model()
+    _legacy_stamps(batch_size)
+    with transaction.atomic(using=router.db_for_write(DailyRollup)):
+        DailyRollup.objects.all().delete()
+        cutoff = timezone.now()
+
+    rows = defaultdict(lambda: [0, 0.0, 0.0, 0])
+    seen = 0
+    batches = (batch for queryset in _source_querysets() for batch in _batches(queryset, cutoff, batch_size))
+    for batch in batches:
+        for _pk, category_id, status, created_at, taken_at, completed_at in batch:
+            new = rows[_day(created_at), category_id, 'new']
+            new[0] += 1
+            # Очередь — на момент cutoff
+            if status != 'completed' or (completed_at and completed_at >= cutoff):
+                new[3] += 1
+            if taken_at and taken_at < cutoff:
+                row = rows[_day(taken_at), category_id, 'in_progress']
+                wait = _seconds(taken_at - created_at)
+                row[0] += 1
+                row[1] += wait
+                row[2] += wait
+            if status == 'completed' and completed_at and completed_at < cutoff:
+                row = rows[_day(completed_at), category_id, 'completed']
+                row[0] += 1
+                row[1] += _seconds(completed_at - (taken_at or created_at))
+                row[2] += _seconds(completed_at - created_at)
+        seen += len(batch)
+        if progress is not None:
+            progress(seen)
+
+    # Прибавляем, а не перезаписываем: за время чтения могли прийти обновления
+    items = list(rows.items())
+    for start in range(0, len(items), batch_size):
+        with transaction.atomic():
+            for (day, category_id, status), (count, wait, lead, open_count) in items[start:start + batch_size]:
+                bump(day, category_id, status, count, wait, lead, open_count)
+    return seen
+
+
+def throughput(start):
+    """По категориям с дня start: {category_id: {status: (count, wait, lead)}}"""
+    summary = defaultdict(dict)
+    rows = (
+        _rollup_model().objects.filter(day__gte=start).order_by()
+        .values('category_id', 'status')
+        .annotate(n=Sum('count'), wait=Sum('wait_seconds'), lead=Sum('lead_seconds'))
+    )
+    for row in rows:
+        summary[row['category_id']][row['status']] = (row['n'], row['wait'], row['lead'])
+    return summary
+
+
+def daily(start):
+    """[(день, {status: count})] с дня start, по возрастанию"""
+    days = defaultdict(dict)
+    rows = (
+        _rollup_model().objects.filter(day__gte=start).order_by()
+        .values('day', 'status').annotate(n=Sum('count'))
+    )
+    for row in rows:
+        days[row['day']][row['status']] = row['n']
+    return sorted(days.items())
+
+
+def backlog_by_age(today=None):
+    """[(подпись, число невыполненных заявок)] по возрасту заявки"""
+    today = today or timezone.localdate()
+    counts = [0] * len(BACKLOG_BUCKETS)
+    rows = (
+        _rollup_model().objects.filter(status='new', open_count__gt=0).order_by()
+        .values('day').annotate(n=Sum('open_count'))
+    )
+    for row in rows:
+        age = (today - row['day']).days
+        for i, (limit, _label) in enumerate(BACKLOG_BUCKETS):
+            if limit is None or age < limit:
+                counts[i] += row['n']
+                break
+    return [(label, count) for (_limit, label), count in zip(BACKLOG_BUCKETS, counts)]
+
+
+def format_duration(seconds):
+    """Длительность для таблицы: «2 д 3 ч», «5 ч 10 мин», «12 мин»"""
+    if seconds is None:
+        return '—'
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f'{days} д {hours} ч'
+    if hours:
+        return f'{hours} ч {minutes} мин'
+    return f'{minutes} мин'
@@ -0,0 +1,218 @@
+"""
+Полнотекстовый поиск по заявкам на SQLite FTS5.
+
+Таблица catalog_search хранит title, description и admin_comment
+каждой заявки; триггеры на catalog_designrequest держат её в
+актуальном состоянии при любых изменениях, включая bulk_create и
+QuerySet.update(). UUID заявки не годится как rowid FTS5, поэтому
+соответствие request_id -> rowid лежит в обычной таблице
+catalog_search_rowid с индексом по первичному ключу.
+"""
+import logging
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import OperationalError, connection, transaction
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'catalog_search'
+ROWID_TABLE = 'catalog_search_rowid'
+SEARCH_LIMIT = 50
+
+# Маркеры подсветки: заменяются на <mark> после экранирования HTML
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+SCHEMA = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        request_id UNINDEXED, title, description, admin_comment,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS {ROWID_TABLE} (
+        request_id char(32) NOT NULL PRIMARY KEY,
+        fts_rowid integer NOT NULL
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_search_ai AFTER INSERT ON catalog_designrequest BEGIN
+        INSERT INTO {SEARCH_TABLE} (request_id, title, description, admin_comment)
+            VALUES (new.id, new.title, new.description, new.admin_comment);
+        INSERT OR REPLACE INTO {ROWID_TABLE} (request_id, fts_rowid) VALUES (new.id, last_insert_rowid());
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_search_ad AFTER DELETE ON catalog_designrequest BEGIN
+        DELETE FROM {SEARCH_TABLE}
+            WHERE rowid = (SELECT fts_rowid FROM {ROWID_TABLE} WHERE request_id = old.id);
+        DELETE FROM {ROWID_TABLE} WHERE request_id = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_search_au
+        AFTER UPDATE OF title, description, admin_comment ON catalog_designrequest BEGIN
+        UPDATE {SEARCH_TABLE}
+            SET title = new.title, description = new.description, admin_comment = new.admin_comment
+            WHERE rowid = (SELECT fts_rowid FROM {ROWID_TABLE} WHERE request_id = old.id);
+    END""",
+)
+
+
+def is_available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def ensure_schema(using=connection):
+    """Создать FTS-таблицу и триггеры, если их ещё нет"""
+    if not is_available(using):
+        return False
+    try:
+        with using.cursor() as cursor:
+            for statement in SCHEMA:
+                cursor.execute(statement)
+    except Exception:
+        logger.exception('SQLite собран без FTS5 — поиск будет работать через LIKE')
+        return False
+    return True
+
+
+def build_match(query):
+    """Пользовательский ввод -> запрос FTS5: каждое слово как префикс"""
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def highlight(text):
+    return mark_safe(
+        escape(text).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+    )
+
+
+def _fallback(queryset, query, limit):
+    words = re.findall(r'\w+', query)
+    condition = Q()
+    for word in words:
+        condition &= (
+            Q(title__icontains=word) | Q(description__icontains=word) | Q(admin_comment__icontains=word)
+        )
+    results = list(queryset.filter(condition)[:limit])
+    for request in results:
+        request.search_title = request.title
+        request.search_snippet = request.description[:150]
+    return results
+
+
+def _fetch(sql, params):
+    """
+    Строки запроса к FTS-таблице; None, если её нет (не запускали
+    rebuild_search_index) или SQLite собран без FTS5
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+    except OperationalError:
+        logger.warning('Полнотекстовый индекс недоступен — поиск работает через LIKE', exc_info=True)
+        return None
+
+
+def search_requests(queryset, query, limit=SEARCH_LIMIT):
+    """
+    Найти заявки из queryset по тексту, лучшие по bm25 первыми.
+    У найденных заявок заполнены search_title и search_snippet
+    с подсветкой совпадений.
+    """
+    match = build_match(query)
+    if not match:
+        return []
+    if not is_available():
+        return _fallback(queryset, query, limit)
+
+    # Ограничения queryset (клиент, статус) применяются в том же запросе
+    restriction, inner_params = '', []
+    if queryset.query.where:
+        inner_sql, inner_params = queryset.order_by().values('id').query.sql_with_params()
+        restriction = f'AND s.request_id IN ({inner_sql})'
+    sql = f"""
+        SELECT s.request_id,
+               highlight({SEARCH_TABLE}, 1, %s, %s),
+               snippet({SEARCH_TABLE}, 2, %s, %s, '…', 24)
+        FROM {SEARCH_TABLE} s
+        WHERE {SEARCH_TABLE} MATCH %s {restriction}
+        ORDER BY rank
+        LIMIT %s
+    """
+    params = [_MARK_START, _MARK_END, _MARK_START, _MARK_END, match, *inner_params, limit]
+    rows = _fetch(sql, params)
+    if rows is None:
+        return _fallback(queryset, query, limit)
+
+    by_id = queryset.in_bulk([row[0] for row in rows])
+    results = []
+    for request_id, title, snippet in rows:
+        request = by_id.get(queryset.model._meta.pk.to_python(request_id))
+        if request is None:
+            continue
+        request.search_title = highlight(title)
+        request.search_snippet = highlight(snippet)
+        results.append(request)
+    return results
+
+
+asearch_requests = sync_to_async(search_requests)
+
+
+def matching_ids(query, limit=1000):
+    """
+    id заявок, подходящих под запрос, лучшие первыми, — для админки.
+    None, если полнотекстовый поиск недоступен.
+    """
+    match = build_match(query)
+    if not match or not is_available():
+        return None
+    rows = _fetch(
+        f'SELECT request_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s ORDER BY rank LIMIT %s',
+        [match, limit],
+    )
+    return None if rows is None else [row[0] for row in rows]
+
+
+def rebuild(batch_size=5000, progress=None):
+    """Переиндексировать все заявки пачками, каждая пачка — своя транзакция"""
+    if not ensure_schema():
+        return 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(f'DELETE FROM {ROWID_TABLE}')
+
+    indexed = 0
+    last_id = ''
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT id FROM catalog_designrequest WHERE id > %s ORDER BY id LIMIT %s',
+                [last_id, batch_size],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+            cursor.execute(f'SELECT coalesce(max(rowid), 0) FROM {SEARCH_TABLE}')
+            max_rowid = cursor.fetchone()[0]
+            # Строки, уже добавленные триггером во время переиндексации, пропускаем
+            cursor.execute(
+                f"""INSERT INTO {SEARCH_TABLE} (request_id, title, description, admin_comment)
+                    SELECT d.id, d.title, d.description, d.admin_comment
+                    FROM catalog_designrequest d
+                    WHERE d.id > %s AND d.id <= %s
+                      AND NOT EXISTS (SELECT 1 FROM {ROWID_TABLE} m WHERE m.request_id = d.id)""",
+                [last_id, ids[-1]],
+            )
+            cursor.execute(
+                f"""INSERT OR IGNORE INTO {ROWID_TABLE} (request_id, fts_rowid)
+                    SELECT request_id, rowid FROM {SEARCH_TABLE} WHERE rowid > %s""",
+                [max_rowid],
+            )
+        indexed += len(ids)
+        last_id = ids[-1]
+        if progress is not None:
+            progress(indexed)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return indexed
@@ -0,0 +1,63 @@
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from . import counters
+from . import db
+from . import rollups
+from . import search
+from . import storage as blobs
+from .backends import invalidate_user
+from .conditional import bump_pages_version
+from .models import ArchivedRequest, Category, CustomUser, DesignRequest
+
+
+@receiver(post_delete, sender=DesignRequest)
+def design_request_deleted(sender, instance, **kwargs):
+    # Срабатывает и при каскадном удалении — внутри транзакции коллектора
+    counters.record_deleted(instance)
+    rollups.record_deleted(instance)
+    for field, name in getattr(instance, '_loaded_images', instance.image_names()).items():
+        blobs.release(name, sender._meta.get_field(field).storage)
+
+
+@receiver(post_delete, sender=ArchivedRequest)
+def archived_request_deleted(sender, instance, **kwargs):
+    # Файлы холодного хранилища ссылок не считают (см. catalog.archive)
+    if not instance.cold:
+        for field, name in instance.image_names().items():
+            blobs.release(name, sender._meta.get_field(field).storage)
+
+
+@receiver(post_migrate)
+def ensure_search_schema(sender, using, **kwargs):
+    # FTS5-таблица и триггеры не описываются моделями — создаём после migrate
+    if sender.name == 'catalog':
+        search.ensure_schema(connections[using])
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    # Название категории показывается в блоке «последние выполненные»
+    if not created:
+        counters.invalidate_latest_completed()
+        bump_pages_version()
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    bump_pages_version()
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def user_changed(sender, instance, **kwargs):
+    # Пароль, is_staff, last_login — пользователь в кэше сессий устарел
+    invalidate_user(instance.pk)
+    # Имя клиента есть в списке заявок администратора
+    bump_pages_version()
+
+
+# PRAGMA для каждого нового соединения с SQLite (SQLITE_PRAGMAS)
+connection_created.connect(db.configure_sqlite, dispatch_uid='catalog.configure_sqlite')
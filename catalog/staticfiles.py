@@ -0,0 +1,161 @@
+"""
+Статика с отпечатками имён, минификацией CSS и предсжатыми копиями.
+
+collectstatic с CompressedManifestStaticFilesStorage:
+- записывает файлы под именами с хэшем содержимого (style.3f2a9c1b7e4d.css)
+  и staticfiles.json с соответствием имён — {% static %} отдаёт хэшированные;
+- минифицирует CSS перед записью;
+- кладёт рядом .gz и, если установлен пакет brotli, .br.
+
+serve() отдаёт собранную статику, когда фронтенд-сервера нет
+(SERVE_STATIC): хэшированные файлы — с Cache-Control immutable на год,
+сжатая копия выбирается по Accept-Encoding. Повторная загрузка страницы
+не перепроверяет стили вовсе: имя файла меняется вместе с содержимым.
+"""
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен: без него только .gz
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.txt', '.html', '.json', '.xml', '.map')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Предсжатые варианты в порядке предпочтения
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+# Строки и url(...) минификация не трогает
+CSS_LITERALS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|url\([^)]*\))')
+
+
+def minify_css(css):
+    """Убрать комментарии и лишние пробелы; строки и url() не трогаются"""
+    parts = CSS_LITERALS.split(css)
+    for i in range(0, len(parts), 2):
+        part = re.sub(r'/\*.*?\*/', '', parts[i], flags=re.S)
+        part = re.sub(r'\s+', ' ', part)
+        part = re.sub(r'\s*([{};,>])\s*', r'\1', part)
+        parts[i] = part.replace(';}', '}')
+    # Пробел у двоеточия значим в селекторе (.a :hover — не .a:hover),
+    # поэтому убирается только в объявлениях: после них идёт ';' или '}',
+    # а после селектора и условия @media — '{'. Обход с конца помнит
+    # ближайший следующий разделитель.
+    following = '}'
+    for i in reversed(range(0, len(parts), 2)):
+        pieces = re.split(r'([{};])', parts[i])
+        for j in range(len(pieces) - 1, -1, -1):
+            if j % 2:
+                following = pieces[j]
+            elif following != '{':
+                pieces[j] = re.sub(r'\s*:\s*', ':', pieces[j])
+        parts[i] = ''.join(pieces)
+    return ''.join(parts).strip()
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def _save(self, name, content):
+        if name.endswith('.css'):
+            content.seek(0)
+            css = content.read()
+            if isinstance(css, bytes):
+                css = css.decode('utf-8')
+            content = ContentFile(minify_css(css).encode('utf-8'))
+        return super()._save(name, content)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as f:
+            data = f.read()
+        variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data)))
+        for suffix, compressed in variants:
+            # Сжатие, которое ничего не даёт, не храним
+            if len(compressed) >= len(data):
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save_raw(name + suffix, compressed)
+
+    def _save_raw(self, name, data):
+        # Мимо _save(): сжатые байты не минифицируются повторно
+        super()._save(name, ContentFile(data))
+
+
+_hashed_names = (None, frozenset())
+
+
+def _is_immutable(path):
+    """Имя с отпечатком из staticfiles.json — содержимое по нему не меняется"""
+    global _hashed_names
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+    if _hashed_names[0] is not hashed_files:
+        _hashed_names = (hashed_files, frozenset(hashed_files.values()))
+    return path in _hashed_names[1]
+
+
+def _accepted_encodings(request):
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    accepted = set()
+    for item in header.split(','):
+        coding, _sep, params = item.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def serve(request, path):
+    """Отдать файл из STATIC_ROOT с учётом предсжатых копий и отпечатка в имени"""
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    encoding, file_path = None, full_path
+    accepted = _accepted_encodings(request)
+    for coding, suffix in ENCODINGS:
+        if coding in accepted and os.path.isfile(full_path + suffix):
+            encoding, file_path = coding, full_path + suffix
+            break
+
+    stat = os.stat(file_path)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(file_path, 'rb'), content_type=content_type, filename=os.path.basename(full_path))
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if _is_immutable(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
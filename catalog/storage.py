@@ -0,0 +1,190 @@
+import hashlib
+import os
+import tempfile
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+
+from .images import delete_derivatives
+
+BLOB_PREFIX = 'cas'
+# Недописанные файлы _save() в корне хранилища
+TEMP_PREFIX = '.upload-'
+
+
+def request_image_storage():
+    """Хранилище изображений заявок (STORAGES['request_images'])"""
+    return storages['request_images']
+
+
+def file_digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище с адресацией по содержимому.
+    Файл хэшируется (SHA-256) во время записи и кладётся в
+    cas/<aa>/<bb>/<digest>.<ext>; повторная загрузка того же плана
+    не занимает места — возвращается имя уже сохранённого блоба.
+    Имя в upload_to используется только ради расширения.
+
+    Есть ли уже такой блоб, решается под блокировкой его строки MediaBlob
+    (lock_blob), а release() удаляет файл под той же блокировкой. Поэтому
+    блоб не пропадёт между _save() и retain(), если они выполняются в одной
+    транзакции: либо удаление прошло раньше и файл записывается заново, либо
+    оно дождётся коммита и увидит новую ссылку.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяет хэш содержимого в _save()
+        return name
+
+    def blob_name(self, digest, original_name):
+        ext = os.path.splitext(original_name)[1].lower()
+        return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+    def _save(self, name, content):
+        os.makedirs(self.location, exist_ok=True)
+        if hasattr(content, 'temporary_file_path'):
+            # Файл уже на диске: хэшируем и переносим без копирования
+            tmp_path = content.temporary_file_path()
+            digest = file_digest(tmp_path)
+        else:
+            sha256 = hashlib.sha256()
+            fd, tmp_path = tempfile.mkstemp(dir=self.location, prefix=TEMP_PREFIX)
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    sha256.update(chunk)
+                    f.write(chunk)
+            digest = sha256.hexdigest()
+
+        blob = self.blob_name(digest, name)
+        full_path = self.path(blob)
+        with transaction.atomic():
+            lock_blob(blob)
+            if os.path.exists(full_path):
+                os.remove(tmp_path)
+                # Свежая дата изменения: gc_media не тронет блоб в пределах grace,
+                # пока новая ссылка на него ещё не закоммичена
+                os.utime(full_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                # Одинаковое содержимое — перезапись при гонке безопасна
+                file_move_safe(tmp_path, full_path, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        return blob
+
+    @property
+    def derivative_storage(self):
+        """Превью пишутся под своими именами рядом с блобом, без хэширования"""
+        return FileSystemStorage(location=self.location, base_url=self.base_url)
+
+
+def _blob_model():
+    return apps.get_model('catalog', 'MediaBlob')
+
+
+def _referencing_querysets():
+    """Строки, которые ссылаются на файлы горячего хранилища"""
+    return (
+        apps.get_model('catalog', 'DesignRequest').objects.all(),
+        apps.get_model('catalog', 'ArchivedRequest').objects.filter(cold=False),
+    )
+
+
+def rebuild_refcounts():
+    """Пересчитать ссылки на файлы по всем заявкам, включая архив вне холодного хранилища"""
+    MediaBlob = _blob_model()
+    counts = Counter()
+    for queryset in _referencing_querysets():
+        for field in ('plan_image', 'design_image'):
+            rows = (
+                queryset.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .order_by().values_list(field).annotate(n=Count('id'))
+            )
+            for name, n in rows:
+                counts[name] += n
+    with transaction.atomic():
+        MediaBlob.objects.all().delete()
+        MediaBlob.objects.bulk_create(
+            (MediaBlob(name=name, refcount=n) for name, n in counts.items()),
+            batch_size=1000,
+        )
+    return len(counts)
+
+
+def _add_references(name, count):
+    # UPDATE, а при отсутствии строки — вставка без ошибки на конфликте:
+    # два первых обращения к блобу одновременно не дают IntegrityError
+    MediaBlob = _blob_model()
+    while not MediaBlob.objects.filter(name=name).update(refcount=F('refcount') + count):
+        MediaBlob.objects.bulk_create([MediaBlob(name=name, refcount=0)], ignore_conflicts=True)
+
+
+def lock_blob(name):
+    """
+    Создать строку блоба, если её нет, и заблокировать до конца транзакции
+    (пустой UPDATE; в SQLite — блокировка записи)
+    """
+    _add_references(name, 0)
+
+
+def retain(name, count=1):
+    """Учесть ещё count ссылок на файл; вызывать в транзакции изменения строк"""
+    if not name or not count:
+        return
+    _add_references(name, count)
+
+
+def _collect(name, storage):
+    """
+    Удалить строку блоба без ссылок и его файл; вызывать в транзакции.
+    Условный DELETE блокирует строку, и файл удаляется до коммита — пока
+    параллельный _save() того же содержимого ждёт блокировку.
+    """
+    deleted, _ = _blob_model().objects.filter(name=name, refcount=0).delete()
+    if deleted and getattr(settings, 'MEDIA_DELETE_ON_COMMIT', True):
+        delete_derivatives(storage, name)
+        storage.delete(name)
+
+
+def release(name, storage, count=1):
+    """
+    Снять count ссылок; файл без ссылок удаляется после коммита. При
+    MEDIA_DELETE_ON_COMMIT = False файл остаётся до запуска gc_media.
+    """
+    if not name or not count:
+        return
+    MediaBlob = _blob_model()
+    MediaBlob.objects.filter(name=name, refcount__gt=0).update(refcount=Greatest(F('refcount') - count, 0))
+
+    def collect():
+        with transaction.atomic():
+            _collect(name, storage)
+
+    transaction.on_commit(collect)
+
+
+def discard_if_unused(name, storage):
+    """Удалить только что сохранённый файл, если ни одна заявка на него не ссылается"""
+    def collect():
+        with transaction.atomic():
+            # Заявки, записанные до подсчёта ссылок, строки блоба не имеют
+            for queryset in _referencing_querysets():
+                if queryset.filter(Q(plan_image=name) | Q(design_image=name)).exists():
+                    return
+            _collect(name, storage)
+
+    transaction.on_commit(collect)
@@ -0,0 +1,38 @@
+from django import template
+
+from ..images import DERIVATIVE_WIDTHS, derivative_formats
+from ..media import image_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(field_file, width=DERIVATIVE_WIDTHS[0], fmt='jpg'):
+    """{% thumbnail_url req.design_image 320 %}"""
+    return image_url(field_file, int(width), fmt)
+
+
+@register.simple_tag
+def request_image_url(field_file):
+    """{% request_image_url request.plan_image %} — оригинал через проверку доступа"""
+    return image_url(field_file)
+
+
+@register.inclusion_tag('catalog/includes/picture.html')
+def picture(field_file, alt='', css_class='', sizes='100vw'):
+    """<picture> с WebP/JPEG srcset по всем ширинам превью"""
+    sources = []
+    # WebP первым: браузер берёт первый поддерживаемый <source>
+    for fmt in reversed(derivative_formats()):
+        srcset = ', '.join(
+            f'{image_url(field_file, width, fmt)} {width}w'
+            for width in DERIVATIVE_WIDTHS
+        )
+        sources.append({'type': 'image/webp' if fmt == 'webp' else 'image/jpeg', 'srcset': srcset})
+    return {
+        'sources': sources,
+        'src': image_url(field_file, DERIVATIVE_WIDTHS[0]),
+        'alt': alt,
+        'css_class': css_class,
+        'sizes': sizes,
+    }
@@ -1,3 +1,1225 @@
-from django.test import TestCase
+"""
+Тесты catalog:
 
-# Create your tests here.
+    python manage.py test catalog --settings=locallibrary.settings_test
+"""
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    archive, benchmarks, counters, db, deletion, export, images, media_gc, metrics, outbox, queue, ratelimit, rollups, search,
+    views,
+)
+from .backends import CachedModelBackend, user_cache_key
+from .images import DERIVATIVE_WIDTHS
+from .management.commands import stress_sqlite
+from .models import (
+    ArchivedRequest, Category, CustomUser, DailyRollup, DesignRequest, MediaBlob, OutboxEvent, StatusCounter,
+)
+from .pagination import decode_cursor, paginate_keyset
+from .staticfiles import minify_css
+
+
+def png(name='plan.png', color='red', size=(40, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class CatalogTestCase(TestCase):
+    """Временные MEDIA_ROOT и холодное хранилище, пустой кэш, клиент и категория"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp(prefix='catalog-tests-')
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client_user = CustomUser.objects.create_user('client', password='secret', full_name='Клиент')
+        self.admin = CustomUser.objects.create_user('admin', password='secret', full_name='Дизайнер', is_staff=True)
+        self.category = Category.objects.create(name='Кухня')
+
+    def make_request(self, title='Заявка', color='red', **kwargs):
+        kwargs.setdefault('client', self.client_user)
+        kwargs.setdefault('category', self.category)
+        return DesignRequest.objects.create(title=title, description='Описание', plan_image=png(color=color), **kwargs)
+
+    def set_created(self, design_request, created_at):
+        DesignRequest.objects.filter(pk=design_request.pk).update(created_at=created_at)
+
+
+class TransitionTests(CatalogTestCase):
+    def test_take_to_work_applies_once(self):
+        design_request = self.make_request()
+        selected = DesignRequest.objects.filter(pk=design_request.pk)
+        self.assertEqual(selected.take_to_work('Берём'), 1)
+        self.assertEqual(selected.take_to_work('Ещё раз'), 0)
+        design_request.refresh_from_db()
+        self.assertEqual(design_request.status, 'in_progress')
+        self.assertEqual(design_request.admin_comment, 'Берём')
+        self.assertIsNotNone(design_request.taken_at)
+        self.assertEqual(counters.status_count('new'), 0)
+        self.assertEqual(counters.status_count('in_progress'), 1)
+
+    def test_complete_shares_design_file(self):
+        first, second = self.make_request('Первая'), self.make_request('Вторая', color='blue')
+        updated = DesignRequest.objects.filter(pk__in=[first.pk, second.pk]).complete(png('design.png', 'green'))
+        self.assertEqual(updated, 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.design_image.name, second.design_image.name)
+        self.assertEqual(MediaBlob.objects.get(name=first.design_image.name).refcount, 2)
+        self.assertEqual(counters.status_count('completed'), 2)
+
+    def test_completed_request_cannot_be_taken(self):
+        design_request = self.make_request()
+        self.assertTrue(design_request.complete(png('design.png', 'green')))
+        self.assertFalse(design_request.take_to_work('Поздно'))
+        self.assertEqual(DesignRequest.objects.get(pk=design_request.pk).status, 'completed')
+
+    def test_complete_releases_previous_design(self):
+        design_request = self.make_request()
+        design_request.complete(png('design.png', 'green'))
+        old_name, storage = design_request.design_image.name, design_request.design_image.storage
+        # Выполненную заявку вернули в работу — прежний файл остался в строке
+        DesignRequest.objects.filter(pk=design_request.pk).update(status='in_progress')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(design_request.complete(png('design.png', 'blue')))
+        self.assertNotEqual(design_request.design_image.name, old_name)
+        self.assertFalse(MediaBlob.objects.filter(name=old_name).exists())
+        self.assertFalse(storage.exists(old_name))
+        self.assertEqual(MediaBlob.objects.get(name=design_request.design_image.name).refcount, 1)
+
+    def test_admin_complete_validates_image(self):
+        design_request = self.make_request()
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin-complete', args=[design_request.pk]), {
+            'design_image': SimpleUploadedFile('design.gif', b'GIF89a', content_type='image/gif'),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(DesignRequest.objects.get(pk=design_request.pk).status, 'new')
+
+
+class StatusCounterTests(CatalogTestCase):
+    def test_counters_follow_save_and_delete(self):
+        first, second = self.make_request('Первая'), self.make_request('Вторая')
+        self.assertEqual(counters.status_count('new'), 2)
+        first.status = 'in_progress'
+        first.save()
+        self.assertEqual(counters.status_count('new'), 1)
+        self.assertEqual(counters.status_count('in_progress'), 1)
+        second.delete()
+        self.assertEqual(counters.status_count('new'), 0)
+        self.assertEqual(counters.status_count('completed'), 0)
+
+    def test_missing_counters_are_rebuilt(self):
+        self.make_request()
+        StatusCounter.objects.all().delete()
+        self.assertEqual(counters.status_count('new'), 1)
+        self.assertEqual(StatusCounter.objects.count(), len(DesignRequest.STATUS_CHOICES))
+
+    def test_rebuild_command_fixes_drift(self):
+        self.make_request()
+        StatusCounter.objects.filter(status='new').update(count=10)
+        out = io.StringIO()
+        call_command('rebuild_status_counters', stdout=out)
+        self.assertIn('new: 1', out.getvalue())
+        self.assertEqual(counters.status_count('new'), 1)
+
+    def test_home_latest_completed_invalidated_on_completion(self):
+        design_request = self.make_request('Готовый проект')
+        self.assertNotContains(self.client.get(reverse('home')), 'Готовый проект')
+        with self.captureOnCommitCallbacks(execute=True):
+            design_request.complete(png('design.png', 'green'))
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Готовый проект')
+        self.assertContains(response, 'Заявок в работе: <strong>0</strong>', html=False)
+
+
+class AsyncViewTests(CatalogTestCase):
+    def test_read_views_are_async(self):
+        for view in (views.home, views.my_requests, views.request_detail, views.admin_all_requests):
+            self.assertTrue(iscoroutinefunction(view), view.__name__)
+
+    async def test_my_requests_lists_only_own(self):
+        other = await CustomUser.objects.acreate(username='other', full_name='Другой')
+        own = await sync_to_async(self.make_request)('Моя')
+        await sync_to_async(self.make_request)('Чужая', client=other)
+        await self.async_client.aforce_login(self.client_user)
+        response = await self.async_client.get(reverse('my_requests'))
+        self.assertContains(response, own.title)
+        self.assertNotContains(response, 'Чужая')
+
+    async def test_request_detail_checks_owner(self):
+        other = await CustomUser.objects.acreate(username='other', full_name='Другой')
+        foreign = await sync_to_async(self.make_request)('Чужая', client=other)
+        await self.async_client.aforce_login(self.client_user)
+        response = await self.async_client.get(reverse('request-detail', args=[foreign.pk]))
+        self.assertRedirects(response, reverse('my_requests'), fetch_redirect_response=False)
+
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(reverse('request-detail', args=[foreign.pk]))
+        self.assertContains(response, 'Чужая')
+
+    async def test_anonymous_is_redirected_to_login(self):
+        response = await self.async_client.get(reverse('my_requests'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response['Location'])
+
+    async def test_home_renders_without_login(self):
+        response = await self.async_client.get(reverse('home'))
+        self.assertContains(response, 'Заявок в работе')
+
+
+class SearchTests(CatalogTestCase):
+    def make_ranked(self):
+        # Созданная раньше заявка встречает слово чаще — по bm25 она выше
+        best = DesignRequest.objects.create(
+            title='Кухня', description='кухня в светлых тонах, кухня-гостиная', plan_image=png(),
+            client=self.client_user, category=self.category,
+        )
+        other = DesignRequest.objects.create(
+            title='Спальня', description='рядом кухня', plan_image=png(),
+            client=self.client_user, category=self.category,
+        )
+        return best, other
+
+    def titles(self, query, queryset=None):
+        queryset = DesignRequest.objects.all() if queryset is None else queryset
+        return [request.title for request in search.search_requests(queryset, query)]
+
+    def test_results_ranked_by_relevance(self):
+        self.make_ranked()
+        self.assertEqual(self.titles('кухн'), ['Кухня', 'Спальня'])
+
+    def test_triggers_follow_changes(self):
+        design_request = self.make_request('Гостиная')
+        DesignRequest.objects.bulk_create([DesignRequest(
+            title='Веранда', description='Описание', plan_image='plans/x.png',
+            client=self.client_user, category=self.category,
+        )])
+        self.assertEqual(self.titles('веранда'), ['Веранда'])
+
+        design_request.title = 'Кабинет'
+        design_request.save()
+        self.assertEqual(self.titles('гостиная'), [])
+        self.assertEqual(self.titles('кабинет'), ['Кабинет'])
+
+        DesignRequest.objects.filter(pk=design_request.pk).update(admin_comment='Нужен камин')
+        self.assertEqual(self.titles('камин'), ['Кабинет'])
+
+        design_request.delete()
+        self.assertEqual(self.titles('кабинет'), [])
+
+    def test_queryset_restricts_results(self):
+        other = CustomUser.objects.create_user('other', password='secret', full_name='Другой')
+        self.make_request('Кухня клиента')
+        self.make_request('Кухня другого', client=other)
+        self.assertEqual(self.titles('кухня', DesignRequest.objects.filter(client=other)), ['Кухня другого'])
+
+    def test_highlight_escapes_html(self):
+        self.make_request('<b>Кухня</b>')
+        result = search.search_requests(DesignRequest.objects.all(), 'кухня')[0]
+        self.assertEqual(result.search_title, '&lt;b&gt;<mark>Кухня</mark>&lt;/b&gt;')
+
+    def test_query_without_words_finds_nothing(self):
+        self.make_request()
+        self.assertEqual(search.search_requests(DesignRequest.objects.all(), '"*:'), [])
+
+    def test_rebuild_restores_index(self):
+        self.make_request('Гостиная')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.SEARCH_TABLE}')
+            cursor.execute(f'DELETE FROM {search.ROWID_TABLE}')
+        self.assertEqual(self.titles('гостиная'), [])
+        self.assertEqual(search.rebuild(batch_size=1), 1)
+        self.assertEqual(self.titles('гостиная'), ['Гостиная'])
+
+    def test_my_requests_search(self):
+        self.make_request('Гостиная')
+        self.make_request('Спальня')
+        self.client.force_login(self.client_user)
+        response = self.client.get(reverse('my_requests'), {'q': 'гост'})
+        self.assertEqual([request.title for request in response.context['requests']], ['Гостиная'])
+
+    def test_missing_index_falls_back_to_like(self):
+        design_request = self.make_request('Гостиная')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {search.SEARCH_TABLE}')
+        with self.assertLogs('catalog.search', 'WARNING'):
+            results = search.search_requests(DesignRequest.objects.all(), 'Гостин')
+        self.assertEqual(results, [design_request])
+        with self.assertLogs('catalog.search', 'WARNING'):
+            self.assertIsNone(search.matching_ids('гостин'))
+
+    def test_admin_search_ordered_by_rank(self):
+        best, other = self.make_ranked()
+        superuser = CustomUser.objects.create_superuser('root', password='secret', full_name='Root')
+        self.client.force_login(superuser)
+        url = reverse('admin:catalog_designrequest_changelist')
+        response = self.client.get(url, {'q': 'кухня'})
+        self.assertEqual(list(response.context['cl'].result_list), [best, other])
+        # Явная сортировка по колонке важнее релевантности
+        response = self.client.get(url, {'q': 'кухня', 'o': '-6'})
+        self.assertEqual(list(response.context['cl'].result_list), [other, best])
+
+
+class SqliteProfileTests(CatalogTestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def restore_pragma(self, name):
+        value = self.pragma(name)
+
+        def restore():
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA {name} = {value}')
+        self.addCleanup(restore)
+
+    def test_pragmas_applied_to_new_connection(self):
+        self.restore_pragma('cache_size')
+        with override_settings(SQLITE_PRAGMAS={'cache_size': -1234}):
+            db.configure_sqlite(None, connection)
+        self.assertEqual(self.pragma('cache_size'), -1234)
+
+    def test_read_connection_is_query_only(self):
+        self.restore_pragma('query_only')
+        # journal_mode внутри транзакции менять нельзя — для читателя его быть не должно
+        with override_settings(SQLITE_PRAGMAS={'journal_mode': 'WAL'}), \
+                mock.patch.object(db, 'read_alias', return_value=connection.alias):
+            db.configure_sqlite(None, connection)
+        self.assertEqual(self.pragma('query_only'), 1)
+
+    def test_router_sends_marked_reads_to_read_alias(self):
+        router = db.ReadOnlyRouter()
+
+        @db.read_only_database
+        def sync_view():
+            return router.db_for_read(DesignRequest)
+
+        @db.read_only_database
+        async def async_view():
+            return router.db_for_read(DesignRequest)
+
+        with mock.patch.object(db, 'read_alias', return_value='readonly'):
+            self.assertIsNone(router.db_for_read(DesignRequest))
+            self.assertEqual(sync_view(), 'readonly')
+            self.assertEqual(async_to_sync(async_view)(), 'readonly')
+            self.assertIsNone(router.db_for_read(DesignRequest))
+        self.assertEqual(router.db_for_write(DesignRequest), 'default')
+        self.assertFalse(router.allow_migrate('readonly', 'catalog'))
+
+    def test_stress_command_replaces_stale_database(self):
+        command = stress_sqlite.Command()
+        stats = {'journal_mode': 'wal', 'write': [1, 0, 0], 'read': [1, 0, 0], 'counters': ({}, {})}
+        with mock.patch.object(connection.creation, 'create_test_db') as create, \
+                mock.patch.object(connection.creation, 'destroy_test_db') as destroy, \
+                mock.patch.object(stress_sqlite, 'setup_test_environment'), \
+                mock.patch.object(stress_sqlite, 'teardown_test_environment'), \
+                mock.patch.object(connection, 'settings_dict', {**connection.settings_dict, 'TEST': {}}), \
+                mock.patch.object(stress_sqlite.connections, 'close_all'), \
+                mock.patch.object(command, 'run_threads', return_value=stats):
+            call_command(command, '--duration', '0.1', stdout=io.StringIO())
+        # Файл, оставшийся от прерванного запуска, удаляется без вопроса в консоли
+        create.assert_called_once_with(verbosity=0, autoclobber=True)
+        destroy.assert_called_once()
+
+
+class CachedUserBackendTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.backend = CachedModelBackend()
+
+    def test_user_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_user(self.client_user.pk), self.client_user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.client_user.pk), self.client_user)
+
+    async def test_async_user_loaded_once(self):
+        user = await self.backend.aget_user(self.client_user.pk)
+        self.assertEqual(user, self.client_user)
+        self.assertEqual(await cache.aget(user_cache_key(self.client_user.pk)), self.client_user)
+
+    def test_save_and_delete_invalidate_cache(self):
+        self.backend.get_user(self.client_user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_user.full_name = 'Новое имя'
+            self.client_user.save()
+        self.assertIsNone(cache.get(user_cache_key(self.client_user.pk)))
+        self.assertEqual(self.backend.get_user(self.client_user.pk).full_name, 'Новое имя')
+
+        pk = self.client_user.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_user.delete()
+        self.assertIsNone(self.backend.get_user(pk))
+
+    def test_inactive_cached_user_rejected(self):
+        self.client_user.is_active = False
+        cache.set(user_cache_key(self.client_user.pk), self.client_user)
+        self.assertIsNone(self.backend.get_user(self.client_user.pk))
+
+    def test_password_change_ends_cached_session(self):
+        self.client.force_login(self.client_user)
+        self.assertEqual(self.client.get(reverse('my_requests')).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_user.set_password('changed')
+            self.client_user.save()
+        response = self.client.get(reverse('my_requests'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response['Location'])
+
+
+class MediaServingTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.design_request = self.make_request()
+        self.url = reverse('request-image', args=[self.design_request.pk, 'plan_image'])
+        with self.design_request.plan_image.open('rb') as f:
+            self.content = f.read()
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_only_owner_and_staff_see_plan(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        other = CustomUser.objects.create_user('other', password='secret', full_name='Другой')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        for user in (self.client_user, self.admin):
+            self.client.force_login(user)
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.body(response), self.content)
+            self.assertEqual(response['Content-Type'], 'image/png')
+            self.assertIn('private', response['Cache-Control'])
+
+    def test_completed_design_is_public(self):
+        url = reverse('request-image', args=[self.design_request.pk, 'design_image'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.design_request.complete(png('design.png', 'green'))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_range_requests(self):
+        self.client.force_login(self.client_user)
+        size = len(self.content)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{size}')
+        self.assertEqual(self.body(response), self.content[:10])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.content[-5:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+        # Файл изменился после If-Range — диапазон не применяется
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='Mon, 01 Jan 2001 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_not_modified(self):
+        self.client.force_login(self.client_user)
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_derivative_requested_by_width(self):
+        self.client.force_login(self.client_user)
+        response = self.client.get(self.url, {'w': DERIVATIVE_WIDTHS[0], 'fmt': 'jpg'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(self.client.get(self.url, {'w': 123}).status_code, 404)
+
+    def test_offloaded_serving_modes(self):
+        self.client.force_login(self.client_user)
+        name = self.design_request.plan_image.name
+        with override_settings(MEDIA_SERVE_MODE='nginx', MEDIA_ACCEL_PREFIX='/protected-media/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{name}')
+        with override_settings(MEDIA_SERVE_MODE='sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.design_request.plan_image.path)
+
+
+class RollupTests(CatalogTestCase):
+    def snapshot(self):
+        return sorted(DailyRollup.objects.values_list(
+            'day', 'category_id', 'status', 'count', 'open_count'
+        ))
+
+    def test_transitions_update_rollups(self):
+        first, second = self.make_request('Первая'), self.make_request('Вторая')
+        DesignRequest.objects.filter(pk=first.pk).take_to_work('Берём')
+        DesignRequest.objects.filter(pk=first.pk).complete(png('design.png', 'green'))
+        second.status = 'in_progress'
+        second.taken_at = timezone.now()
+        second.save()
+        stats = rollups.throughput(timezone.localdate())[self.category.pk]
+        self.assertEqual(stats['new'][0], 2)
+        self.assertEqual(stats['in_progress'][0], 2)
+        self.assertEqual(stats['completed'][0], 1)
+        self.assertEqual(dict(rollups.backlog_by_age())['сегодня'], 1)
+
+        second.delete()
+        self.assertEqual(dict(rollups.backlog_by_age())['сегодня'], 0)
+
+    def test_backlog_grouped_by_age(self):
+        for days in (0, 3, 10, 40):
+            design_request = self.make_request(f'{days} дней')
+            created_at = timezone.now() - timedelta(days=days)
+            self.set_created(design_request, created_at)
+        rollups.rebuild()
+        self.assertEqual([count for _label, count in rollups.backlog_by_age()], [1, 1, 1, 1])
+
+    def test_rebuild_matches_incremental_updates(self):
+        first, second = self.make_request('Первая'), self.make_request('Вторая')
+        DesignRequest.objects.filter(pk=first.pk).take_to_work('Берём')
+        DesignRequest.objects.filter(pk__in=[first.pk, second.pk]).complete(png('design.png', 'green'))
+        self.make_request('Третья')
+        incremental = self.snapshot()
+        rollups.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_analytics_page(self):
+        design_request = self.make_request()
+        DesignRequest.objects.filter(pk=design_request.pk).take_to_work('Берём')
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin-analytics'), {'days': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['days'], 7)
+        self.assertEqual(response.context['categories'][0]['taken'], 1)
+        self.client.force_login(self.client_user)
+        self.assertEqual(self.client.get(reverse('admin-analytics')).status_code, 302)
+
+    def test_format_duration(self):
+        self.assertEqual(rollups.format_duration(None), '—')
+        self.assertEqual(rollups.format_duration(12 * 60), '12 мин')
+        self.assertEqual(rollups.format_duration(5 * 3600 + 600), '5 ч 10 мин')
+        self.assertEqual(rollups.format_duration(2 * 86400 + 3 * 3600), '2 д 3 ч')
+
+    def test_rebuild_counts_archived_requests(self):
+        design_request = self.make_request()
+        DesignRequest.objects.filter(pk=design_request.pk).take_to_work('Берём')
+        DesignRequest.objects.filter(pk=design_request.pk).complete(png('design.png', 'green'))
+        DesignRequest.objects.filter(pk=design_request.pk).update(completed_at=timezone.now() - timedelta(days=400))
+        self.set_created(design_request, timezone.now() - timedelta(days=401))
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.archive_requests(timezone.now() - timedelta(days=365))
+        self.assertEqual(rollups.rebuild(), 1)
+        summary = rollups.throughput(timezone.localdate() - timedelta(days=500))
+        self.assertEqual(summary[self.category.pk]['new'][0], 1)
+        self.assertEqual(summary[self.category.pk]['completed'][0], 1)
+
+    def test_import_updates_rollups(self):
+        path = os.path.join(self.media_root, 'rollups.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'title': 'Импорт', 'client': 'client', 'category': 'Кухня', 'status': 'completed',
+                'created_at': '2024-03-01T10:00:00+00:00', 'updated_at': '2024-03-02T10:00:00+00:00',
+            }) + '\n')
+        call_command('import_requests', path, stdout=io.StringIO())
+        days = dict(rollups.daily(date(2024, 1, 1)))
+        self.assertEqual(days[date(2024, 3, 1)], {'new': 1})
+        self.assertEqual(days[date(2024, 3, 2)], {'completed': 1})
+
+
+class OutboxTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        CustomUser.objects.filter(pk=self.client_user.pk).update(email='client@example.com')
+        self.client_user.refresh_from_db()
+
+    def send(self):
+        out = io.StringIO()
+        call_command('send_notifications', '--once', stdout=out)
+        return out.getvalue()
+
+    def test_transitions_write_events(self):
+        design_request = self.make_request()
+        self.assertFalse(OutboxEvent.objects.exists())
+        DesignRequest.objects.filter(pk=design_request.pk).take_to_work('Берём')
+        self.assertEqual(list(OutboxEvent.objects.values_list('status', flat=True)), ['in_progress'])
+
+    def test_rolled_back_transition_sends_nothing(self):
+        design_request = self.make_request()
+        try:
+            with transaction.atomic():
+                DesignRequest.objects.filter(pk=design_request.pk).take_to_work('Берём')
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_events_of_one_request_collapse_into_one_email(self):
+        design_request = self.make_request('Кухня')
+        DesignRequest.objects.filter(pk=design_request.pk).take_to_work('Берём')
+        DesignRequest.objects.filter(pk=design_request.pk).complete(png('design.png', 'green'))
+        self.assertIn('Отправлено писем: 1, ошибок: 0', self.send())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Заявка «Кухня» выполнена')
+        self.assertEqual(mail.outbox[0].to, ['client@example.com'])
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_stale_events_are_dropped(self):
+        design_request = self.make_request()
+        DesignRequest.objects.filter(pk=design_request.pk).take_to_work('Берём')
+        # Статус вернули вручную: письмо «принята в работу» уже неверно
+        DesignRequest.objects.filter(pk=design_request.pk).update(status='new')
+        self.send()
+        self.assertEqual(mail.outbox, [])
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    @override_settings(OUTBOX_RETRY_DELAY=30)
+    def test_failed_send_is_retried_later(self):
+        design_request = self.make_request()
+        DesignRequest.objects.filter(pk=design_request.pk).take_to_work('Берём')
+        connection = mock.Mock()
+        connection.send_messages.side_effect = OSError('SMTP недоступен')
+        with self.assertLogs('catalog.outbox', 'WARNING'):
+            self.assertEqual(outbox.drain(connection), (1, 0, 1))
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(event.last_error, 'SMTP недоступен')
+        self.assertGreater(event.available_at, timezone.now() + timedelta(seconds=20))
+        # До срока повтора событие не берётся
+        self.assertEqual(outbox.drain(connection), (0, 0, 0))
+        connection.close.assert_called()
+
+
+class JsonlImportExportTests(CatalogTestCase):
+    def path(self, name):
+        return os.path.join(self.media_root, name)
+
+    def write_lines(self, name, lines):
+        with open(self.path(name), 'w', encoding='utf-8') as f:
+            f.writelines(line + '\n' for line in lines)
+        return self.path(name)
+
+    def test_round_trip_keeps_ids_and_timestamps(self):
+        old = self.make_request('Старая')
+        self.set_created(old, timezone.now() - timedelta(days=30))
+        DesignRequest.objects.filter(pk=old.pk).update(status='completed')
+        self.make_request('Новая')
+        expected = {
+            pk: (title, status, created_at)
+            for pk, title, status, created_at in DesignRequest.objects.values_list('pk', 'title', 'status', 'created_at')
+        }
+        call_command('export_requests', self.path('requests.jsonl'), stderr=io.StringIO())
+        DesignRequest.objects.all().delete()
+
+        out = io.StringIO()
+        call_command('import_requests', self.path('requests.jsonl'), stdout=out)
+        self.assertIn('Импортировано: 2, пропущено: 0', out.getvalue())
+        imported = {
+            pk: (title, status, created_at)
+            for pk, title, status, created_at in DesignRequest.objects.values_list('pk', 'title', 'status', 'created_at')
+        }
+        self.assertEqual(imported, expected)
+        self.assertEqual(counters.status_count('completed'), 1)
+        self.assertEqual(counters.status_count('new'), 1)
+
+    def test_reimport_skips_existing_requests(self):
+        self.make_request()
+        call_command('export_requests', self.path('requests.jsonl'), stderr=io.StringIO())
+        out = io.StringIO()
+        call_command('import_requests', self.path('requests.jsonl'), stdout=out)
+        self.assertIn('Импортировано: 0, пропущено: 1', out.getvalue())
+        self.assertEqual(DesignRequest.objects.count(), 1)
+
+    def test_invalid_lines_are_reported_and_skipped(self):
+        path = self.write_lines('bad.jsonl', [
+            json.dumps({'title': 'Хорошая', 'client': 'client', 'category': 'Кухня'}),
+            'не json',
+            json.dumps({'title': 'Без клиента', 'client': 'nobody', 'category': 'Кухня'}),
+            json.dumps({'title': 'Странный статус', 'client': 'client', 'category': 'Кухня', 'status': 'lost'}),
+        ])
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_requests', path, stdout=out, stderr=err)
+        self.assertIn('Импортировано: 1, пропущено: 3', out.getvalue())
+        self.assertIn('Строка 2', err.getvalue())
+        self.assertIn('неизвестный клиент «nobody»', err.getvalue())
+        self.assertEqual(list(DesignRequest.objects.values_list('title', flat=True)), ['Хорошая'])
+
+    def test_dry_run_and_offset(self):
+        path = self.write_lines('new.jsonl', [
+            json.dumps({'title': f'Заявка {i}', 'client': 'client', 'category': 'Новая', 'status': 'new'})
+            for i in range(3)
+        ])
+        out = io.StringIO()
+        call_command('import_requests', path, '--dry-run', '--create-categories', stdout=out)
+        self.assertIn('Проверено: 3', out.getvalue())
+        self.assertFalse(DesignRequest.objects.exists())
+        self.assertFalse(Category.objects.filter(name='Новая').exists())
+
+        call_command('import_requests', path, '--offset', '1', '--batch-size', '1', '--create-categories',
+                     stdout=io.StringIO())
+        self.assertEqual(
+            sorted(DesignRequest.objects.values_list('title', flat=True)), ['Заявка 1', 'Заявка 2']
+        )
+
+    def test_export_offset_appends(self):
+        for i in range(3):
+            self.make_request(f'Заявка {i}')
+        call_command('export_requests', self.path('part.jsonl'), '--chunk-size', '2', stderr=io.StringIO())
+        with open(self.path('part.jsonl'), encoding='utf-8') as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 3)
+        with open(self.path('resume.jsonl'), 'w', encoding='utf-8') as f:
+            f.writelines(lines[:1])
+        call_command('export_requests', self.path('resume.jsonl'), '--offset', '1', stderr=io.StringIO())
+        with open(self.path('resume.jsonl'), encoding='utf-8') as f:
+            self.assertEqual(f.readlines(), lines)
+
+
+class ApiTransitionTests(CatalogTestCase):
+    def test_report_matches_update(self):
+        fresh, taken = self.make_request('Новая'), self.make_request('В работе')
+        DesignRequest.objects.filter(pk=taken.pk).take_to_work('Уже')
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('api-request-transitions'), {'operations': [
+            {'action': 'take_to_work', 'ids': [str(fresh.pk), str(taken.pk)], 'comment': 'Берём'},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        result = response.json()['results'][0]
+        self.assertEqual(result['updated'], 1)
+        self.assertEqual(result['applied'], [str(fresh.pk)])
+        self.assertEqual(result['skipped'], [str(taken.pk)])
+
+
+class ExportTests(CatalogTestCase):
+    def test_csv_formulas_are_neutralised(self):
+        self.make_request('=HYPERLINK("http://evil","x")')
+        self.make_request('-2+3')
+        body = b''.join(export.csv_chunks(DesignRequest.objects.all())).decode('utf-8')
+        self.assertIn('"\'=HYPERLINK(""http://evil"",""x"")"', body)
+        self.assertIn("'-2+3", body)
+
+
+class ContentAddressedStorageTests(CatalogTestCase):
+    def test_same_content_is_stored_once(self):
+        first, second = self.make_request('Первая'), self.make_request('Вторая')
+        self.assertEqual(first.plan_image.name, second.plan_image.name)
+        self.assertEqual(MediaBlob.objects.get(name=first.plan_image.name).refcount, 2)
+
+    def test_file_removed_with_last_reference(self):
+        first, second = self.make_request('Первая'), self.make_request('Вторая')
+        name, storage = first.plan_image.name, first.plan_image.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+    def test_reupload_before_collect_keeps_file(self):
+        first = self.make_request('Первая')
+        name, storage = first.plan_image.name, first.plan_image.storage
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.delete()
+        # Та же картинка загружена до уборки файла удалённой заявки
+        second = self.make_request('Вторая')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(second.plan_image.name, name)
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+
+    def test_reupload_after_collect_restores_file(self):
+        first = self.make_request('Первая')
+        name, storage = first.plan_image.name, first.plan_image.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertFalse(storage.exists(name))
+        second = self.make_request('Вторая')
+        self.assertEqual(second.plan_image.name, name)
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+
+    def test_unused_design_file_is_discarded(self):
+        design_request = self.make_request()
+        DesignRequest.objects.filter(pk=design_request.pk).complete(png('design.png', 'green'))
+        design_request.refresh_from_db()
+        name, storage = design_request.design_image.name, design_request.design_image.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            # Заявка уже выполнена: файл никому не нужен, кроме неё
+            self.assertEqual(DesignRequest.objects.filter(pk=design_request.pk).complete(png('other.png', 'blue')), 0)
+        self.assertTrue(storage.exists(name))
+        # Строка блоба, созданная при сохранении, удалена вместе с файлом
+        self.assertEqual(MediaBlob.objects.count(), 2)
+
+    def test_imported_request_keeps_shared_file(self):
+        original = self.make_request()
+        name, storage = original.plan_image.name, original.plan_image.storage
+        record = {'title': 'Импорт', 'client': 'client', 'category': 'Кухня', 'plan_image': name}
+        path = os.path.join(self.media_root, 'import.jsonl')
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(json.dumps(record) + '\n')
+        call_command('import_requests', path, stdout=io.StringIO())
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            original.delete()
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+
+
+class DerivativeTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        # Одинаковые картинки разных тестов попадают в один блоб: превью не должны переживать тест
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def make_request(self, title='Заявка', color='red', **kwargs):
+        kwargs.setdefault('client', self.client_user)
+        kwargs.setdefault('category', self.category)
+        return DesignRequest.objects.create(
+            title=title, description='Описание', plan_image=png(color=color, size=(800, 600)), **kwargs
+        )
+
+    def test_derivatives_built_after_commit(self):
+        executor = mock.Mock()
+        executor.submit.side_effect = lambda fn, *args: fn(*args)
+        design_request = self.make_request()
+        with mock.patch.object(images, '_get_executor', return_value=executor):
+            with self.captureOnCommitCallbacks(execute=True):
+                design_request.complete(png('design.png', 'green', size=(800, 600)))
+        storage, name = design_request.design_image.storage, design_request.design_image.name
+        for width in DERIVATIVE_WIDTHS:
+            for fmt in images.derivative_formats():
+                target = images.derivative_name(name, width, fmt)
+                self.assertTrue(storage.exists(target))
+        with storage.open(images.derivative_name(name, 320, 'jpg')) as f:
+            self.assertEqual(Image.open(f).size, (320, 240))
+
+    def test_small_image_is_not_upscaled(self):
+        design_request = DesignRequest.objects.create(
+            title='Маленькая', client=self.client_user, category=self.category, plan_image=png(),
+        )
+        storage, name = design_request.plan_image.storage, design_request.plan_image.name
+        target = images.ensure_derivative(storage, name, 640)
+        with storage.open(target) as f:
+            self.assertEqual(Image.open(f).size, (40, 30))
+
+    def test_missing_derivative_built_lazily(self):
+        design_request = self.make_request()
+        storage, name = design_request.plan_image.storage, design_request.plan_image.name
+        target = images.derivative_name(name, 640, 'jpg')
+        self.assertFalse(storage.exists(target))
+        self.assertEqual(images.ensure_derivative(storage, name, 640), target)
+        self.assertTrue(storage.exists(target))
+        # Следующие обращения файл не перестраивают
+        self.assertEqual(images.build_derivatives(storage, name), 0)
+
+    def test_unreadable_original_falls_back_to_itself(self):
+        design_request = self.make_request()
+        storage, name = design_request.plan_image.storage, design_request.plan_image.name
+        with open(storage.path(name), 'wb') as f:
+            f.write(b'not an image')
+        with self.assertLogs('catalog.images', 'ERROR'):
+            self.assertEqual(images.ensure_derivative(storage, name, 320), name)
+
+    def test_derivatives_deleted_with_original(self):
+        design_request = self.make_request()
+        storage, name = design_request.plan_image.storage, design_request.plan_image.name
+        images.build_derivatives(storage, name)
+        with self.captureOnCommitCallbacks(execute=True):
+            design_request.delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(storage.exists(images.derivative_name(name, 320, 'jpg')))
+
+    def test_build_derivatives_command(self):
+        self.make_request()
+        self.make_request('Вторая', color='blue')
+        out = io.StringIO()
+        call_command('build_derivatives', '--workers', '2', stdout=out)
+        per_file = len(DERIVATIVE_WIDTHS) * len(images.derivative_formats())
+        self.assertIn(f'Файлов: 2, создано превью: {2 * per_file}, ошибок: 0', out.getvalue())
+
+
+class MediaGcTests(CatalogTestCase):
+    def test_recheck_keeps_derivatives_of_referenced_original(self):
+        design_request = self.make_request()
+        root = os.path.splitext(design_request.plan_image.name)[0]
+        width = DERIVATIVE_WIDTHS[0]
+        candidates = [f'{root}_{width}w.jpg', 'cas/00/00/gone_320w.jpg', 'cas/00/00/gone.png']
+        self.assertEqual(media_gc.still_referenced(candidates), {design_request.plan_image.name, candidates[0]})
+
+    def test_only_request_image_dirs_are_collected(self):
+        design_request = self.make_request()
+        paths = {}
+        for name in ('cas/00/00/orphan.png', 'plans/2020/01/01/orphan.png', '.upload-orphan', 'avatars/user.png'):
+            path = paths[name] = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'x')
+            self.addCleanup(lambda path=path: os.path.exists(path) and os.remove(path))
+        stats = media_gc.collect(self.media_root, media_gc.load_references(), grace=-60)
+        self.assertEqual(stats['orphans'], 3)
+        self.assertTrue(os.path.exists(paths['avatars/user.png']))
+        self.assertFalse(os.path.exists(paths['cas/00/00/orphan.png']))
+        self.assertFalse(os.path.exists(paths['.upload-orphan']))
+        self.assertTrue(design_request.plan_image.storage.exists(design_request.plan_image.name))
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    def test_pages_follow_cursors(self):
+        now = timezone.now()
+        for i in range(7):
+            self.set_created(self.make_request(f'Заявка {i}'), now - timedelta(minutes=i))
+        queryset = DesignRequest.objects.all()
+        first = paginate_keyset(queryset, per_page=3)
+        self.assertEqual([r.title for r in first], ['Заявка 0', 'Заявка 1', 'Заявка 2'])
+        self.assertFalse(first.has_previous)
+        second = paginate_keyset(queryset, first.next_cursor, per_page=3)
+        self.assertEqual([r.title for r in second], ['Заявка 3', 'Заявка 4', 'Заявка 5'])
+        last = paginate_keyset(queryset, second.next_cursor, per_page=3)
+        self.assertEqual([r.title for r in last], ['Заявка 6'])
+        self.assertFalse(last.has_next)
+        back = paginate_keyset(queryset, second.previous_cursor, per_page=3)
+        self.assertEqual([r.title for r in back], ['Заявка 0', 'Заявка 1', 'Заявка 2'])
+
+    def test_broken_cursor_is_ignored(self):
+        self.assertIsNone(decode_cursor('не-курсор'))
+
+
+class ConditionalGetTests(CatalogTestCase):
+    def test_detail_returns_304_until_changed(self):
+        design_request = self.make_request()
+        self.client.force_login(self.client_user)
+        url = reverse('request-detail', args=[design_request.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        DesignRequest.objects.filter(pk=design_request.pk).take_to_work('Берём')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_other_client_gets_no_etag(self):
+        design_request = self.make_request()
+        other = CustomUser.objects.create_user('other', password='secret', full_name='Другой')
+        self.client.force_login(other)
+        response = self.client.get(reverse('request-detail', args=[design_request.pk]))
+        self.assertNotEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class ArchiveTests(CatalogTestCase):
+    def test_completed_requests_move_to_archive(self):
+        done, fresh = self.make_request('Старая'), self.make_request('Новая')
+        done.complete(png('design.png', 'green'))
+        DesignRequest.objects.filter(pk=done.pk).update(completed_at=timezone.now() - timedelta(days=400))
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = archive.archive_requests(timezone.now() - timedelta(days=365))
+        self.assertEqual(moved, 1)
+        self.assertFalse(DesignRequest.objects.filter(pk=done.pk).exists())
+        self.assertTrue(DesignRequest.objects.filter(pk=fresh.pk).exists())
+        archived = ArchivedRequest.objects.get(pk=done.pk)
+        self.assertEqual(archived.category_name, 'Кухня')
+        # Файлы остались: ссылки перешли к архивной строке
+        self.assertTrue(archived.plan_image.storage.exists(archived.plan_image.name))
+        self.assertIsInstance(archive.find_request(done.pk), ArchivedRequest)
+
+        self.client.force_login(self.client_user)
+        self.assertEqual(self.client.get(reverse('request-detail', args=[done.pk])).status_code, 200)
+
+    def test_missing_hot_file_skips_only_its_request(self):
+        cold_root = tempfile.mkdtemp(prefix='catalog-cold-')
+        self.addCleanup(shutil.rmtree, cold_root, ignore_errors=True)
+        kept, lost = self.make_request('Есть файл'), self.make_request('Нет файла', color='blue')
+        DesignRequest.objects.filter(pk__in=[kept.pk, lost.pk]).update(
+            status='completed', completed_at=timezone.now() - timedelta(days=400)
+        )
+        os.remove(lost.plan_image.path)
+        storages = {**settings.STORAGES, 'request_images_cold': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': cold_root},
+        }}
+        with override_settings(STORAGES=storages), self.assertLogs('catalog.archive', 'WARNING'):
+            moved = archive.archive_requests(timezone.now() - timedelta(days=365), cold=True)
+        self.assertEqual(moved, 1)
+        self.assertTrue(ArchivedRequest.objects.get(pk=kept.pk).cold)
+        self.assertTrue(DesignRequest.objects.filter(pk=lost.pk).exists())
+
+    def test_dedupe_media_rewrites_archived_rows(self):
+        active, done = self.make_request('Активная'), self.make_request('Старая', color='blue')
+        DesignRequest.objects.filter(pk=done.pk).update(
+            status='completed', completed_at=timezone.now() - timedelta(days=400)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.archive_requests(timezone.now() - timedelta(days=365))
+        legacy = os.path.join(self.media_root, 'plans', 'legacy.png')
+        os.makedirs(os.path.dirname(legacy), exist_ok=True)
+        with open(legacy, 'wb') as f:
+            f.write(png(color='white').read())
+        DesignRequest.objects.filter(pk=active.pk).update(plan_image='plans/legacy.png')
+        ArchivedRequest.objects.filter(pk=done.pk).update(plan_image='plans/legacy.png')
+
+        call_command('dedupe_media', stdout=io.StringIO())
+        active.refresh_from_db()
+        archived = ArchivedRequest.objects.get(pk=done.pk)
+        self.assertTrue(active.plan_image.name.startswith('cas/'))
+        self.assertEqual(archived.plan_image.name, active.plan_image.name)
+        self.assertTrue(archived.plan_image.storage.exists(archived.plan_image.name))
+        self.assertFalse(os.path.exists(legacy))
+
+
+class CategoryDeletionTests(CatalogTestCase):
+    def test_marked_category_is_purged_by_command(self):
+        for i in range(3):
+            self.make_request(f'Заявка {i}')
+        self.assertEqual(deletion.mark_for_deletion([self.category]), 1)
+        # Веб-запрос только помечает категорию
+        self.assertEqual(DesignRequest.objects.count(), 3)
+        with override_settings(CATEGORY_DELETE_BATCH_SIZE=2):
+            call_command('purge_categories', once=True, stdout=io.StringIO())
+        self.assertFalse(Category.objects.exists())
+        self.assertFalse(DesignRequest.objects.exists())
+        self.assertEqual(counters.status_count('new'), 0)
+
+    def test_admin_cannot_move_request_to_deleting_category(self):
+        design_request = self.make_request()
+        doomed = Category.objects.create(name='Ванная', deleting=True)
+        superuser = CustomUser.objects.create_superuser('root', password='secret', full_name='Админ')
+        self.client.force_login(superuser)
+        response = self.client.get(reverse('admin:catalog_designrequest_change', args=[design_request.pk]))
+        self.assertNotIn(doomed, response.context['adminform'].form.fields['category'].queryset)
+
+
+class QueueTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_admin = CustomUser.objects.create_user('admin2', password='secret', full_name='Второй', is_staff=True)
+        now = timezone.now()
+        self.requests = []
+        for i in range(3):
+            design_request = self.make_request(f'Заявка {i}')
+            self.set_created(design_request, now - timedelta(hours=3 - i))
+            self.requests.append(design_request)
+
+    def test_claims_oldest_free_request(self):
+        first = queue.claim_next(self.admin)
+        second = queue.claim_next(self.other_admin)
+        self.assertEqual(first.pk, self.requests[0].pk)
+        self.assertEqual(second.pk, self.requests[1].pk)
+        self.assertEqual([r.pk for r in queue.my_queue(self.admin)], [first.pk])
+
+    def test_expired_claim_is_reclaimed(self):
+        claimed = queue.claim_next(self.admin)
+        DesignRequest.objects.filter(pk=claimed.pk).update(claimed_until=timezone.now() - timedelta(seconds=1))
+        reclaimed = queue.claim_next(self.other_admin)
+        self.assertEqual(reclaimed.pk, claimed.pk)
+        self.assertEqual(reclaimed.assignee, self.other_admin)
+        self.assertEqual(list(queue.my_queue(self.admin)), [])
+
+    def test_release_returns_request(self):
+        claimed = queue.claim_next(self.admin)
+        self.assertEqual(queue.release(self.admin, claimed.pk), 1)
+        self.assertEqual(queue.claim_next(self.other_admin).pk, claimed.pk)
+
+    def test_empty_queue(self):
+        for _ in self.requests:
+            queue.claim_next(self.admin)
+        self.assertIsNone(queue.claim_next(self.other_admin))
+
+    def test_claim_is_one_update(self):
+        # Выбор и захват — один UPDATE: между ними нет окна, в котором заявку взял бы другой
+        DesignRequest.objects.filter(pk=self.requests[0].pk).update(
+            assignee=self.other_admin, claimed_until=timezone.now() + timedelta(minutes=5)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            claimed = queue.claim_next(self.admin)
+        self.assertEqual(claimed.pk, self.requests[1].pk)
+        self.assertEqual(claimed.assignee, self.admin)
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+
+    def test_claim_in_category(self):
+        other_category = Category.objects.create(name='Спальня')
+        DesignRequest.objects.filter(pk=self.requests[2].pk).update(category=other_category)
+        self.assertEqual(queue.claim_next(self.admin, other_category).pk, self.requests[2].pk)
+        self.assertIsNone(queue.claim_next(self.admin, other_category))
+
+    def test_claimed_request_is_protected_in_api(self):
+        claimed = queue.claim_next(self.admin)
+        self.client.force_login(self.other_admin)
+        response = self.client.post(reverse('api-request-transitions'), {'operations': [
+            {'action': 'take_to_work', 'ids': [str(claimed.pk)], 'comment': 'Моя'},
+        ]}, content_type='application/json')
+        self.assertEqual(response.json()['results'][0]['skipped'], [str(claimed.pk)])
+        self.assertEqual(DesignRequest.objects.get(pk=claimed.pk).status, 'new')
+
+    def test_claimed_request_is_protected_in_views(self):
+        claimed = queue.claim_next(self.admin)
+        self.client.force_login(self.other_admin)
+        self.client.post(reverse('admin-take-to-work', args=[claimed.pk]), {'comment': 'Моя'})
+        self.assertEqual(DesignRequest.objects.get(pk=claimed.pk).status, 'new')
+
+
+class ChunkedUploadTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.client_user)
+        self.upload_dir = tempfile.mkdtemp(prefix='catalog-uploads-')
+        self.addCleanup(shutil.rmtree, self.upload_dir, ignore_errors=True)
+        override = override_settings(CHUNKED_UPLOAD_DIR=self.upload_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, data, size=None):
+        response = self.client.post(reverse('upload-start'), {'filename': 'plan.png', 'size': size or len(data)})
+        token = response.json()['token']
+        response = self.client.put(
+            reverse('upload-chunk', args=[token]), data,
+            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0'
+        )
+        return token, response
+
+    def create(self, token):
+        return self.client.post(reverse('create_request'), {
+            'title': 'Заявка', 'description': 'Описание', 'category': self.category.pk, 'upload_token': token,
+        })
+
+    def test_assembled_upload_becomes_plan(self):
+        token, response = self.upload(png().read())
+        self.assertTrue(response.json()['complete'])
+        self.assertEqual(self.create(token).status_code, 302)
+        self.assertTrue(DesignRequest.objects.get().plan_image.name.startswith('cas/'))
+
+    def test_repeated_chunk_is_rejected(self):
+        data = png().read()
+        token, _response = self.upload(data[:40], size=len(data))
+        response = self.client.put(
+            reverse('upload-chunk', args=[token]), data[:40],
+            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0'
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 40)
+
+    def test_broken_image_is_rejected_before_request(self):
+        # Заголовок PNG настоящий, остальное — мусор
+        token, response = self.upload(png().read()[:60] + b'\0' * 500)
+        self.assertTrue(response.json()['complete'])
+        self.assertEqual(self.create(token).status_code, 200)
+        self.assertFalse(DesignRequest.objects.exists())
+
+
+class BenchmarkTests(CatalogTestCase):
+    def test_pages_are_measured_with_their_real_responses(self):
+        benchmarks.generate(users=3, categories=2, requests=20)
+        name = DesignRequest.objects.values_list('plan_image', flat=True).first()
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, DesignRequest.objects.filter(plan_image=name).count())
+        results = benchmarks.measure(iterations=1, warmup=0)
+        self.assertEqual(results['metrics']['status'], 200)
+        self.assertEqual(results['admin-export-requests']['status'], 200)
+        # Выгрузку дочитывают до конца: запросы при чтении потока тоже учтены
+        self.client.force_login(CustomUser.objects.get(username='bench-admin'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(results['admin-export-requests']['path'])
+        self.assertGreater(results['admin-export-requests']['queries'], len(queries.captured_queries))
+
+
+class MinifyCssTests(TestCase):
+    def test_selector_spaces_are_kept(self):
+        css = '.a :hover , .b > .c { color : red ; content : " a : b " }\n@media (max-width: 600px) { a:hover { margin : 0 } }'
+        self.assertEqual(
+            minify_css(css),
+            '.a :hover,.b>.c{color:red;content:" a : b "}@media (max-width: 600px){a:hover{margin:0}}',
+        )
+
+
+class MetricsTests(CatalogTestCase):
+    def test_finished_process_snapshot_is_compacted(self):
+        directory = tempfile.mkdtemp(prefix='catalog-metrics-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        finished = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True)
+        pid = int(finished.stdout)
+        snapshot = {'histograms': [], 'counters': [[metrics.REQUESTS_TOTAL, [['status', '200'], ['view', 'gone']], 7]]}
+        with open(os.path.join(directory, f'metrics-{pid}-old.json'), 'w') as f:
+            json.dump(snapshot, f)
+        line = 'catalog_requests_total{status="200",view="gone"} 7'
+        with override_settings(METRICS_DIR=directory):
+            self.assertIn(line, metrics.render_prometheus())
+            self.assertFalse(os.path.exists(os.path.join(directory, f'metrics-{pid}-old.json')))
+            # Перенесённые в base.json счётчики не теряются и не удваиваются
+            self.assertIn(line, metrics.render_prometheus())
+
+    def test_template_time_is_measured(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('admin-all-requests'))
+        _buckets, total, count = metrics.registry.histograms[
+            ('catalog_request_template_duration_seconds', 'admin-all-requests')
+        ]
+        self.assertGreater(count, 0)
+        self.assertGreater(total, 0)
+
+
+@override_settings(RATE_LIMITS={'register': {'ip': (2, 3600)}}, UPLOAD_CONCURRENCY=1)
+class RateLimitTests(CatalogTestCase):
+    def test_bucket_refuses_with_retry_after(self):
+        url = reverse('register')
+        self.assertEqual(self.client.post(url, {}).status_code, 200)
+        self.assertEqual(self.client.post(url, {}).status_code, 200)
+        response = self.client.post(url, {})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        # Открыть форму можно всегда
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_upload_shed_when_slots_busy(self):
+        slot = ratelimit.acquire_upload_slot()
+        self.client.force_login(self.client_user)
+        response = self.client.post(reverse('create_request'), {'title': 'Заявка'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        ratelimit.release_upload_slot(slot)
+        response = self.client.post(reverse('create_request'), {
+            'title': 'Заявка', 'description': 'Описание', 'category': self.category.pk, 'plan_image': png(),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(DesignRequest.objects.count(), 1)
+
+    def test_expired_slot_is_not_released_by_old_owner(self):
+        stale = ratelimit.acquire_upload_slot()
+        # Слот истёк, пока шла долгая загрузка, и достался другой
+        cache.delete(stale[0])
+        current = ratelimit.acquire_upload_slot()
+        ratelimit.release_upload_slot(stale)
+        self.assertIsNone(ratelimit.acquire_upload_slot())
+        ratelimit.release_upload_slot(current)
+        self.assertIsNotNone(ratelimit.acquire_upload_slot())
@@ -0,0 +1,231 @@
+import json
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File, locks
+from PIL import Image, ImageFile
+
+from .models import validate_image_file
+
+MAX_UPLOAD_SIZE = 2 * 1024 * 1024  # 2 МБ, как в validate_image_file
+ALLOWED_EXTENSIONS = ('jpg', 'jpeg', 'png', 'bmp')
+
+# Сигнатуры разрешённых форматов: проверяются по первому чанку
+MAGIC_NUMBERS = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'BM', 'BMP'),
+)
+
+
+def upload_dir():
+    path = getattr(settings, 'CHUNKED_UPLOAD_DIR', settings.BASE_DIR / 'uploads_tmp')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def chunk_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 256 * 1024)
+
+
+def max_dimension():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_DIMENSION', 10000)
+
+
+def sniff_image_header(data):
+    """Проверить сигнатуру и размеры изображения по началу файла"""
+    if not any(data.startswith(magic) for magic, _fmt in MAGIC_NUMBERS):
+        raise ValidationError('Файл не является изображением JPG, PNG или BMP.')
+    parser = ImageFile.Parser()
+    try:
+        parser.feed(data)
+    except (OSError, SyntaxError):
+        raise ValidationError('Не удалось прочитать изображение.')
+    if parser.image is not None:
+        check_dimensions(parser.image.size)
+
+
+def check_dimensions(size):
+    width, height = size
+    limit = max_dimension()
+    if width > limit or height > limit:
+        raise ValidationError(f'Размер изображения не должен превышать {limit}×{limit} пикселей.')
+
+
+class ChunkedUpload:
+    """
+    Загрузка файла по частям во временный каталог.
+    Состояние хранится рядом с данными (<token>.json), поэтому загрузку
+    можно продолжить с последнего принятого байта после обрыва связи
+    и в другом процессе.
+    """
+
+    def __init__(self, token, meta):
+        self.token = token
+        self.meta = meta
+
+    @property
+    def data_path(self):
+        return os.path.join(upload_dir(), f'{self.token}.part')
+
+    @property
+    def meta_path(self):
+        return os.path.join(upload_dir(), f'{self.token}.json')
+
+    @property
+    def offset(self):
+        try:
+            return os.path.getsize(self.data_path)
+        except FileNotFoundError:
+            return 0
+
+    @property
+    def size(self):
+        return self.meta['size']
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+    @classmethod
+    def start(cls, user, filename, size):
+        ext = filename.rsplit('.', 1)[-1].lower()
+        if ext not in ALLOWED_EXTENSIONS:
+            raise ValidationError('Разрешены только файлы форматов: JPG, JPEG, PNG, BMP.')
+        if size <= 0 or size > MAX_UPLOAD_SIZE:
+            raise ValidationError('Размер файла не должен превышать 2 МБ.')
+        upload = cls(str(uuid.uuid4()), {
+            'user_id': user.pk,
+            'filename': os.path.basename(filename),
+            'size': size,
+            'started_at': time.time(),
+        })
+        with open(upload.meta_path, 'w') as f:
+            json.dump(upload.meta, f)
+        open(upload.data_path, 'wb').close()
+        return upload
+
+    @classmethod
+    def get(cls, token, user):
+        """Найти загрузку пользователя по токену или вернуть None"""
+        try:
+            token = str(uuid.UUID(token))
+            with open(os.path.join(upload_dir(), f'{token}.json')) as f:
+                meta = json.load(f)
+        except (ValueError, OSError):
+            return None
+        if meta.get('user_id') != user.pk:
+            return None
+        return cls(token, meta)
+
+    def append(self, offset, stream, length):
+        """Дописать чанк с указанной позиции; возвращает новое смещение"""
+        if offset != self.offset:
+            raise ValidationError(f'Ожидалось смещение {self.offset}.', code='offset')
+        if length > chunk_size() or offset + length > self.size:
+            raise ValidationError('Слишком большой фрагмент.')
+        data = stream.read(length)
+        if len(data) != length:
+            raise ValidationError('Фрагмент получен не полностью.', code='offset')
+        if offset == 0:
+            try:
+                sniff_image_header(data)
+            except ValidationError:
+                self.discard()
+                raise
+        try:
+            f = open(self.data_path, 'r+b')
+        except FileNotFoundError:
+            raise ValidationError('Загрузка не найдена.', code='missing')
+        with f:
+            # Повторённый клиентом PUT может прийти вместе с первым: смещение
+            # проверяется и фрагмент пишется под блокировкой файла загрузки
+            locks.lock(f, locks.LOCK_EX)
+            current = f.seek(0, os.SEEK_END)
+            if offset != current:
+                raise ValidationError(f'Ожидалось смещение {current}.', code='offset')
+            f.write(data)
+        return offset + length
+
+    def verify(self):
+        """
+        Проверить собранный файл целиком, как ImageField проверяет обычную
+        загрузку: первый фрагмент подтверждает лишь заголовок
+        """
+        validate_image_file(self.as_file())
+        try:
+            with Image.open(self.data_path) as image:
+                image_format, size = image.format, image.size
+                image.verify()
+        except Exception:
+            # Pillow сообщает о повреждённых файлах разными исключениями
+            raise ValidationError('Не удалось прочитать изображение.')
+        if image_format not in {fmt for _magic, fmt in MAGIC_NUMBERS}:
+            raise ValidationError('Файл не является изображением JPG, PNG или BMP.')
+        check_dimensions(size)
+
+    def as_file(self):
+        return CompletedUpload(self)
+
+    def discard(self):
+        for path in (self.data_path, self.meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class CompletedUpload(File):
+    """
+    Собранная загрузка для ImageField. Благодаря temporary_file_path
+    FileSystemStorage переносит файл на место, не перечитывая байты;
+    сам файл открывается, только если хранилищу нужно его содержимое.
+    """
+
+    def __init__(self, upload):
+        self.upload = upload
+        self._file = None
+        super().__init__(None, name=upload.meta['filename'])
+
+    @property
+    def file(self):
+        if self._file is None:
+            self._file = open(self.upload.data_path, 'rb')
+        return self._file
+
+    @file.setter
+    def file(self, value):
+        self._file = value
+
+    @property
+    def size(self):
+        return self.upload.size
+
+    def temporary_file_path(self):
+        return self.upload.data_path
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def purge_stale_uploads(max_age):
+    """Удалить загрузки, в которые ничего не писали дольше max_age секунд"""
+    removed = 0
+    cutoff = time.time() - max_age
+    with os.scandir(upload_dir()) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.json'):
+                continue
+            upload = ChunkedUpload(entry.name[:-len('.json')], {})
+            try:
+                touched = os.path.getmtime(upload.data_path)
+            except FileNotFoundError:
+                touched = entry.stat().st_mtime
+            if touched < cutoff:
+                upload.discard()
+                removed += 1
+    return removed
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -10,14 +10,32 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('requests/', views.my_requests, name='my_requests'),
     path('requests/create/', views.create_request, name='create_request'),
+    path('requests/uploads/', views.upload_start, name='upload-start'),
+    path('requests/uploads/<uuid:token>/', views.upload_chunk, name='upload-chunk'),
     path('requests/<uuid:pk>/delete/', views.delete_request, name='delete_request'),
     path('requests/<uuid:pk>/', views.request_detail, name='request-detail'),
+    path('requests/<uuid:pk>/images/<str:field>/', views.request_image, name='request-image'),
 
     path('admin/requests/', views.admin_all_requests, name='admin-all-requests'),
+    path('admin/requests/export/', views.admin_export_requests, name='admin-export-requests'),
+    path('admin/requests/bulk/', views.admin_bulk_transition, name='admin-bulk-transition'),
     path('admin/requests/<uuid:pk>/take-to-work/', views.admin_take_to_work, name='admin-take-to-work'),
     path('admin/requests/<uuid:pk>/complete/', views.admin_complete, name='admin-complete'),
+    path('admin/queue/', views.admin_queue, name='admin-queue'),
+    path('admin/queue/claim/', views.admin_queue_claim, name='admin-queue-claim'),
+    path('admin/queue/<uuid:pk>/release/', views.admin_queue_release, name='admin-queue-release'),
+    path('admin/analytics/', views.admin_analytics, name='admin-analytics'),
 
     path('admin/categories/', views.admin_category_list, name='admin-category-list'),
     path('admin/categories/create/', views.admin_category_create, name='admin-category-create'),
     path('admin/categories/<int:pk>/delete/', views.admin_category_delete, name='admin-category-delete'),
+
+    path('metrics/', views.metrics_view, name='metrics'),
+
+    path('api/v1/requests/', api.request_list, name='api-request-list'),
+    path('api/v1/requests/batch/', api.request_batch, name='api-request-batch'),
+    path('api/v1/requests/claim/', api.request_claim, name='api-request-claim'),
+    path('api/v1/requests/transitions/', api.request_transitions, name='api-request-transitions'),
+    path('api/v1/requests/<uuid:pk>/', api.request_detail, name='api-request-detail'),
+    path('api/v1/categories/', api.category_list, name='api-category-list'),
 ]
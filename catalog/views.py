@@ -1,33 +1,194 @@
+import asyncio
+import hmac
+from datetime import timedelta
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import DesignRequest
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST, require_http_methods, require_safe
+from .models import ArchivedRequest, DesignRequest, validate_image_file
 from .forms import CustomUserCreationForm, DesignRequestForm
 from django.contrib.auth.decorators import user_passes_test
 from .models import Category
 from .forms import CategoryForm
+from .pagination import PAGE_SIZE, apaginate_keyset
+from .search import asearch_requests
+from .images import DERIVATIVE_WIDTHS, derivative_formats, ensure_derivative, schedule_derivatives
+from . import archive, counters, deletion, export, media, metrics, queue, ratelimit, rollups
+from .uploads import ChunkedUpload, chunk_size
+from .db import read_only_database
+from .conditional import conditional_page
 
 
 def is_admin(user):
     return user.is_staff
 
-@user_passes_test(is_admin, login_url='login')
-def admin_all_requests(request):
+async def _load_user(request):
+    """
+    Загрузить пользователя асинхронно и подменить ленивый request.user,
+    чтобы шаблоны и контекст-процессоры не ходили в БД синхронно.
+    """
+    request.user = await request.auser()
+    return request.user
+
+def _admin_requests(request):
+    requests = DesignRequest.objects.select_related('client', 'category', 'assignee')
     status_filter = request.GET.get('status', '')
-    requests = DesignRequest.objects.all()
     if status_filter:
         requests = requests.filter(status=status_filter)
-    requests = requests.order_by('-created_at')
+    category_filter = request.GET.get('category', '')
+    if category_filter.isdigit():
+        requests = requests.filter(category_id=category_filter)
+    return requests, status_filter
+
+def _client_requests(request, user):
+    if _show_archive(request):
+        # Архив клиента: только выполненные, фильтр по статусу не нужен
+        return ArchivedRequest.objects.filter(client=user).select_related('category'), ''
+    requests = DesignRequest.objects.filter(client=user).select_related('category')
+    status_filter = request.GET.get('status', '')
+    if status_filter:
+        requests = requests.filter(status=status_filter)
+    return requests, status_filter
+
+def _show_archive(request):
+    return request.GET.get('archive') == '1'
+
+async def _latest_update(requests):
+    # Обход индекса по updated_at с конца — без сортировки всей выборки
+    return await requests.order_by('-updated_at').values_list('updated_at', flat=True).afirst()
+
+async def _admin_requests_validator(request, user):
+    requests, status_filter = _admin_requests(request)
+    # Число заявок — из поддерживаемых счётчиков статусов, без COUNT(*)
+    statuses = [status_filter] if status_filter else [s for s, _label in DesignRequest.STATUS_CHOICES]
+    counts = await asyncio.gather(*(counters.astatus_count(status) for status in statuses))
+    latest = await _latest_update(requests)
+    return (latest, sum(counts)), latest
+
+async def _client_requests_validator(request, user):
+    requests, _status_filter = _client_requests(request, user)
+    latest = await _latest_update(requests)
+    return (latest, await requests.acount()), latest
+
+async def _request_detail_validator(request, user, pk):
+    row = await DesignRequest.objects.filter(pk=pk).values_list('client_id', 'updated_at').afirst()
+    if row is None:
+        row = await ArchivedRequest.objects.filter(pk=pk).values_list('client_id', 'updated_at').afirst()
+    if row is None or (not user.is_staff and row[0] != user.pk):
+        return None
+    return row, row[1]
+
+@user_passes_test(is_admin, login_url='login')
+@read_only_database
+@conditional_page(_admin_requests_validator)
+async def admin_all_requests(request):
+    query = request.GET.get('q', '').strip()
+    requests, status_filter = _admin_requests(request)
+    if query:
+        # Результаты поиска ранжируются по релевантности, без пагинации
+        page, results = None, await asearch_requests(requests, query)
+    else:
+        page = results = await apaginate_keyset(requests, request.GET.get('cursor'))
     return render(request, 'catalog/admin_all_requests.html', {
-        'requests': requests,
-        'status_filter': status_filter
+        'requests': results,
+        'page': page,
+        'status_filter': status_filter,
+        'category_filter': request.GET.get('category', ''),
+        'categories': [category async for category in Category.objects.filter(deleting=False).order_by('name')],
+        'query': query
     })
-def home(request):
-    # 4 последние заявки со статусом "Выполнено"
-    completed_requests = DesignRequest.objects.filter(status='completed').order_by('-created_at')[:4]
-    # Счётчик заявок в статусе "Принято в работу"
-    in_progress_count = DesignRequest.objects.filter(status='in_progress').count()
+
+# Выгрузка списка заявок с текущими фильтрами — потоком, без загрузки в память
+@user_passes_test(is_admin, login_url='login')
+@require_safe
+def admin_export_requests(request):
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in export.CONTENT_TYPES:
+        raise Http404
+    requests, _status_filter = _admin_requests(request)
+    return export.export_response(request, requests, fmt)
+
+ANALYTICS_PERIODS = (7, 30, 90)
+
+# Аналитика: читает только дневные сводки (catalog.rollups), не заявки
+@user_passes_test(is_admin, login_url='login')
+@read_only_database
+def admin_analytics(request):
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    if days not in ANALYTICS_PERIODS:
+        days = 30
+    start = timezone.localdate() - timedelta(days=days - 1)
+    summary = rollups.throughput(start)
+    categories = []
+    for category in Category.objects.filter(pk__in=summary).order_by('name'):
+        stats = summary[category.pk]
+        created = stats.get('new', (0, 0, 0))[0]
+        taken, wait_taken, _lead = stats.get('in_progress', (0, 0, 0))
+        completed, wait_completed, lead_completed = stats.get('completed', (0, 0, 0))
+        categories.append({
+            'name': category.name,
+            'created': created,
+            'taken': taken,
+            'completed': completed,
+            'to_work': rollups.format_duration(wait_taken / taken if taken else None),
+            'in_work': rollups.format_duration(wait_completed / completed if completed else None),
+            'lead': rollups.format_duration(lead_completed / completed if completed else None),
+        })
+    return render(request, 'catalog/admin_analytics.html', {
+        'days': days,
+        'periods': ANALYTICS_PERIODS,
+        'categories': categories,
+        'daily': rollups.daily(start),
+        'backlog': rollups.backlog_by_age(),
+    })
+
+# Очередь дизайнера: взятые из очереди и принятые им в работу заявки
+@user_passes_test(is_admin, login_url='login')
+def admin_queue(request):
+    return render(request, 'catalog/admin_queue.html', {
+        'requests': queue.my_queue(request.user),
+        'categories': Category.objects.filter(deleting=False).order_by('name'),
+        'lease_minutes': int(queue.lease().total_seconds() // 60),
+    })
+
+@user_passes_test(is_admin, login_url='login')
+@require_POST
+def admin_queue_claim(request):
+    category = request.POST.get('category', '')
+    claimed = queue.claim_next(request.user, int(category) if category.isdigit() else None)
+    if claimed is None:
+        messages.error(request, 'Свободных новых заявок нет.')
+    else:
+        messages.success(request, f'Вы взяли заявку «{claimed.title}».')
+    return redirect('admin-queue')
+
+@user_passes_test(is_admin, login_url='login')
+@require_POST
+def admin_queue_release(request, pk):
+    if queue.release(request.user, pk):
+        messages.success(request, 'Заявка возвращена в очередь.')
+    return redirect('admin-queue')
+
+@read_only_database
+async def home(request):
+    await _load_user(request)
+    # Счётчик "Принято в работу" и 4 последние выполненные заявки — параллельно
+    in_progress_count, completed_requests = await asyncio.gather(
+        counters.astatus_count('in_progress'),
+        counters.alatest_completed(),
+    )
     return render(request, 'catalog/index.html', {
         'completed_requests': completed_requests,
         'in_progress_count': in_progress_count
@@ -53,6 +214,10 @@ def user_login(request):
     if request.method == 'POST':
         username = request.POST['username']
         password = request.POST['password']
+        # Подбор пароля к одному логину с разных адресов
+        wait = ratelimit.hit('login', 'username', username.lower())
+        if wait:
+            return ratelimit.too_many_requests('login', wait, 'Слишком много попыток входа. Повторите позже.')
         user = authenticate(request, username=username, password=password)
         if user is not None:
             login(request, user)
@@ -73,15 +238,30 @@ def profile(request):
 
 # Список своих заявок
 @login_required
-def my_requests(request):
-    status_filter = request.GET.get('status', '')
-    requests = DesignRequest.objects.filter(client=request.user)
-    if status_filter:
-        requests = requests.filter(status=status_filter)
-    requests = requests.order_by('-created_at')
+@read_only_database
+@conditional_page(_client_requests_validator)
+async def my_requests(request):
+    user = request.user
+    query = request.GET.get('q', '').strip()
+    requests, status_filter = _client_requests(request, user)
+    show_archive = _show_archive(request)
+    if query and show_archive:
+        # Архива нет в полнотекстовом индексе; заявки одного клиента — немного строк
+        page = None
+        results = [
+            req async for req in
+            requests.filter(Q(title__icontains=query) | Q(description__icontains=query))[:PAGE_SIZE]
+        ]
+    elif query:
+        page, results = None, await asearch_requests(requests, query)
+    else:
+        page = results = await apaginate_keyset(requests, request.GET.get('cursor'))
     return render(request, 'catalog/my_requests.html', {
-        'requests': requests,
-        'status_filter': status_filter
+        'requests': results,
+        'page': page,
+        'status_filter': status_filter,
+        'query': query,
+        'archive': show_archive,
     })
 
 # Создание заявки
@@ -91,18 +271,60 @@ def create_request(request):
         messages.error(request, 'Администратор не может создавать заявки.')
         return redirect('profile')
     if request.method == 'POST':
-        form = DesignRequestForm(request.POST, request.FILES)
+        form = DesignRequestForm(request.POST, request.FILES, user=request.user)
         if form.is_valid():
             design_req = form.save(commit=False)
             design_req.client = request.user
             design_req.save()
+            if form.chunked_upload is not None:
+                form.chunked_upload.discard()
+            schedule_derivatives(design_req.plan_image)
             messages.success(request, 'Заявка успешно создана!')
             return redirect('my_requests')
         else:
             messages.error(request, 'Ошибка при создании заявки.')
     else:
         form = DesignRequestForm()
-    return render(request, 'catalog/create_request.html', {'form': form})
+    return render(request, 'catalog/create_request.html', {
+        'form': form,
+        'chunk_size': chunk_size(),
+    })
+
+# Загрузка плана по частям: начало загрузки
+@login_required
+@require_POST
+def upload_start(request):
+    try:
+        size = int(request.POST.get('size', ''))
+        upload = ChunkedUpload.start(request.user, request.POST.get('filename', ''), size)
+    except ValueError:
+        return JsonResponse({'error': 'Не указан размер файла.'}, status=400)
+    except ValidationError as exc:
+        return JsonResponse({'error': exc.messages[0]}, status=400)
+    return JsonResponse({'token': upload.token, 'offset': 0, 'chunk_size': chunk_size()}, status=201)
+
+# Загрузка плана по частям: очередной фрагмент или текущее смещение
+@login_required
+@require_http_methods(['GET', 'PUT'])
+def upload_chunk(request, token):
+    upload = ChunkedUpload.get(str(token), request.user)
+    if upload is None:
+        return JsonResponse({'error': 'Загрузка не найдена.'}, status=404)
+    if request.method == 'GET':
+        return JsonResponse({'offset': upload.offset, 'size': upload.size, 'complete': upload.complete})
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.headers.get('Content-Length', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Нужны заголовки Upload-Offset и Content-Length.'}, status=400)
+    try:
+        # Читаем тело напрямую из потока: фрагмент пишется на диск, минуя request.body
+        new_offset = upload.append(offset, request, length)
+    except ValidationError as exc:
+        status = {'offset': 409, 'missing': 404}.get(exc.code, 400)
+        return JsonResponse({'error': exc.messages[0], 'offset': upload.offset}, status=status)
+    return JsonResponse({'offset': new_offset, 'complete': new_offset == upload.size})
 
 # Удаление заявки
 @login_required
@@ -117,33 +339,41 @@ def delete_request(request, pk):
         return redirect('my_requests')
     return render(request, 'catalog/delete_request_confirm.html', {'request_obj': req})
 
-# Детали заявки
-@login_required
-def request_detail(request, pk):
-    req = get_object_or_404(DesignRequest, pk=pk, client=request.user)
-    return render(request, 'catalog/request_detail.html', {'request': req})
-
 @user_passes_test(is_admin, login_url='login')
 def admin_complete(request, pk):
+    error = None
+    if request.method == 'POST':
+        design_image = request.FILES.get('design_image')
+        try:
+            if not design_image:
+                raise ValidationError('Изображение дизайна обязательно.')
+            validate_image_file(design_image)
+        except ValidationError as exc:
+            error = exc.messages[0]
+        else:
+            # Условный UPDATE: без чтения строки и без гонки с другим администратором
+            selected = DesignRequest.objects.filter(queue.claimable_by(request.user), pk=pk, status='new')
+            if selected.complete(design_image):
+                messages.success(request, 'Заявка выполнена.')
+                return redirect('admin-all-requests')
+
     req = get_object_or_404(DesignRequest, pk=pk)
     if req.status != 'new':
         messages.error(request, 'Статус можно изменить только у новых заявок.')
         return redirect('admin-all-requests')
-
-    if request.method == 'POST':
-        design_image = request.FILES.get('design_image')
-        if not design_image:
-            messages.error(request, 'Изображение дизайна обязательно.')
-            return render(request, 'catalog/admin_complete.html', {'request': req})
-        req.complete(design_image)
-        messages.success(request, 'Заявка выполнена.')
+    if req.is_claimed and req.assignee_id != request.user.pk:
+        messages.error(request, 'Заявку взял из очереди другой дизайнер.')
         return redirect('admin-all-requests')
-
+    if error:
+        messages.error(request, error)
     return render(request, 'catalog/admin_complete.html', {'request': req})
 
 @user_passes_test(is_admin, login_url='login')
 def admin_category_list(request):
-    categories = Category.objects.all()
+    categories = list(Category.objects.all())
+    pending = deletion.deletion_progress()
+    for category in categories:
+        category.deletion_progress = pending.get(category.pk)
     return render(request, 'catalog/admin_category_list.html', {'categories': categories})
 
 @user_passes_test(is_admin, login_url='login')
@@ -162,38 +392,122 @@ def admin_category_create(request):
 def admin_category_delete(request, pk):
     category = get_object_or_404(Category, pk=pk)
     if request.method == 'POST':
-        category.delete()  # CASCADE удалит все заявки!
-        messages.success(request, 'Категория и все связанные заявки удалены.')
+        # Заявки удаляются в фоне пачками, не блокируя запись для остальных
+        deletion.mark_for_deletion([category])
+        messages.success(request, 'Категория удаляется вместе с заявками — ход удаления виден в списке.')
         return redirect('admin-category-list')
     return render(request, 'catalog/admin_category_delete_confirm.html', {'category': category})
 
 @user_passes_test(is_admin, login_url='login')
 def admin_take_to_work(request, pk):
+    comment = request.POST.get('comment', '').strip()
+    if request.method == 'POST' and comment:
+        selected = DesignRequest.objects.filter(queue.claimable_by(request.user), pk=pk)
+        if selected.take_to_work(comment, request.user):
+            messages.success(request, 'Заявка принята в работу.')
+            return redirect('admin-all-requests')
+
     req = get_object_or_404(DesignRequest, pk=pk)
     if req.status != 'new':
         messages.error(request, 'Статус можно изменить только у новых заявок.')
         return redirect('admin-all-requests')
-
+    if req.is_claimed and req.assignee_id != request.user.pk:
+        messages.error(request, 'Заявку взял из очереди другой дизайнер.')
+        return redirect('admin-all-requests')
     if request.method == 'POST':
+        messages.error(request, 'Комментарий обязателен.')
+    return render(request, 'catalog/admin_take_to_work.html', {'request': req})
+
+@user_passes_test(is_admin, login_url='login')
+@require_POST
+def admin_bulk_transition(request):
+    # Заявки, взятые из очереди другими дизайнерами, пропускаются
+    selected = DesignRequest.objects.filter(queue.claimable_by(request.user), pk__in=request.POST.getlist('ids'))
+    action = request.POST.get('action')
+    if not request.POST.getlist('ids'):
+        messages.error(request, 'Не выбрано ни одной заявки.')
+    elif action == 'take_to_work':
         comment = request.POST.get('comment', '').strip()
         if not comment:
             messages.error(request, 'Комментарий обязателен.')
-            return render(request, 'catalog/admin_take_to_work.html', {'request': req})
-        req.take_to_work(comment)
-        messages.success(request, 'Заявка принята в работу.')
-        return redirect('admin-all-requests')
-
-    return render(request, 'catalog/admin_take_to_work.html', {'request': req})
+        else:
+            updated = selected.take_to_work(comment, request.user)
+            messages.success(request, f'Принято в работу заявок: {updated}.')
+    elif action == 'complete':
+        design_image = request.FILES.get('design_image')
+        try:
+            if not design_image:
+                raise ValidationError('Изображение дизайна обязательно.')
+            validate_image_file(design_image)
+        except ValidationError as exc:
+            messages.error(request, exc.messages[0])
+        else:
+            updated = selected.filter(status='new').complete(design_image)
+            messages.success(request, f'Выполнено заявок: {updated}.')
+    else:
+        messages.error(request, 'Неизвестное действие.')
+    next_url = request.POST.get('next', '')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = 'admin-all-requests'
+    return redirect(next_url)
 
+# Детали заявки
 @login_required
-def request_detail(request, pk):
-    # Загружаем заявку
-    req = get_object_or_404(DesignRequest, pk=pk)
+@read_only_database
+@conditional_page(_request_detail_validator)
+async def request_detail(request, pk):
+    user = request.user
+    # Перенесённые в архив заявки открываются по тем же ссылкам
+    req = await archive.afind_request(pk)
+    if req is None:
+        raise Http404
 
     # Обычный пользователь может смотреть ТОЛЬКО свои заявки
-    if not request.user.is_staff and req.client != request.user:
+    if not user.is_staff and req.client_id != user.pk:
         messages.error(request, 'У вас нет доступа к этой заявке.')
         return redirect('my_requests')
 
     return render(request, 'catalog/request_detail.html', {'request': req})
 
+# Изображение заявки (или его превью) — с той же проверкой доступа, что и у заявки
+@require_safe
+@read_only_database
+def request_image(request, pk, field):
+    if field not in media.IMAGE_FIELDS:
+        raise Http404
+    req = archive.find_request(pk, DesignRequest.objects.only('client_id', 'status', field))
+    # Чужая заявка неотличима от несуществующей
+    if req is None or not media.can_view_image(request.user, req, field):
+        raise Http404
+    field_file = getattr(req, field)
+    if not field_file:
+        raise Http404
+    if getattr(req, 'cold', False):
+        # Холодное хранилище: только оригинал, без превью
+        response = media.serve_cold(request, field_file.name)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    storage, name = field_file.storage, field_file.name
+    if 'w' in request.GET:
+        try:
+            width = int(request.GET['w'])
+        except ValueError:
+            raise Http404
+        fmt = request.GET.get('fmt', 'jpg')
+        if width not in DERIVATIVE_WIDTHS or fmt not in derivative_formats():
+            raise Http404
+        name = ensure_derivative(storage, name, width, fmt)
+    if not storage.exists(name):
+        raise Http404
+    response = media.serve(request, storage, name)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+# Метрики в формате Prometheus: для администраторов или по токену METRICS_TOKEN
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorization = request.headers.get('Authorization', '')
+    by_token = bool(token) and hmac.compare_digest(authorization, f'Bearer {token}')
+    if not (by_token or request.user.is_staff):
+        return HttpResponseForbidden('Доступ только для администраторов.')
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
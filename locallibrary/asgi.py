@@ -5,6 +5,29 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
+
+Профиль развёртывания под ASGI
+------------------------------
+Страницы чтения (``home``, ``my_requests``, ``admin_all_requests``,
+``request_detail``) написаны как async-представления и обслуживаются
+без перехода в поток на каждый запрос, поэтому медленные клиенты не
+занимают рабочие потоки. Запуск::
+
+    pip install "uvicorn[standard]" gunicorn
+    gunicorn locallibrary.asgi:application \\
+        -k uvicorn.workers.UvicornWorker --workers 4 --bind 0.0.0.0:8000
+
+или без gunicorn::
+
+    uvicorn locallibrary.asgi:application --workers 4 --port 8000
+
+Статику и медиа при этом отдаёт фронтенд-сервер (nginx). При нескольких
+воркерах задайте общий кэш: ``DJANGO_CACHE_BACKEND=file``. Настройки
+SQLite для нагрузки — ``DJANGO_SETTINGS_MODULE=locallibrary.settings_production``
+(под ASGI вместе с ``DJANGO_CONN_MAX_AGE=0``).
+Сравнить пропускную способность с WSGI::
+
+    python manage.py benchmark_handlers --url / --url /admin/requests/ --username admin
 """
 
 import os
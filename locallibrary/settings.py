@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -29,12 +30,22 @@ INSTALLED_APPS = [
 ]
 AUTH_USER_MODEL = 'catalog.CustomUser'
 
+# Пользователь из сессии берётся из кэша (catalog.backends). Второй
+# ModelBackend не нужен: при неверном пароле он проверял бы хэш ещё раз.
+# Сессии, созданные до подключения кэша, потребуют повторного входа.
+AUTHENTICATION_BACKENDS = [
+    'catalog.backends.CachedModelBackend',
+]
+USER_CACHE_TIMEOUT = 300
+
 MIDDLEWARE = [
+    'catalog.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'catalog.middleware.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -43,7 +54,8 @@ ROOT_URLCONF = 'locallibrary.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендеринга для /metrics/
+        'BACKEND': 'catalog.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -70,6 +82,33 @@ DATABASES = {
 }
 
 
+# Cache
+# По умолчанию — кэш в памяти процесса. При нескольких процессах задайте
+# DJANGO_CACHE_BACKEND=file, чтобы они делили кэш через файловую систему;
+# профиль settings_production задаёт общий кэш сам.
+
+if os.environ.get('DJANGO_CACHE_BACKEND') == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', BASE_DIR / 'cache'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'design-pro',
+        }
+    }
+
+
+# Сессии: чтение из кэша, запись в кэш и в БД. При нескольких процессах
+# кэш должен быть общим (см. Cache выше), иначе выход из
+# аккаунта в одном процессе не увидят остальные.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -105,5 +144,92 @@ USE_TZ = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Выдача изображений заявок после проверки доступа (catalog.media):
+# 'python' — сам Django, 'nginx' — X-Accel-Redirect, 'sendfile' — X-Sendfile
+MEDIA_SERVE_MODE = os.environ.get('DJANGO_MEDIA_SERVE_MODE', 'python')
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+# Отдавать собранную статику самим Django (без nginx): immutable-кэш и .gz/.br
+SERVE_STATIC = os.environ.get('DJANGO_SERVE_STATIC') == '1'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # collectstatic: имена с хэшем, минифицированный CSS, копии .gz/.br
+    'staticfiles': {
+        'BACKEND': 'catalog.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+    # Планы и дизайны заявок: один файл на одинаковое содержимое
+    'request_images': {
+        'BACKEND': 'catalog.storage.ContentAddressedStorage',
+    },
+    # Файлы архивных заявок (archive_requests --cold), при выгоде — в gzip
+    'request_images_cold': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': os.environ.get('DJANGO_COLD_MEDIA_ROOT', BASE_DIR / 'cold_media')},
+    },
+}
+
+# Удалять файл без ссылок сразу после коммита; False — оставить для gc_media
+MEDIA_DELETE_ON_COMMIT = True
+# Куда gc_media --quarantine переносит осиротевшие файлы
+MEDIA_QUARANTINE_ROOT = BASE_DIR / 'media_quarantine'
+
+# Число потоков, генерирующих превью изображений (catalog.images)
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Загрузка планов по частям (catalog.uploads)
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'uploads_tmp'
+CHUNKED_UPLOAD_CHUNK_SIZE = 256 * 1024
+CHUNKED_UPLOAD_MAX_DIMENSION = 10000
+
+# Удаление категорий пачками (catalog.deletion, команда purge_categories):
+# заявок в одной транзакции
+CATEGORY_DELETE_BATCH_SIZE = 500
+
+# Метрики запросов (catalog.metrics): общий каталог для снимков воркеров,
+# порог медленного запроса и токен для сборщика Prometheus
+METRICS_DIR = os.environ.get('DJANGO_METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_SLOW_REQUEST_MS = 500
+METRICS_TOKEN = os.environ.get('DJANGO_METRICS_TOKEN') or None
+
+# Уведомления клиентов о смене статуса (catalog.outbox, send_notifications)
+EMAIL_HOST = os.environ.get('DJANGO_EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('DJANGO_EMAIL_PORT', 25))
+DEFAULT_FROM_EMAIL = os.environ.get('DJANGO_DEFAULT_FROM_EMAIL', 'Design.pro <noreply@design.pro>')
+SITE_URL = os.environ.get('DJANGO_SITE_URL', 'http://localhost:8000')
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_DELAY = 30
+
+# JSON API (catalog.api): токены интеграций «токен:пользователь,...»
+# и размер пачки заявок при потоковой отдаче больших страниц
+API_TOKENS = dict(
+    item.split(':', 1) for item in os.environ.get('DJANGO_API_TOKENS', '').split(',') if ':' in item
+)
+API_STREAM_CHUNK = 100
+
+# Очередь дизайнеров (catalog.queue): срок аренды взятой заявки, секунды
+QUEUE_CLAIM_LEASE = 30 * 60
+
+# Лимиты частоты (catalog.ratelimit): имя URL → {'user' | 'ip' | 'username':
+# (запросов подряд, за сколько секунд корзина наполняется заново)}.
+# Счётчики — в кэше по умолчанию; общими для процессов они будут только
+# с общим кэшем (DJANGO_CACHE_BACKEND=file, memcached, redis).
+RATE_LIMITS = {
+    'create_request': {'user': (10, 600), 'ip': (30, 600)},
+    'upload-start': {'user': (20, 600), 'ip': (60, 600)},
+    'register': {'ip': (5, 3600)},
+    'login': {'ip': (30, 300), 'username': (10, 300)},
+}
+# Заголовок с адресом клиента от своего прокси (например, X-Forwarded-For);
+# без него — REMOTE_ADDR
+RATE_LIMIT_IP_HEADER = os.environ.get('DJANGO_RATE_LIMIT_IP_HEADER') or None
+# Одновременных загрузок на все процессы; 0 — без ограничения
+UPLOAD_CONCURRENCY = int(os.environ.get('DJANGO_UPLOAD_CONCURRENCY', 8))
+UPLOAD_SLOT_TIMEOUT = 120
+UPLOAD_RETRY_AFTER = 5
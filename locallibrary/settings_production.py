@@ -0,0 +1,78 @@
+"""
+Профиль для работы под нагрузкой на SQLite.
+
+    DJANGO_SETTINGS_MODULE=locallibrary.settings_production
+
+- WAL: читатели не блокируют писателя и наоборот;
+- busy_timeout и timeout: при занятой базе соединение ждёт, а не падает
+  с «database is locked»;
+- transaction_mode IMMEDIATE: транзакция сразу берёт блокировку записи,
+  поэтому не бывает взаимных блокировок при повышении чтения до записи;
+- synchronous=NORMAL, mmap_size и cache_size: меньше fsync и чтений с диска;
+- постоянные соединения (CONN_MAX_AGE) вместо нового соединения на каждый запрос;
+- соединение readonly к тому же файлу для представлений чтения
+  (catalog.db.ReadOnlyRouter);
+- общий для всех воркеров кэш: сессии cached_db, пользователи
+  CachedModelBackend, лимиты и слоты загрузок видят одно состояние.
+
+Проверить, что под конкурентной записью нет ошибок блокировки::
+
+    DJANGO_SETTINGS_MODULE=locallibrary.settings_production python manage.py stress_sqlite
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+SQLITE_TIMEOUT = 20  # секунд
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('DJANGO_DB_PATH', BASE_DIR / 'db.sqlite3'),
+        # Под ASGI потоки sync_to_async не переиспользуются — там задайте 0
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': SQLITE_TIMEOUT,
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+}
+DATABASES['readonly'] = {
+    **DATABASES['default'],
+    'OPTIONS': {'timeout': SQLITE_TIMEOUT},
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_READ_ALIAS = 'readonly'
+DATABASE_ROUTERS = ['catalog.db.ReadOnlyRouter']
+
+# Memcached (DJANGO_MEMCACHED_LOCATION=127.0.0.1:11211) — атомарный
+# cache.add для слотов загрузок; без него — файловый кэш на диске хоста
+if os.environ.get('DJANGO_MEMCACHED_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': os.environ['DJANGO_MEMCACHED_LOCATION'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', BASE_DIR / 'cache'),
+            # Сессии и корзины лимитов не должны вытесняться раньше срока
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': SQLITE_TIMEOUT * 1000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # в КиБ: 64 МБ на соединение
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
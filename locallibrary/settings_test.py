@@ -0,0 +1,21 @@
+"""
+Настройки для тестов и замеров:
+
+    python manage.py test --settings=locallibrary.settings_test
+    python manage.py run_benchmarks --settings=locallibrary.settings_test
+
+Миграции в репозитории не хранятся — тестовая база создаётся прямо по
+моделям.
+"""
+from .settings import *  # noqa: F401,F403
+
+MIGRATION_MODULES = {app: None for app in ('admin', 'auth', 'contenttypes', 'sessions', 'catalog')}
+
+# Быстрый хэш паролей: тесты создают и логинят много пользователей
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# Без отпечатков: тесты не запускают collectstatic, манифеста нет
+STORAGES = {
+    **STORAGES,  # noqa: F405
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}